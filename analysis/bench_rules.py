@@ -0,0 +1,83 @@
+
+import time
+import argparse
+import statistics as stats
+import numpy as np
+import pandas as pd
+from insight_engine import run_rules
+
+def synthetic_master(n, seed=0):
+    """Random master_join-shaped frame for timing only (never written anywhere)."""
+    rng = np.random.default_rng(seed)
+    dur = rng.integers(60, 3600, n)
+    return pd.DataFrame({
+        'videoId': [f'v{i:07d}' for i in range(n)],
+        'title': [f'video {i}' for i in range(n)],
+        'publishedAt': pd.Timestamp('2015-01-01', tz='UTC') + pd.to_timedelta(rng.integers(0, 10 * 365 * 86400, n), unit='s'),
+        'viewCount': rng.lognormal(8, 2, n).round(),
+        'clickThroughRate': rng.beta(2, 30, n) * 100,
+        'averageViewDuration': dur * rng.beta(2, 4, n),
+        'durationSec': dur,
+        'description': np.where(rng.random(n) < 0.2, 'short', 'a much longer description ' * 4),
+    })
+
+def legacy_heuristics(df):
+    """The previous iterrows/copy/re-sort implementation, kept here for timing and parity only."""
+    def median(series):
+        s = [x for x in series if pd.notna(x)]
+        return stats.median(s) if s else None
+
+    def top_k(d, col, k=5, asc=False):
+        if col not in d.columns:
+            return pd.DataFrame()
+        return d.dropna(subset=[col]).sort_values(col, ascending=asc).head(k)
+
+    insights, ids = [], []
+    ctr_med, avd_med = median(df['clickThroughRate']), median(df['averageViewDuration'])
+    keepers = df[(df['clickThroughRate'] < ctr_med) & (df['averageViewDuration'] >= avd_med)]
+    if not keepers.empty:
+        insights.append('packaging')
+        ids += [r.get('videoId') for _, r in top_k(keepers, 'averageViewDuration').iterrows()]
+    cold = df[df['averageViewDuration'] < df['durationSec'] * 0.25]
+    if not cold.empty:
+        insights.append('cold')
+        ids += [r.get('videoId') for _, r in top_k(cold, 'averageViewDuration', asc=True).iterrows()]
+    df2 = df.copy()
+    df2['publishedAt'] = pd.to_datetime(df2['publishedAt'])
+    ev = df2.sort_values('publishedAt').tail(200)
+    hot = ev[ev['viewCount'] > ev['viewCount'].median()]
+    if not hot.empty:
+        insights.append('evergreen')
+        ids += [r.get('videoId') for _, r in top_k(hot, 'viewCount').iterrows()]
+    thin = df[df['description'].fillna('').str.len() < 60]
+    if not thin.empty:
+        insights.append('thin')
+        ids += [r.get('videoId') for _, r in top_k(thin, 'viewCount').iterrows()]
+    return insights, ids
+
+def bench(fn, df, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(df)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmark the insight rule engine.')
+    ap.add_argument('--rows', type=int, default=100_000)
+    ap.add_argument('--repeat', type=int, default=5)
+    args = ap.parse_args()
+    df = synthetic_master(args.rows)
+    t_new, (insights, actions, timings) = bench(run_rules, df, args.repeat)
+    t_old, (_, old_ids) = bench(legacy_heuristics, df, args.repeat)
+    print(f'{args.rows:,} rows, best of {args.repeat}')
+    print(f'  rule engine : {t_new * 1000:8.1f} ms')
+    print(f'  legacy      : {t_old * 1000:8.1f} ms  ({t_old / t_new:.1f}x)')
+    for name, sec in timings.items():
+        print(f'    {name:<18} {sec * 1000:8.2f} ms')
+    # exact ties may legitimately order differently; the synthetic scores are continuous
+    print('  same videos surfaced:', [a['videoId'] for a in actions] == old_ids)
+
+if __name__ == '__main__':
+    main()
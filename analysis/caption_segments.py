@@ -0,0 +1,166 @@
+
+import os
+import re
+import json
+import hashlib
+import pathlib
+import pandas as pd
+from dotenv import load_dotenv
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+SEGMENTS = PROC / 'caption_segments.parquet'
+STATE = PROC / 'caption_segments_state.json'
+COLUMNS = ['videoId', 'lang', 'seg_idx', 'start_s', 'end_s', 'text']
+
+_TS = r'(\d+):(\d{1,2}):(\d{1,2})(?:[,.](\d{1,3}))?'
+TIMING = re.compile(_TS + r'\s*-->\s*' + _TS)
+
+def _secs(h, m, s, ms):
+    return int(h) * 3600 + int(m) * 60 + int(s) + (int(ms.ljust(3, '0')) / 1000 if ms else 0.0)
+
+def iter_srt(path, stats=None):
+    """Stream (start_s, end_s, text) cues from an SRT file, one block at a time.
+
+    Blocks without a parsable timing line or without text are counted in
+    stats['malformed'] instead of being silently dropped.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault('malformed', 0)
+    timing, text = None, []
+
+    def emit():
+        if timing and text:
+            return (timing[0], timing[1], ' '.join(text))
+        stats['malformed'] += 1
+        return None
+
+    with open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        started = False
+        for line in f:
+            line = line.strip()
+            if not line:
+                if started:
+                    cue = emit()
+                    if cue:
+                        yield cue
+                timing, text, started = None, [], False
+                continue
+            started = True
+            if timing is None:
+                m = TIMING.search(line)
+                if m:
+                    g = m.groups()
+                    timing = (_secs(*g[:4]), _secs(*g[4:]))
+                # anything before the timing line is the cue number
+                continue
+            text.append(line)
+        if started:
+            cue = emit()
+            if cue:
+                yield cue
+
+def parse_track(vid, lang, path, stats=None):
+    cues = list(iter_srt(path, stats))
+    return pd.DataFrame({
+        'videoId': vid,
+        'lang': lang,
+        'seg_idx': range(len(cues)),
+        'start_s': [c[0] for c in cues],
+        'end_s': [c[1] for c in cues],
+        'text': [c[2] for c in cues],
+    }, columns=COLUMNS)
+
+def _file_sha(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def ingest(cap_index=None):
+    """Incrementally refresh caption_segments.parquet from captions_index.parquet.
+
+    Only tracks whose file content hash changed are re-parsed; rows for unchanged
+    tracks are carried over and tracks that disappeared are dropped.
+    """
+    if cap_index is None:
+        cap_index = pd.read_parquet(PROC / 'captions_index.parquet')
+    tracks = cap_index.dropna(subset=['file'])
+    tracks = tracks[tracks['file'].map(os.path.exists)]
+    tracks = tracks.assign(lang=tracks['lang'].fillna('und')).drop_duplicates(['videoId', 'lang'])
+    state = json.loads(STATE.read_text()) if STATE.exists() and SEGMENTS.exists() else {}
+    old = pd.read_parquet(SEGMENTS) if state else pd.DataFrame(columns=COLUMNS)
+
+    new_state, fresh, keep_keys = {}, [], set()
+    stats = {'malformed': 0}
+    for vid, lang, path, sha in zip(tracks['videoId'], tracks['lang'], tracks['file'],
+                                    tracks['sha256'] if 'sha256' in tracks.columns else [None] * len(tracks)):
+        key = f'{vid}|{lang}'
+        sha = sha if isinstance(sha, str) else _file_sha(path)
+        new_state[key] = sha
+        if state.get(key) == sha:
+            keep_keys.add(key)
+        else:
+            fresh.append(parse_track(vid, lang, path, stats))
+
+    if not old.empty:
+        old = old[(old['videoId'] + '|' + old['lang']).isin(keep_keys)]
+    out = pd.concat([old] + fresh, ignore_index=True) if fresh else old
+    # keep captions_index track order so the "primary" (first) track per video is stable
+    rank = {k: i for i, k in enumerate(new_state)}
+    out = out.assign(_r=(out['videoId'] + '|' + out['lang']).map(rank)).sort_values(['_r', 'seg_idx'])
+    out = out.drop(columns='_r').reset_index(drop=True)
+    out = out.astype({'seg_idx': 'int32', 'start_s': 'float64', 'end_s': 'float64'})
+    out.to_parquet(SEGMENTS, index=False)
+    STATE.write_text(json.dumps(new_state))
+    return {'parsed': len(fresh), 'kept': len(keep_keys), 'segments': len(out), **stats}
+
+def load_segments(columns=None, primary=True, filters=None):
+    """Read the segment table; with `primary`, keep one caption track per video."""
+    cols = None if columns is None else sorted(set(columns) | ({'videoId', 'lang'} if primary else set()), key=COLUMNS.index)
+    if not SEGMENTS.exists():
+        return pd.DataFrame(columns=cols or COLUMNS)
+    seg = pd.read_parquet(SEGMENTS, columns=cols, filters=filters)
+    if primary and not seg.empty:
+        seg = seg[seg['lang'] == seg.groupby('videoId')['lang'].transform('first')]
+    return seg[columns] if columns is not None else seg
+
+def transcripts(seg):
+    """videoId → full transcript text (segments in order)."""
+    if seg.empty:
+        return pd.Series(dtype=object)
+    return seg.sort_values(['videoId', 'seg_idx']).groupby('videoId')['text'].agg(' '.join)
+
+def iter_windows(seg, max_words=150, overlap_words=40):
+    """Overlapping, segment-aligned text windows for one video's segments.
+
+    Yields dicts (win_idx, seg_lo, seg_hi, start_s, end_s, text). Windows grow a
+    whole segment at a time up to ~max_words words; the next window restarts far
+    enough back to share ~overlap_words words with the previous one.
+    """
+    seg = seg.sort_values('seg_idx')
+    texts = seg['text'].tolist()
+    starts, ends, idx = seg['start_s'].tolist(), seg['end_s'].tolist(), seg['seg_idx'].tolist()
+    words = [len(t.split()) for t in texts]
+    n, lo, w = len(texts), 0, 0
+    while lo < n:
+        hi, count = lo, 0
+        while hi < n and (count == 0 or count + words[hi] <= max_words):
+            count += words[hi]
+            hi += 1
+        yield {'win_idx': w, 'seg_lo': idx[lo], 'seg_hi': idx[hi - 1], 'start_s': starts[lo],
+               'end_s': ends[hi - 1], 'text': ' '.join(texts[lo:hi])}
+        w += 1
+        if hi >= n:
+            break
+        back, nxt = 0, hi
+        while nxt - 1 > lo and back + words[nxt - 1] <= overlap_words:
+            nxt -= 1
+            back += words[nxt]
+        lo = nxt
+
+if __name__ == '__main__':
+    res = ingest()
+    print('Saved →', SEGMENTS, res)
@@ -0,0 +1,163 @@
+
+import io
+import os
+import json
+import hashlib
+import pathlib
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+OUT = PROC / 'chart_aggregates.json'
+BINS = int(os.getenv('CHART_BINS', '10'))
+MAX_POINTS = int(os.getenv('CHART_MAX_POINTS', '2000'))
+
+# every file load_frames() may read, so the fingerprint changes whichever one it used
+SOURCES = {'master': 'master_join.parquet', 'videos': 'videos.parquet',
+           'analytics': 'analytics_365d.parquet', 'thumbs': 'thumbnail_features.parquet'}
+COLUMNS = {'master': ['viewCount', 'likeCount', 'commentCount'], 'thumbs': ['sharpness', 'text_density']}
+
+# Dashboard charts: what each is drawn from and how it is labelled
+CHARTS = {
+    'views_hist': dict(kind='hist', source='master', col='viewCount',
+                       title='Video Views Distribution', xlabel='Views', ylabel='Frequency'),
+    'likes_vs_comments': dict(kind='scatter', source='master', x='likeCount', y='commentCount',
+                              title='Likes vs Comments', xlabel='Likes', ylabel='Comments'),
+    'sharpness_hist': dict(kind='hist', source='thumbs', col='sharpness',
+                           title='Thumbnail Sharpness Distribution', xlabel='Sharpness', ylabel='Frequency'),
+    'text_density_hist': dict(kind='hist', source='thumbs', col='text_density',
+                              title='Thumbnail Text Density Distribution', xlabel='Text Density', ylabel='Frequency'),
+}
+
+def file_digest(path):
+    """blake2b-128 of a file's bytes (same digest the dashboard uses), None if missing."""
+    try:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()
+    except OSError:
+        return None
+
+def histogram(values, bins=BINS):
+    v = pd.to_numeric(pd.Series(values), errors='coerce').dropna().to_numpy(dtype=float)
+    if not len(v):
+        return None
+    counts, edges = np.histogram(v, bins=min(bins, len(v)))
+    return {'edges': edges.tolist(), 'counts': counts.tolist(), 'n': int(len(v))}
+
+def downsample(x, y, max_points=MAX_POINTS, grid=200):
+    """At most `max_points` points that keep the scatter's shape and its outliers.
+
+    Points are snapped to a grid x grid lattice and one is kept per occupied cell
+    (sparse regions and extremes survive, dense clusters thin out); if that is
+    still too many, a fixed-seed sample of the cells is taken.
+    """
+    xy = pd.DataFrame({'x': pd.to_numeric(pd.Series(x), errors='coerce'),
+                       'y': pd.to_numeric(pd.Series(y), errors='coerce')}).dropna()
+    n = len(xy)
+    if not n:
+        return None
+    if n > max_points:
+        a, b = xy['x'].to_numpy(), xy['y'].to_numpy()
+        def cell(v):
+            lo, hi = v.min(), v.max()
+            return np.zeros(len(v), np.int64) if hi <= lo else ((v - lo) / (hi - lo) * (grid - 1)).astype(np.int64)
+        keep = ~pd.Series(cell(a) * grid + cell(b)).duplicated().to_numpy()
+        xy = xy[keep]
+        if len(xy) > max_points:
+            xy = xy.sample(max_points, random_state=0).sort_index()
+    return {'x': xy['x'].tolist(), 'y': xy['y'].tolist(), 'n': int(n), 'shown': int(len(xy))}
+
+def build(frames, fingerprint=None):
+    """Chart-ready aggregates from {'master': df, 'thumbs': df}; charts without data are left out."""
+    charts = {}
+    for name, spec in CHARTS.items():
+        df = frames.get(spec['source'])
+        if df is None or df.empty:
+            continue
+        if spec['kind'] == 'hist' and spec['col'] in df.columns:
+            data = histogram(df[spec['col']])
+        elif spec['kind'] == 'scatter' and {spec['x'], spec['y']} <= set(df.columns):
+            data = downsample(df[spec['x']], df[spec['y']])
+        else:
+            data = None
+        if data:
+            charts[name] = {**spec, **data}
+    return {'fingerprint': fingerprint, 'charts': charts}
+
+def _read(path, columns):
+    if not path.exists():
+        return None
+    have = set(pq.read_schema(path).names)
+    return pd.read_parquet(path, columns=[c for c in columns if c in have])
+
+def load_frames(proc=PROC):
+    """{'master': per-video metrics, 'thumbs': thumbnail features}, read column-limited.
+
+    The per-video table is master_join, else videos joined with analytics — the
+    same fallback the dashboard uses — so the pipeline and the dashboard always
+    chart the same data.
+    """
+    proc = pathlib.Path(proc)
+    want = ['videoId'] + COLUMNS['master']
+    master = _read(proc / SOURCES['master'], want)
+    if master is None:
+        master = _read(proc / SOURCES['videos'], want)
+        analytics = _read(proc / SOURCES['analytics'], want)
+        if master is not None and analytics is not None and 'videoId' in master and 'videoId' in analytics:
+            extra = ['videoId'] + [c for c in analytics.columns if c not in master.columns]
+            if len(extra) > 1:
+                master = master.merge(analytics[extra], on='videoId', how='left')
+    frames = {'master': master, 'thumbs': _read(proc / SOURCES['thumbs'], COLUMNS['thumbs'])}
+    return {k: v for k, v in frames.items() if v is not None}
+
+def fingerprint(digests):
+    spec = json.dumps({'charts': CHARTS, 'bins': BINS, 'max_points': MAX_POINTS, 'sources': digests}, sort_keys=True)
+    return hashlib.blake2b(spec.encode(), digest_size=16).hexdigest()
+
+def render(chart):
+    """PNG bytes for one aggregate; uses Figure directly so it is safe off the main thread."""
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(8, 6))
+    ax = fig.subplots()
+    if chart['kind'] == 'hist':
+        edges = np.asarray(chart['edges'])
+        ax.bar(edges[:-1], chart['counts'], width=np.diff(edges), align='edge', alpha=0.7, edgecolor='black')
+    else:
+        ax.scatter(chart['x'], chart['y'], alpha=0.6, s=50)
+        if chart['shown'] < chart['n']:
+            ax.text(0.99, 0.01, f"{chart['shown']:,} of {chart['n']:,} points", transform=ax.transAxes,
+                    ha='right', va='bottom', fontsize=8, alpha=0.7)
+    ax.set_xlabel(chart['xlabel'])
+    ax.set_ylabel(chart['ylabel'])
+    ax.set_title(chart['title'])
+    ax.grid(True, alpha=0.2)
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=100, bbox_inches='tight')
+    return buf.getvalue()
+
+def main():
+    digests = {k: file_digest(PROC / v) for k, v in SOURCES.items()}
+    fp = fingerprint(digests)
+    if OUT.exists():
+        try:
+            if json.loads(OUT.read_text(encoding='utf-8')).get('fingerprint') == fp:
+                print('Chart aggregates up to date ->', OUT)
+                return
+        except Exception:
+            pass
+    out = build(load_frames(), fp)
+    out['sources'] = digests
+    tmp = OUT.with_name(f'.{OUT.name}.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(out), encoding='utf-8')
+    os.replace(tmp, OUT)
+    print('Wrote chart aggregates ->', OUT, sorted(out['charts']))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+
+import os
+import time
+import pickle
+import pathlib
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from sklearn.cluster import MiniBatchKMeans
+from embeddings import EmbeddingStore
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+REPORTS = ROOT / os.getenv('REPORTS_DIR', 'reports')
+REPORTS.mkdir(parents=True, exist_ok=True)
+MODEL_PATH = PROC / 'comment_topics_model.pkl'
+# one Parquet part per chunk: (key, videoId, topic, distance, likeCount) for the comments labelled then
+LABELS_DIR = PROC / 'comment_topics_labels'
+LEGACY_SEEN = PROC / 'comment_topics_seen.parquet'  # pre-labels runs: keys already folded into the model
+N_TOPICS = int(os.getenv('COMMENT_TOPICS', '12'))
+# rows per chunk: bounds peak memory (~chunk × 384 floats + text) regardless of table size
+CHUNK = int(os.getenv('COMMENT_CHUNK', '20000'))
+MAX_PARTS = 32  # label parts before they are merged into one
+DUCKDB_MEMORY = os.getenv('COMMENT_DUCKDB_MEMORY', '1GB')
+N_EXAMPLES = 5
+MIN_CHARS = 8
+
+def _lit(path):
+    return "'" + str(path).replace("'", "''") + "'"
+
+def _labels():
+    return f"read_parquet({_lit(LABELS_DIR / '*.parquet')})"
+
+def has_labels():
+    return LABELS_DIR.exists() and any(LABELS_DIR.glob('*.parquet'))
+
+def comments_sql(path):
+    """(videoId, key, text, likeCount) for comments long enough to label.
+
+    Legacy tables have no commentId: the key falls back to a hash of video + text.
+    """
+    names = pq.read_schema(path).names
+    key = "coalesce(nullif(commentId, ''), md5(videoId || '|' || text))" if 'commentId' in names else "md5(videoId || '|' || text)"
+    likes = 'coalesce(likeCount, 0)' if 'likeCount' in names else '0'
+    return (f"SELECT videoId, {key} AS key, text, {likes} AS likeCount FROM read_parquet({_lit(path)}) "
+            f"WHERE length(coalesce(text, '')) >= {MIN_CHARS}")
+
+def connect():
+    """DuckDB with a memory cap: the anti-join and the aggregates spill to disk past it."""
+    tmp = PROC / '.duckdb_tmp'
+    tmp.mkdir(parents=True, exist_ok=True)
+    return duckdb.connect(config={'memory_limit': DUCKDB_MEMORY, 'temp_directory': str(tmp)})
+
+def iter_new(con, path, chunk=CHUNK):
+    """Stream chunks of comments that have no label yet.
+
+    The anti-join runs in DuckDB, so the set of labelled keys never has to sit in
+    Python memory. `fitted` marks keys an older run already folded into the model.
+    """
+    fitted, legacy = 'false', ''
+    if LEGACY_SEEN.exists():
+        fitted = 's.key IS NOT NULL'
+        legacy = f" LEFT JOIN (SELECT DISTINCT key FROM read_parquet({_lit(LEGACY_SEEN)})) s ON s.key = c.key"
+    sql = f"SELECT c.*, {fitted} AS fitted FROM ({comments_sql(path)}) c"
+    if has_labels():
+        sql += f" ANTI JOIN {_labels()} l ON l.key = c.key"
+    for batch in con.execute(sql + legacy).fetch_record_batch(chunk):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+def load_model():
+    if MODEL_PATH.exists():
+        with open(MODEL_PATH, 'rb') as f:
+            return pickle.load(f)
+    return MiniBatchKMeans(n_clusters=N_TOPICS, batch_size=2048, n_init=3, random_state=0)
+
+def save_model(km):
+    tmp = MODEL_PATH.with_suffix('.tmp')
+    with open(tmp, 'wb') as f:
+        pickle.dump(km, f)
+    os.replace(tmp, MODEL_PATH)
+
+def _write_part(df, X, km):
+    labels = km.predict(X)
+    LABELS_DIR.mkdir(parents=True, exist_ok=True)
+    out = LABELS_DIR / f'part-{time.time_ns()}.parquet'
+    tmp = out.with_name('.' + out.name + '.tmp')
+    pq.write_table(pa.table({
+        'key': df['key'].to_numpy(), 'videoId': df['videoId'].to_numpy(),
+        'topic': labels.astype(np.int32),
+        'distance': np.linalg.norm(X - km.cluster_centers_[labels], axis=1).astype(np.float32),
+        'likeCount': df['likeCount'].fillna(0).astype(np.int64).to_numpy()}), tmp)
+    os.replace(tmp, out)
+
+def label_new(con, path, store, km):
+    """Partial-fit the model on each chunk of unlabelled comments, then label the chunk.
+
+    Each chunk is written as its own label part, so memory stays at one chunk
+    however many comments are new. Comment vectors are computed transiently and
+    never added to the embedding store. Returns (fitted, labelled).
+    """
+    fitted = labelled = 0
+    pending = []
+    for df in iter_new(con, path):
+        X = store.embed(df['text'].tolist())
+        fit = ~df['fitted'].to_numpy(dtype=bool)
+        fitted += int(fit.sum())
+        if not hasattr(km, 'cluster_centers_'):
+            # MiniBatchKMeans needs >= n_clusters rows in the first partial_fit
+            pending.append((df, X, fit))
+            if sum(int(f.sum()) for _, _, f in pending) < km.n_clusters:
+                continue
+            df = pd.concat([d for d, _, _ in pending], ignore_index=True)
+            X = np.vstack([x for _, x, _ in pending])
+            fit = np.concatenate([f for _, _, f in pending])
+            pending = []
+        if fit.any():
+            km.partial_fit(X[fit])
+            # the model goes first: a crash before the part is written only means
+            # this chunk is fitted again next run, never labelled without being fitted
+            save_model(km)
+        _write_part(df, X, km)
+        labelled += len(df)
+    return fitted, labelled
+
+def compact_labels(con, max_parts=MAX_PARTS):
+    parts = sorted(LABELS_DIR.glob('*.parquet'))
+    if len(parts) <= max_parts:
+        return
+    out = LABELS_DIR / f'part-{time.time_ns()}.parquet'
+    tmp = out.with_name('.' + out.name + '.tmp')
+    con.execute(f"COPY (SELECT * FROM {_labels()}) TO {_lit(tmp)} (FORMAT parquet)")
+    os.replace(tmp, out)
+    for p in parts:
+        p.unlink()
+
+def aggregate(con, path, n_examples=N_EXAMPLES):
+    """Per-video topic counts and, per topic, the comments closest to its centroid.
+
+    Computed from the stored labels inside DuckDB; labels of comments no longer in
+    comments.parquet are ignored.
+    """
+    live = f"SELECT l.* FROM {_labels()} l SEMI JOIN ({comments_sql(path)}) c USING (key)"
+    dist_df = con.execute(
+        f"SELECT videoId, topic, COUNT(*) AS n, COUNT(*) / SUM(COUNT(*)) OVER (PARTITION BY videoId) AS share "
+        f"FROM ({live}) GROUP BY videoId, topic ORDER BY videoId, topic").df()
+    examples = con.execute(
+        f"SELECT e.topic, e.rank, e.videoId, c.text, e.likeCount, e.distance FROM ("
+        f"  SELECT key, videoId, topic, likeCount, distance, "
+        f"         row_number() OVER (PARTITION BY topic ORDER BY distance, key) - 1 AS rank "
+        f"  FROM ({live}) QUALIFY rank < {int(n_examples)}) e "
+        f"JOIN ({comments_sql(path)}) c USING (key) ORDER BY e.topic, e.rank").df()
+    return dist_df, examples
+
+def main():
+    path = PROC / 'comments.parquet'
+    if not path.exists():
+        raise SystemExit('comments.parquet missing – run scripts/fetch_comments.py first.')
+    store = EmbeddingStore()
+    km = load_model()
+    con = connect()
+    n_new, n_labelled = label_new(con, path, store, km)
+    if not hasattr(km, 'cluster_centers_'):
+        raise SystemExit('Not enough comments to fit topics yet.')
+    if LEGACY_SEEN.exists() and has_labels():
+        LEGACY_SEEN.unlink()  # every legacy key now has a label
+    compact_labels(con)
+    dist_df, examples = aggregate(con, path)
+    dist_df.to_parquet(PROC / 'comment_topics.parquet', index=False)
+    examples.to_csv(REPORTS / 'comment_topic_examples.csv', index=False)
+    print(f'{n_new} new comments folded into {km.n_clusters} topics, {n_labelled} labelled →',
+          PROC / 'comment_topics.parquet', 'and', REPORTS / 'comment_topic_examples.csv')
+
+if __name__ == '__main__':
+    main()
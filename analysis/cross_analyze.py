@@ -1,16 +1,25 @@
 
 import os
 import pathlib
+import argparse
 import pandas as pd
 import numpy as np
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer, util
+from embeddings import EmbeddingStore, rowwise_cosine, text_hash
+from caption_segments import load_segments, transcripts, iter_windows
+import vector_index
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 load_dotenv(ROOT / '.env')
 PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
 REPORTS = ROOT / os.getenv('REPORTS_DIR', 'reports')
 REPORTS.mkdir(parents=True, exist_ok=True)
+EMBED_MODE = os.getenv('EMBED_MODE', 'windowed')
+WINDOW_WORDS = int(os.getenv('WINDOW_WORDS', '150'))
+WINDOW_OVERLAP = int(os.getenv('WINDOW_OVERLAP', '40'))
+WINDOW_BATCH = int(os.getenv('WINDOW_BATCH', '512'))
+SIM_COLS = ['title_caption_sim', 'title_window_sim_mean', 'title_window_sim_max']
+WINDOW_COLS = ['videoId', 'win_idx', 'seg_lo', 'seg_hi', 'start_s', 'end_s', 'text_hash', 'sim']
 
 def load_data():
     # Prefer unified master_join if available
@@ -38,61 +47,85 @@ def load_data():
         comments = pd.DataFrame(columns=['videoId','text'])
     return df, comments
 
-def srt_to_segments(srt_path):
-    # very simple srt parser
-    segs = []
-    if not srt_path or not os.path.exists(srt_path):
-        return segs
-    with open(srt_path, 'r', encoding='utf-8', errors='ignore') as f:
-        block = []
-        for line in f:
-            line=line.strip()
-            if not line:
-                if block:
-                    try:
-                        # block: [idx, time, text...]
-                        times = block[1]
-                        text = ' '.join(block[2:])
-                        start = times.split('-->')[0].strip()
-                        h,m,s = start.split(':')
-                        t = int(float(h))*3600 + int(m)*60 + float(s.replace(',','.'))
-                        segs.append((t, text))
-                    except Exception:
-                        pass
-                    block = []
-            else:
-                block.append(line)
-    return segs
+def title_window_scores(df, titles, store, batch=WINDOW_BATCH):
+    """Score every transcript window against its video's title.
 
-def main():
+    Windows are streamed through the embedding cache `batch` at a time, so memory
+    stays bounded however long a video is. Returns the per-window table (vectors
+    stay in the store, referenced by text_hash) and per-video mean/max similarity.
+    """
+    have = [(vid, t) for vid, t in zip(df['videoId'], titles) if t]
+    if not have:
+        return pd.DataFrame(columns=WINDOW_COLS), pd.DataFrame(columns=['mean', 'max'])
+    T = store.encode([t for _, t in have], save=False)
+    title_vec = {vid: T[i] for i, (vid, _) in enumerate(have)}
+    seg = load_segments(['videoId', 'seg_idx', 'start_s', 'end_s', 'text'])
+    seg = seg[seg['videoId'].isin(title_vec)]
+    rows, buf = [], []
+
+    def flush():
+        V = store.encode([w['text'] for w in buf], save=False)
+        sims = rowwise_cosine(V, np.stack([title_vec[w['videoId']] for w in buf]))
+        for w, sim in zip(buf, sims):
+            text = w.pop('text')
+            rows.append({**w, 'text_hash': text_hash(text), 'sim': float(sim)})
+        buf.clear()
+
+    for vid, g in seg.groupby('videoId', sort=False):
+        for w in iter_windows(g, WINDOW_WORDS, WINDOW_OVERLAP):
+            buf.append({'videoId': vid, **w})
+            if len(buf) >= batch:
+                flush()
+    if buf:
+        flush()
+    store.save()
+    win = pd.DataFrame(rows, columns=WINDOW_COLS)
+    pooled = win.groupby('videoId')['sim'].agg(['mean', 'max']) if not win.empty else pd.DataFrame(columns=['mean', 'max'])
+    return win, pooled
+
+def truncated_title_scores(df, titles, store):
+    # Title ↔ caption alignment score (cosine sim) on the first 5,000 transcript chars
+    texts = transcripts(load_segments(['videoId', 'seg_idx', 'text']))
+    cap_texts = df['videoId'].map(texts).fillna('').str[:5000].tolist()
+    has_both = np.array([bool(t) and bool(c) for t, c in zip(titles, cap_texts)], dtype=bool)
+    sims = np.full(len(df), np.nan)
+    if has_both.any():
+        pick = np.flatnonzero(has_both)
+        T = store.encode([titles[i] for i in pick])
+        C = store.encode([cap_texts[i] for i in pick])
+        sims[pick] = rowwise_cosine(T, C)
+    return sims
+
+def main(mode=EMBED_MODE):
     df, comments = load_data()
-    # Embedding model (local, CPU-friendly)
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    # Title ↔ caption alignment score (cosine sim)
-    cap_index = pd.read_parquet(PROC / 'captions_index.parquet') if (PROC / 'captions_index.parquet').exists() else pd.DataFrame()
-    title_scores = []
-    for _, row in df.iterrows():
-        title = row.get('title','') or ''
-        vid = row['videoId']
-        segs = []
-        cap_row = cap_index[cap_index['videoId']==vid].head(1)
-        if not cap_row.empty and isinstance(cap_row.iloc[0]['file'], str):
-            segs = srt_to_segments(cap_row.iloc[0]['file'])
-        cap_text = ' '.join([t for _, t in segs])[:5000]
-        if title and cap_text:
-            emb = model.encode([title, cap_text], convert_to_tensor=True)
-            sim = float(util.cos_sim(emb[0], emb[1]).cpu().numpy())
-        else:
-            sim = np.nan
-        title_scores.append({'videoId': vid, 'title_caption_sim': sim})
-    simdf = pd.DataFrame(title_scores)
-    out = df.merge(simdf, on='videoId', how='left')
+    # Embedding cache (local, CPU-friendly model; only missing texts are encoded)
+    store = EmbeddingStore()
+    titles = df['title'].fillna('').astype(str).tolist() if 'title' in df.columns else [''] * len(df)
+    # master_join may already carry last run's scores; replace them rather than merge (_x/_y)
+    out = df.drop(columns=SIM_COLS, errors='ignore')
+    win = None
+    if mode == 'windowed':
+        # Title ↔ every transcript window; per-timestamp relevance → title_windows.parquet
+        win, pooled = title_window_scores(df, titles, store)
+        win.to_parquet(PROC / 'title_windows.parquet', index=False)
+        out['title_window_sim_mean'] = out['videoId'].map(pooled['mean'])
+        out['title_window_sim_max'] = out['videoId'].map(pooled['max'])
+        out['title_caption_sim'] = out['title_window_sim_mean']
+    else:
+        out['title_caption_sim'] = truncated_title_scores(df, titles, store)
+    # per-video vectors (title + mean transcript window) for "similar videos" lookups
+    index, (upd, new) = vector_index.refresh(out['videoId'].tolist(), titles, store, win)
+    store.save()
     # Correlate with CTR and avg view duration
-    cols = [c for c in ['clickThroughRate','averageViewDuration','title_caption_sim'] if c in out.columns]
+    cols = [c for c in ['clickThroughRate','averageViewDuration'] + SIM_COLS if c in out.columns]
     corr = out[cols].corr(numeric_only=True) if cols else pd.DataFrame()
     corr.to_csv(REPORTS / 'correlations.csv')
     out.to_parquet(PROC / 'master_join.parquet', index=False)
-    print('Wrote:', REPORTS / 'correlations.csv', 'and', PROC / 'master_join.parquet')
+    print('Wrote:', REPORTS / 'correlations.csv', 'and', PROC / 'master_join.parquet',
+          f'(vector index: {new} added, {upd} updated)')
 
 if __name__ == '__main__':
-    main()
+    ap = argparse.ArgumentParser(description='Title/transcript alignment and correlations.')
+    ap.add_argument('--mode', choices=['windowed', 'truncated'], default=EMBED_MODE,
+                    help='windowed: full transcript in overlapping windows; truncated: first 5,000 chars')
+    main(ap.parse_args().mode)
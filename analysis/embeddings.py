@@ -0,0 +1,171 @@
+
+import os
+import re
+import json
+import hashlib
+import pathlib
+import numpy as np
+import pandas as pd
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking
+    fcntl = None
+from dotenv import load_dotenv
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+EMB_DIR = PROC / 'embeddings'
+MODEL_NAME = os.getenv('EMBED_MODEL', 'all-MiniLM-L6-v2')
+BATCH_SIZE = int(os.getenv('EMBED_BATCH', '64'))
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+class EmbeddingStore:
+    """Embedding cache keyed on (model name, text hash).
+
+    Vectors live in an append-only float32 file (`<model>.f32`, memory-mapped on
+    read) and `<model>.index.parquet` maps text hash → row. Texts already in the
+    store cost nothing; the model is only loaded when something is missing.
+
+    Several pipeline stages share one store and may run at once, so writers take
+    an exclusive lock on `<model>.lock` from the first append until save(), and
+    reload the index on acquiring it so rows added by another process are kept.
+    """
+    def __init__(self, model_name=MODEL_NAME, root=EMB_DIR):
+        self.model_name = model_name
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.vec_path = self.root / f'{slug}.f32'
+        self.idx_path = self.root / f'{slug}.index.parquet'
+        self.meta_path = self.root / f'{slug}.meta.json'
+        self.lock_path = self.root / f'{slug}.lock'
+        self._model = None
+        self._lock = None
+        self.dim = None
+        self.index = {}
+        self._acquire()
+        self._release()
+
+    def _acquire(self):
+        """Take the writer lock (no-op if held) and reload the index under it."""
+        if self._lock is not None:
+            return
+        self._lock = open(self.lock_path, 'a+')
+        if fcntl is not None:
+            fcntl.flock(self._lock, fcntl.LOCK_EX)
+        self._load()
+
+    def _release(self):
+        if self._lock is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._lock, fcntl.LOCK_UN)
+        self._lock.close()
+        self._lock = None
+
+    def _load(self):
+        if self.meta_path.exists() and self.idx_path.exists():
+            self.dim = json.loads(self.meta_path.read_text())['dim']
+            idx = pd.read_parquet(self.idx_path)
+            self.index = dict(zip(idx['hash'], idx['row']))
+            # drop vectors appended by a run that died before writing the index
+            want = len(self.index) * self.dim * 4
+            if self.vec_path.exists() and self.vec_path.stat().st_size > want:
+                with open(self.vec_path, 'r+b') as f:
+                    f.truncate(want)
+
+    def __len__(self):
+        return len(self.index)
+
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def vectors(self):
+        if not self.index:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vec_path, dtype=np.float32, mode='r', shape=(len(self.index), self.dim))
+
+    def rows(self, texts):
+        return np.array([self.index[text_hash(t)] for t in texts], dtype=np.int64)
+
+    def _append(self, hashes, vecs):
+        self._acquire()
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        if self.dim is None:
+            self.dim = int(vecs.shape[1])
+            self.meta_path.write_text(json.dumps({'model': self.model_name, 'dim': self.dim}))
+        with open(self.vec_path, 'ab') as f:
+            f.write(vecs.tobytes())
+        start = len(self.index)
+        for i, h in enumerate(hashes):
+            self.index[h] = start + i
+
+    def save(self):
+        """Write the index and release the writer lock; nothing to do if nothing was appended."""
+        if self._lock is None:
+            return
+        try:
+            idx = pd.DataFrame({'hash': list(self.index.keys()), 'row': list(self.index.values())})
+            tmp = self.idx_path.with_suffix('.tmp')
+            idx.to_parquet(tmp, index=False)
+            os.replace(tmp, self.idx_path)
+        finally:
+            self._release()
+
+    def ensure(self, texts, batch_size=BATCH_SIZE, flush_every=4096, save=True):
+        """Embed texts not yet in the store; returns how many were computed.
+
+        Missing texts are sorted by length so each batch pads to similar lengths.
+        Streaming callers pass save=False and call save() once at the end.
+        """
+        hashes = {text_hash(t): t for t in texts}
+        missing = {h: t for h, t in hashes.items() if h not in self.index}
+        if not missing:
+            return 0
+        # another process may have embedded some of these since we last looked
+        self._acquire()
+        missing = {h: t for h, t in missing.items() if h not in self.index}
+        if not missing:
+            if save:
+                self.save()
+            return 0
+        order = sorted(missing.items(), key=lambda kv: len(kv[1]))
+        for i in range(0, len(order), flush_every):
+            part = order[i:i+flush_every]
+            vecs = self.model().encode([t for _, t in part], batch_size=batch_size,
+                                       normalize_embeddings=True, convert_to_numpy=True,
+                                       show_progress_bar=False)
+            self._append([h for h, _ in part], vecs)
+        if save:
+            self.save()
+        return len(missing)
+
+    def embed(self, texts, batch_size=BATCH_SIZE):
+        """Unit-normalised vectors for `texts` without adding them to the store.
+
+        For high-volume, read-once texts (comments) that would only grow the shared
+        index and vector file.
+        """
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return self.model().encode(texts, batch_size=batch_size, normalize_embeddings=True,
+                                   convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+
+    def encode(self, texts, batch_size=BATCH_SIZE, save=True):
+        """Unit-normalised vectors for `texts`, in order, as an (n, dim) float32 array."""
+        texts = list(texts)
+        self.ensure(texts, batch_size, save=save)
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.asarray(self.vectors()[self.rows(texts)])
+
+def rowwise_cosine(a, b):
+    # vectors are unit-normalised, so cosine is a row-wise dot product
+    return np.einsum('ij,ij->i', a, b)
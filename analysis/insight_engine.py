@@ -1,7 +1,12 @@
 import os, json, time, math, statistics as stats
 from typing import List, Dict, Any, Tuple
+import numpy as np
 import pandas as pd
 import requests
+try:
+    from llm_client import LLMClient
+except ImportError:  # imported as analysis.insight_engine (dashboard)
+    from analysis.llm_client import LLMClient
 
 def _pct(n, d): 
     try: return (n/d) if d else None
@@ -10,12 +15,6 @@ def _pct(n, d):
 def _na(v, alt=None):
     return v if v is not None else alt
 
-def _median(series):
-    try:
-        s = [x for x in series if pd.notna(x)]
-        return stats.median(s) if s else None
-    except: return None
-
 def _rolling_change(series, window=7):
     # expects daily series; returns pct change last window vs prior window
     if len(series) < window*2: return None
@@ -23,140 +22,243 @@ def _rolling_change(series, window=7):
     A = sum(a); B = sum(b)
     return None if not B else (A-B)/B
 
-def _top_k(df, col, k=5, asc=False):
-    if col not in df.columns: return pd.DataFrame()
-    return df.dropna(subset=[col]).sort_values(col, ascending=asc).head(k)
+class RuleContext:
+    """Shared, memoised statistics for one evaluation pass over a frame.
 
-def _simple_heuristics(df: pd.DataFrame) -> Tuple[List[str], List[Dict[str,Any]]]:
-    """Derive insights + action items without LLM."""
-    insights = []
-    actions = []
+    Rules ask for medians/quantiles/subsets through this object, so each is
+    computed once per run however many rules use it.
+    """
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._memo: Dict[Any, Any] = {}
+
+    def memo(self, key, fn):
+        if key not in self._memo:
+            self._memo[key] = fn()
+        return self._memo[key]
+
+    def col(self, name: str) -> pd.Series:
+        return self.memo(("col", name), lambda: pd.to_numeric(self.df[name], errors="coerce"))
+
+    def quantile(self, name: str, q: float, mask=None, mask_key=None) -> float:
+        def calc():
+            s = self.col(name) if mask is None else self.col(name)[mask]
+            return s.quantile(q)
+        return self.memo(("quantile", name, q, mask_key), calc)
 
+    def median(self, name: str, mask=None, mask_key=None) -> float:
+        return self.quantile(name, 0.5, mask, mask_key)
+
+    def published(self) -> pd.Series:
+        return self.memo("published", lambda: pd.to_datetime(self.df["publishedAt"]))
+
+    def most_recent(self, n: int) -> np.ndarray:
+        """Boolean mask of the last n rows by publishedAt, as a stable sort_values().tail(n) would pick (NaT last)."""
+        def calc():
+            keys = pd.DatetimeIndex(self.published()).asi8.copy()
+            keys[keys == np.iinfo(np.int64).min] = np.iinfo(np.int64).max
+            m = np.zeros(len(keys), dtype=bool)
+            if n >= len(keys):
+                m[:] = True
+            elif n > 0:
+                # partial selection, then order only the candidates at or above the cut
+                cand = np.flatnonzero(keys >= np.partition(keys, len(keys) - n)[len(keys) - n])
+                m[cand[np.lexsort((cand, keys[cand]))][-n:]] = True
+            return m
+        return self.memo(("recent", n), calc)
+
+class Rule:
+    """One heuristic: a vectorized predicate plus a score that ranks the matching rows.
+
+    `when(ctx)` returns a boolean mask over ctx.df; `score(ctx)` returns the values
+    the top `k` matches are ranked by (descending; negate for ascending). Rows with
+    a missing score are never surfaced. `requires` lists the columns the rule needs.
+    """
+    def __init__(self, name, requires, when, score, insight, action, k=5):
+        self.name, self.requires = name, set(requires)
+        self.when, self.score = when, score
+        self.insight, self.action, self.k = insight, action, k
+
+RULES: List[Rule] = [
     # Packaging mismatch: low CTR but above-median AVD
-    if {"clickThroughRate","averageViewDuration"}.issubset(df.columns):
-        ctr_med = _median(df["clickThroughRate"])
-        avd_med = _median(df["averageViewDuration"])
-        if ctr_med is not None and avd_med is not None:
-            low_ctr = df[df["clickThroughRate"] < ctr_med]
-            if not low_ctr.empty:
-                keepers = low_ctr[low_ctr["averageViewDuration"] >= avd_med]
-                if not keepers.empty:
-                    insights.append("Several videos hold attention but fail to attract clicks → packaging (title/thumbnail) is the bottleneck.")
-                    for _, r in _top_k(keepers, "averageViewDuration", k=5).iterrows():
-                        actions.append({
-                            "type":"Retitle/Thumb A/B",
-                            "videoId": r.get("videoId"),
-                            "title": r.get("title"),
-                            "why": "Strong AVD but below-median CTR → packaging mismatch",
-                            "suggested_tests":[
-                                "Shorter, benefit-first title",
-                                "Clearer subject isolation in thumbnail",
-                                "Reduce text density <10 words"
-                            ]
-                        })
-
-    # Cold-open drop: if we have AVD << duration hints (proxy)
-    if "averageViewDuration" in df.columns and "durationSec" in df.columns:
-        cold = df[(df["averageViewDuration"] < (df["durationSec"]*0.25))]
-        if not cold.empty:
-            insights.append("Many viewers bounce in the first quarter → cold opens are too slow or off-target.")
-            for _, r in _top_k(cold, "averageViewDuration", k=5, asc=True).iterrows():
-                actions.append({
-                    "type":"Rewrite cold open",
-                    "videoId": r.get("videoId"),
-                    "title": r.get("title"),
-                    "why": "Average view duration <25% of video length",
-                    "suggested_tests":[
-                        "Lead with result/controversy in first 5–10s",
-                        "Cut preamble; add kinetic b-roll",
-                        "Front-load a visual payoff"
-                    ]
-                })
-
-    # Evergreen resurfacing: older videos still getting views
-    if {"publishedAt","viewCount"}.issubset(df.columns):
-        df2 = df.copy()
+    Rule("packaging_mismatch", {"clickThroughRate", "averageViewDuration"},
+         when=lambda c: (c.col("clickThroughRate") < c.median("clickThroughRate"))
+                        & (c.col("averageViewDuration") >= c.median("averageViewDuration")),
+         score=lambda c: c.col("averageViewDuration"),
+         insight="Several videos hold attention but fail to attract clicks → packaging (title/thumbnail) is the bottleneck.",
+         action={"type": "Retitle/Thumb A/B",
+                 "why": "Strong AVD but below-median CTR → packaging mismatch",
+                 "suggested_tests": ["Shorter, benefit-first title",
+                                     "Clearer subject isolation in thumbnail",
+                                     "Reduce text density <10 words"]}),
+    # Cold-open drop: AVD << duration (proxy)
+    Rule("cold_open", {"averageViewDuration", "durationSec"},
+         when=lambda c: c.col("averageViewDuration") < c.col("durationSec") * 0.25,
+         score=lambda c: -c.col("averageViewDuration"),
+         insight="Many viewers bounce in the first quarter → cold opens are too slow or off-target.",
+         action={"type": "Rewrite cold open",
+                 "why": "Average view duration <25% of video length",
+                 "suggested_tests": ["Lead with result/controversy in first 5–10s",
+                                     "Cut preamble; add kinetic b-roll",
+                                     "Front-load a visual payoff"]}),
+    # Evergreen resurfacing: among the 200 latest uploads, those above their median views
+    Rule("evergreen", {"publishedAt", "viewCount"},
+         when=lambda c: c.most_recent(200)
+                        & (c.col("viewCount") > c.median("viewCount", c.most_recent(200), "recent200")).to_numpy(),
+         score=lambda c: c.col("viewCount"),
+         insight="Some older videos still pull views → resurface them via new short/clip or updated title.",
+         action={"type": "Resurface evergreen",
+                 "why": "High views despite age",
+                 "suggested_tests": ["Create 30–45s short with best moment",
+                                     "Add end screen from new upload",
+                                     "Minor title refresh (clarify benefit)"]}),
+    # Thin description / metadata issues
+    Rule("thin_description", {"description"},
+         when=lambda c: c.memo("desc_len", lambda: c.df["description"].fillna("").str.len()) < 60,
+         score=lambda c: c.col("viewCount") if "viewCount" in c.df.columns else pd.Series(np.nan, index=c.df.index),
+         insight="Some videos have thin descriptions → hurts search intent and external discovery.",
+         action={"type": "Improve description",
+                 "why": "Very short description",
+                 "suggested_tests": ["2–3 keyword-rich lines summarizing payoff",
+                                     "Timestamps and resources",
+                                     "Pin complementary comment"]}),
+]
+
+def _top_rows(mask, score, k):
+    """Positions of the k highest scores among rows where mask holds, best first (stable on ties)."""
+    score = np.asarray(score, dtype=float)
+    idx = np.flatnonzero(np.asarray(mask, dtype=bool) & ~np.isnan(score))
+    if len(idx) > k:
+        # order by (-score, position) — only the candidates at or above the k-th score are sorted
+        kth = np.partition(-score[idx], k - 1)[k - 1]
+        idx = idx[-score[idx] <= kth]
+    return idx[np.lexsort((idx, -score[idx]))][:k]
+
+def run_rules(df: pd.DataFrame, rules: List[Rule] = None) -> Tuple[List[str], List[Dict[str, Any]], Dict[str, float]]:
+    """Evaluate every applicable rule in one pass over shared statistics.
+
+    Returns (insights, actions, timings) where timings maps rule name → seconds.
+    A rule that raises (e.g. unparseable dates) is skipped, like the old heuristics.
+    """
+    rules = RULES if rules is None else rules
+    ctx = RuleContext(df)
+    insights, actions, timings = [], [], {}
+    vid = df["videoId"].to_numpy() if "videoId" in df.columns else np.full(len(df), None)
+    title = df["title"].to_numpy() if "title" in df.columns else np.full(len(df), None)
+    for rule in rules:
+        if not rule.requires.issubset(df.columns):
+            continue
+        t0 = time.perf_counter()
         try:
-            df2["publishedAt"] = pd.to_datetime(df2["publishedAt"])
-            evergreen = df2.sort_values("publishedAt").tail(200)
-            hot_old = evergreen[evergreen["viewCount"] > evergreen["viewCount"].median()]
-            if not hot_old.empty:
-                insights.append("Some older videos still pull views → resurface them via new short/clip or updated title.")
-                for _, r in _top_k(hot_old, "viewCount", k=5).iterrows():
-                    actions.append({
-                        "type":"Resurface evergreen",
-                        "videoId": r.get("videoId"),
-                        "title": r.get("title"),
-                        "why":"High views despite age",
-                        "suggested_tests":[
-                            "Create 30–45s short with best moment",
-                            "Add end screen from new upload",
-                            "Minor title refresh (clarify benefit)"
-                        ]
-                    })
+            mask = np.asarray(rule.when(ctx), dtype=bool)
+            if mask.any():
+                insights.append(rule.insight)
+                for i in _top_rows(mask, rule.score(ctx), rule.k):
+                    actions.append({"type": rule.action["type"], "videoId": vid[i], "title": title[i],
+                                    "why": rule.action["why"], "suggested_tests": list(rule.action["suggested_tests"])})
         except Exception:
             pass
+        timings[rule.name] = time.perf_counter() - t0
+    return insights, actions, timings
 
-    # Thin description / metadata issues (if present)
-    if "description" in df.columns:
-        thin = df[df["description"].fillna("").str.len() < 60]
-        if not thin.empty:
-            insights.append("Some videos have thin descriptions → hurts search intent and external discovery.")
-            for _, r in _top_k(thin, "viewCount", k=5, asc=False).iterrows():
-                actions.append({
-                    "type":"Improve description",
-                    "videoId": r.get("videoId"),
-                    "title": r.get("title"),
-                    "why":"Very short description",
-                    "suggested_tests":[
-                        "2–3 keyword-rich lines summarizing payoff",
-                        "Timestamps and resources",
-                        "Pin complementary comment"
-                    ]
-                })
-
+def _simple_heuristics(df: pd.DataFrame) -> Tuple[List[str], List[Dict[str,Any]]]:
+    """Derive insights + action items without LLM."""
+    insights, actions, _ = run_rules(df)
     return insights, actions
 
 def _llm_summarize(provider: str, model: str, base_url: str, system: str, prompt: str) -> str:
     """Best-effort local LLM (Ollama) or OpenAI; returns empty string on any failure."""
+    return LLMClient(provider=provider, model=model, base_url=base_url).complete(system, prompt)
+
+CRITIQUE_K = int(os.getenv("LLM_CRITIQUES", "8"))
+CRITIQUE_SYSTEM = ("You are a blunt YouTube packaging and scripting editor. Be specific, concrete and brief; "
+                   "no preamble.")
+
+def critique_shortlist(df: pd.DataFrame, k: int = CRITIQUE_K) -> List[Dict[str, Any]]:
+    """Weak-CTR and weak-retention videos worth an LLM critique, biggest audiences first.
+
+    Weak = bottom quartile of clickThroughRate (title rewrite) or of retention —
+    averageViewPercentage, else averageViewDuration / durationSec (hook critique).
+    """
+    ctx, out = RuleContext(df), []
+    vid = df["videoId"].to_numpy() if "videoId" in df.columns else np.full(len(df), None)
+    title = df["title"].fillna("").to_numpy() if "title" in df.columns else np.full(len(df), "")
+    reach = next((c for c in ["impressions", "views", "viewCount"] if c in df.columns), None)
+    weight = ctx.col(reach) if reach else pd.Series(0.0, index=df.index)
+    if "clickThroughRate" in df.columns:
+        weak = ctx.col("clickThroughRate") <= ctx.quantile("clickThroughRate", 0.25)
+        out += [{"videoId": vid[i], "title": title[i], "kind": "title_rewrite"}
+                for i in _top_rows(weak, weight.fillna(0), k)]
+    if "averageViewPercentage" in df.columns:
+        ret = ctx.col("averageViewPercentage")
+    elif {"averageViewDuration", "durationSec"}.issubset(df.columns):
+        ret = ctx.col("averageViewDuration") / ctx.col("durationSec").where(ctx.col("durationSec") > 0)
+    else:
+        ret = None
+    if ret is not None:
+        weak = ret <= ret.quantile(0.25)
+        out += [{"videoId": vid[i], "title": title[i], "kind": "hook_critique"}
+                for i in _top_rows(weak, weight.fillna(0), k)]
+    return out
+
+def _openings(video_ids, seconds: float = 60.0) -> Dict[str, str]:
+    """First `seconds` of each video's primary caption track, when segments exist."""
     try:
-        if provider == "ollama":
-            # Minimal Ollama chat call
-            import json, requests
-            r = requests.post(f"{base_url}/api/chat", json={
-                "model": model,
-                "messages":[
-                    {"role":"system","content":system},
-                    {"role":"user","content":prompt}
-                ],
-                "stream": False
-            }, timeout=30)
-            j = r.json()
-            return j.get("message",{}).get("content","") if isinstance(j, dict) else ""
-        elif provider == "openai":
-            import os
-            from openai import OpenAI
-            api_key = os.getenv("OPENAI_API_KEY","")
-            if not api_key: return ""
-            client = OpenAI(api_key=api_key)
-            resp = client.chat.completions.create(
-                model=model,
-                messages=[{"role":"system","content":system},{"role":"user","content":prompt}],
-                temperature=0.4,
-            )
-            return resp.choices[0].message.content or ""
-        return ""
+        try:
+            from caption_segments import load_segments
+        except ImportError:
+            from analysis.caption_segments import load_segments
+        seg = load_segments(["videoId", "seg_idx", "start_s", "text"],
+                            filters=[("videoId", "in", list(video_ids)), ("start_s", "<", seconds)])
+        return seg.sort_values(["videoId", "seg_idx"]).groupby("videoId")["text"].agg(" ".join).to_dict()
     except Exception:
-        return ""
+        return {}
 
-def generate_insights_and_actions(df: pd.DataFrame, provenance: dict) -> dict:
+def critique_prompt(item: Dict[str, Any], opening: str = "") -> str:
+    if item["kind"] == "title_rewrite":
+        return (f"Video title: {item['title']!r}\nIts click-through rate is in the channel's bottom quartile.\n"
+                f"Opening narration: {opening[:1500] or '(no captions)'}\n\n"
+                "Give: (1) one sentence on why the title under-sells the video; "
+                "(2) five alternative titles under 60 characters, benefit-first.")
+    return (f"Video title: {item['title']!r}\nIts audience retention is in the channel's bottom quartile.\n"
+            f"First minute of narration: {opening[:2500] or '(no captions)'}\n\n"
+            "Critique the hook: what delays the payoff, what to cut, and a rewritten first 15 seconds.")
+
+def critique_jobs(df: pd.DataFrame, k: int = CRITIQUE_K) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+    """Shortlisted videos and their (system, prompt) jobs, in the same order."""
+    items = critique_shortlist(df, k) if k else []
+    openings = _openings({i["videoId"] for i in items}) if items else {}
+    return items, [(CRITIQUE_SYSTEM, critique_prompt(i, openings.get(i["videoId"], ""))) for i in items]
+
+def what_moved(velocity: pd.DataFrame, daily: pd.Series, titles: Dict[str, str] = None, k: int = 5) -> Dict[str, Any]:
+    """Biggest 7-day risers/fallers from snapshot velocity plus the channel-wide weekly change.
+
+    `velocity` has (videoId, recent, prior, change); `daily` is channel views gained per day.
+    """
+    titles = titles or {}
+    v = velocity.dropna(subset=["recent"])
+    def rows(frame):
+        return [{"videoId": r.videoId, "title": titles.get(r.videoId), "recent": float(r.recent),
+                 "prior": None if pd.isna(r.prior) else float(r.prior),
+                 "change": None if pd.isna(r.change) else float(r.change)} for r in frame.itertuples()]
+    delta = (v["recent"] - v["prior"]).fillna(v["recent"])
+    risers = v.loc[delta.nlargest(k).index]
+    fallers = v.loc[delta[delta < 0].nsmallest(k).index]
+    return {
+        "channel_change": _rolling_change(list(daily.to_numpy()), window=7) if len(daily) else None,
+        "channel_recent": float(daily.tail(7).sum()) if len(daily) else None,
+        "risers": rows(risers),
+        "fallers": rows(fallers),
+    }
+
+def generate_insights_and_actions(df: pd.DataFrame, provenance: dict, llm: bool = True) -> dict:
     # 1) Heuristics
-    insights, actions = _simple_heuristics(df)
+    insights, actions, timings = run_rules(df)
 
     # 2) Optional GPT layer (adds narrative + ranks actions by impact/risk)
     provider = os.getenv("LLM_PROVIDER","ollama")
     base = os.getenv("OLLAMA_BASE_URL","http://localhost:11434")
-    model = os.getenv("OLLAMA_MODEL","llama3.1:8b")
+    model = os.getenv("OPENAI_MODEL","gpt-4o-mini") if provider == "openai" else os.getenv("OLLAMA_MODEL","llama3.1:8b")
     system = ("You are a ruthless YouTube growth analyst. Summarize shifts, spot packaging mismatches, "
               "and output prioritized, practical actions. No fluff.")
     # Compact table context (top rows only to stay local and cheap)
@@ -164,13 +266,23 @@ def generate_insights_and_actions(df: pd.DataFrame, provenance: dict) -> dict:
     view = df[cols].sort_values(by=[c for c in cols if c!="title" and c!="videoId"][:1], ascending=False).head(20)
     prompt = f"Data sample (top 20 rows):\n{view.to_csv(index=False)[:8000]}\n\nHeuristic insights: {json.dumps(insights)[:2000]}\nHeuristic actions: {json.dumps(actions)[:4000]}\n\nWrite: (1) a 4-6 bullet narrative of what changed and why; (2) the 6 highest-impact, low-effort actions with short rationale."
 
-    narrative = _llm_summarize(provider, model, base, system, prompt)
+    # narrative + per-video critiques share one cached, bounded worker pool
+    client = LLMClient.from_env(provider=provider, model=model, base_url=base) if llm else None
+    critiques = []
+    if client is None:
+        narrative = ""
+    else:
+        items, jobs = critique_jobs(df)
+        narrative, *texts = client.run_many([(system, prompt)] + jobs)
+        critiques = [{**i, "critique": t} for i, t in zip(items, texts) if t]
 
     return {
         "provenance": provenance,
         "insights_heuristic": insights,
         "actions_heuristic": actions,
-        "narrative_gpt": narrative
+        "rule_timings": timings,
+        "narrative_gpt": narrative,
+        "critiques": critiques
     }
 
 def write_reports(payload: dict, reports_dir: str):
@@ -188,6 +300,26 @@ def write_reports(payload: dict, reports_dir: str):
             for i in payload["insights_heuristic"]:
                 f.write(f"- {i}\n")
             f.write("\n")
+    # what moved (snapshot history) goes into insights.md
+    moved = payload.get("movers") or {}
+    if moved.get("risers") or moved.get("fallers"):
+        with open(os.path.join(reports_dir,"insights.md"),"a",encoding="utf-8") as f:
+            f.write("## What Moved (last 7 days vs prior 7)\n\n")
+            if moved.get("channel_change") is not None:
+                f.write(f"Channel: {moved['channel_recent']:,.0f} views gained, {moved['channel_change']:+.0%} vs the prior week.\n\n")
+            for label, key in (("Up", "risers"), ("Down", "fallers")):
+                for m in moved.get(key, []):
+                    chg = f" ({m['change']:+.0%})" if m.get("change") is not None else ""
+                    f.write(f"- {label}: {m.get('title') or m['videoId']} — {m['recent']:,.0f} views this week{chg}\n")
+            f.write("\n")
+    # critiques.md (per-video LLM title/hook critiques)
+    critiques = payload.get("critiques", [])
+    if critiques:
+        with open(os.path.join(reports_dir,"critiques.md"),"w",encoding="utf-8") as f:
+            f.write("# Per-video Critiques\n\n")
+            for c in critiques:
+                label = "Title rewrite" if c["kind"] == "title_rewrite" else "Hook critique"
+                f.write(f"## {label}: {c.get('title')}\n\nhttps://youtu.be/{c.get('videoId')}\n\n{c['critique'].strip()}\n\n")
     # actions.csv
     import csv
     actions = payload.get("actions_heuristic",[])
@@ -0,0 +1,138 @@
+
+import os
+import json
+import asyncio
+import hashlib
+import pathlib
+import threading
+import requests
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+CACHE_DIR = ROOT / os.getenv('LLM_CACHE_DIR', '.cache/llm')
+
+def prompt_hash(system: str, prompt: str) -> str:
+    return hashlib.sha256(f'{system}\x1f{prompt}'.encode('utf-8')).hexdigest()
+
+class LLMClient:
+    """Best-effort chat completions (Ollama or OpenAI) with a disk cache and bounded concurrency.
+
+    Responses are cached as JSON under cache_dir, keyed on (provider, model, prompt
+    hash), so reruns of the same prompts cost nothing. run_many() fans jobs out over
+    an asyncio pool of `concurrency` workers; each blocking HTTP call runs in a
+    thread. Failures return "" (never raise) and are not cached; after a connection
+    error the client stops trying for the rest of its lifetime.
+    """
+    def __init__(self, provider='ollama', model='llama3.1:8b', base_url='http://localhost:11434',
+                 timeout=60.0, concurrency=4, cache_dir=CACHE_DIR, temperature=0.4):
+        self.provider, self.model = provider, model
+        self.base_url = base_url.rstrip('/')
+        self.timeout, self.concurrency, self.temperature = timeout, max(1, int(concurrency)), temperature
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._down = threading.Event()
+        self._local = threading.local()
+        self.stats = {'cached': 0, 'called': 0, 'failed': 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **overrides):
+        kw = dict(provider=os.getenv('LLM_PROVIDER', 'ollama'),
+                  model=os.getenv('OLLAMA_MODEL', 'llama3.1:8b'),
+                  base_url=os.getenv('OLLAMA_BASE_URL', 'http://localhost:11434'),
+                  timeout=float(os.getenv('LLM_TIMEOUT', '60')),
+                  concurrency=int(os.getenv('LLM_CONCURRENCY', '4')))
+        if kw['provider'] == 'openai':
+            kw['model'] = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+        kw.update(overrides)
+        return cls(**kw)
+
+    def _path(self, system, prompt):
+        key = hashlib.sha256(f'{self.provider}|{self.model}|{prompt_hash(system, prompt)}'.encode()).hexdigest()
+        return self.cache_dir / key[:2] / f'{key}.json'
+
+    def _count(self, what):
+        with self._lock:
+            self.stats[what] += 1
+
+    def _session(self):
+        # one keep-alive session per worker thread
+        s = getattr(self._local, 'session', None)
+        if s is None:
+            s = self._local.session = requests.Session()
+        return s
+
+    def _call(self, system, prompt):
+        msgs = [{'role': 'system', 'content': system}, {'role': 'user', 'content': prompt}]
+        if self.provider == 'ollama':
+            r = self._session().post(f'{self.base_url}/api/chat', timeout=self.timeout, json={
+                'model': self.model, 'messages': msgs, 'stream': False,
+                'options': {'temperature': self.temperature}})
+            r.raise_for_status()
+            j = r.json()
+            return j.get('message', {}).get('content', '') if isinstance(j, dict) else ''
+        if self.provider == 'openai':
+            from openai import OpenAI
+            api_key = os.getenv('OPENAI_API_KEY', '')
+            if not api_key:
+                return ''
+            client = OpenAI(api_key=api_key, timeout=self.timeout)
+            resp = client.chat.completions.create(model=self.model, messages=msgs, temperature=self.temperature)
+            return resp.choices[0].message.content or ''
+        return ''
+
+    def complete(self, system: str, prompt: str) -> str:
+        path = self._path(system, prompt)
+        if path.exists():
+            try:
+                text = json.loads(path.read_text(encoding='utf-8'))['response']
+                self._count('cached')
+                return text
+            except Exception:
+                pass
+        if self._down.is_set():
+            return ''
+        try:
+            self._count('called')
+            text = self._call(system, prompt)
+        except requests.ConnectionError:
+            self._down.set()
+            self._count('failed')
+            return ''
+        except Exception:
+            self._count('failed')
+            return ''
+        if text:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix('.tmp')
+            tmp.write_text(json.dumps({'provider': self.provider, 'model': self.model,
+                                       'prompt_hash': prompt_hash(system, prompt), 'response': text}), encoding='utf-8')
+            os.replace(tmp, path)
+        return text
+
+    async def acomplete(self, system: str, prompt: str, sem: Optional[asyncio.Semaphore] = None) -> str:
+        if sem is None:
+            return await asyncio.to_thread(self.complete, system, prompt)
+        async with sem:
+            return await asyncio.to_thread(self.complete, system, prompt)
+
+    async def _gather(self, jobs):
+        sem = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self.acomplete(s, p, sem) for s, p in jobs))
+
+    def run_many(self, jobs: List[Tuple[str, str]]) -> List[str]:
+        """Complete (system, prompt) jobs concurrently; results in job order."""
+        if not jobs:
+            return []
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self._gather(jobs))
+        # already inside an event loop (e.g. a notebook): run ours on a helper thread
+        out = {}
+        t = threading.Thread(target=lambda: out.setdefault('r', asyncio.run(self._gather(jobs))))
+        t.start()
+        t.join()
+        return out['r']
@@ -0,0 +1,101 @@
+
+import os
+import pathlib
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+from caption_segments import load_segments
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+REPORTS = ROOT / os.getenv('REPORTS_DIR', 'reports')
+REPORTS.mkdir(parents=True, exist_ok=True)
+TOP_N = int(os.getenv('RETENTION_TOP_N', '50'))
+
+def interp_curves(curve_vid, curve_x, curve_y, query_vid, query_x):
+    """Piecewise-linear lookup of many points on many curves at once.
+
+    Curves and queries are placed on one axis as code*2 + x (x in [0, 1]), so a
+    single searchsorted finds every query's bracketing points; queries are clamped
+    to their own video's first/last point. Videos without a curve give NaN.
+    """
+    codes = pd.Index(pd.unique(np.asarray(curve_vid)))
+    c_code = codes.get_indexer(curve_vid)
+    order = np.lexsort((curve_x, c_code))
+    c_code, cx, cy = c_code[order], np.asarray(curve_x, float)[order], np.asarray(curve_y, float)[order]
+    ckey = c_code * 2.0 + cx
+
+    q_code = codes.get_indexer(query_vid)
+    qx = np.clip(np.asarray(query_x, float), 0.0, 1.0)
+    out = np.full(len(qx), np.nan)
+    ok = (q_code >= 0) & ~np.isnan(qx)
+    if not ok.any():
+        return out
+    qc, qkey = q_code[ok], q_code[ok] * 2.0 + qx[ok]
+    first = np.searchsorted(c_code, qc, side='left')
+    last = np.searchsorted(c_code, qc, side='right') - 1
+    lo = np.clip(np.searchsorted(ckey, qkey, side='right') - 1, first, last)
+    hi = np.minimum(lo + 1, last)
+    span = ckey[hi] - ckey[lo]
+    w = np.where(span > 0, np.clip((qkey - ckey[lo]) / np.where(span > 0, span, 1), 0, 1), 0.0)
+    out[ok] = cy[lo] + w * (cy[hi] - cy[lo])
+    return out
+
+def durations(seg):
+    """Video length in seconds: durationSec from the video tables when present, else last caption end."""
+    dur = seg.groupby('videoId')['end_s'].max()
+    for name in ['master_join.parquet', 'videos.parquet']:
+        p = PROC / name
+        if p.exists():
+            try:
+                v = pd.read_parquet(p, columns=['videoId', 'durationSec']).dropna()
+            except Exception:
+                continue
+            dur = v.set_index('videoId')['durationSec'].astype(float).combine_first(dur)
+            break
+    return dur
+
+def align(retention, seg):
+    """(videoId, seg_idx, start_s, end_s, ret_start, ret_end, retention_drop) per caption segment.
+
+    retention_drop is the share of the audience lost between a line's start and end.
+    """
+    dur = durations(seg)
+    seg = seg[seg['videoId'].isin(retention['videoId'].unique())]
+    d = seg['videoId'].map(dur).to_numpy(float)
+    d = np.where(d > 0, d, np.nan)
+    vids = seg['videoId'].to_numpy()
+    args = (retention['videoId'].to_numpy(), retention['elapsedVideoTimeRatio'].to_numpy(float),
+            retention['audienceWatchRatio'].to_numpy(float))
+    r0 = interp_curves(*args, vids, seg['start_s'].to_numpy(float) / d)
+    r1 = interp_curves(*args, vids, seg['end_s'].to_numpy(float) / d)
+    return pd.DataFrame({
+        'videoId': vids,
+        'seg_idx': seg['seg_idx'].to_numpy(),
+        'start_s': seg['start_s'].to_numpy(),
+        'end_s': seg['end_s'].to_numpy(),
+        'ret_start': r0,
+        'ret_end': r1,
+        'retention_drop': r0 - r1,
+    })
+
+def steepest(beats, seg, n=TOP_N):
+    top = beats.dropna(subset=['retention_drop']).nlargest(n, 'retention_drop')
+    top = top.merge(seg[['videoId', 'seg_idx', 'text']], on=['videoId', 'seg_idx'], how='left')
+    titles_p = PROC / 'videos.parquet'
+    if titles_p.exists():
+        top = top.merge(pd.read_parquet(titles_p, columns=['videoId', 'title']), on='videoId', how='left')
+    top['url'] = 'https://youtu.be/' + top['videoId'] + '?t=' + top['start_s'].astype(int).astype(str)
+    return top
+
+def main():
+    retention = pd.read_parquet(PROC / 'retention.parquet').dropna(subset=['elapsedVideoTimeRatio', 'audienceWatchRatio'])
+    seg = load_segments(['videoId', 'seg_idx', 'start_s', 'end_s', 'text'])
+    beats = align(retention, seg)
+    beats[['videoId', 'seg_idx', 'start_s', 'end_s', 'retention_drop']].to_parquet(PROC / 'retention_beats.parquet', index=False)
+    steepest(beats, seg).to_csv(REPORTS / 'retention_dropoffs.csv', index=False)
+    print('Wrote:', PROC / 'retention_beats.parquet', 'and', REPORTS / 'retention_dropoffs.csv', f'({len(beats)} segments)')
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,13 @@
-import os, json, pathlib, pandas as pd
+import os, sys, json, pathlib, datetime as dt, pandas as pd
 from dotenv import load_dotenv
-from insight_engine import generate_insights_and_actions, write_reports
+from insight_engine import generate_insights_and_actions, write_reports, what_moved
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 load_dotenv(ROOT/'.env')
 PROC = ROOT / os.getenv('PROCESSED_DIR','data/processed')
 REPORTS = ROOT / os.getenv('REPORTS_DIR','reports')
+sys.path.insert(0, str(ROOT / 'scripts'))
+import snapshots
 
 def main():
     mp = PROC/'master_join.parquet'
@@ -17,8 +19,14 @@ def main():
     if prov_p.exists():
         prov = json.load(open(prov_p))
     payload = generate_insights_and_actions(df, prov)
+    # what moved: 7-day vs prior-7-day view velocity from the snapshot history
+    hist = snapshots.load_history(['viewCount'], since=snapshots.today() - dt.timedelta(days=21))
+    if not hist.empty:
+        titles = dict(zip(df['videoId'], df['title'])) if 'title' in df.columns else {}
+        payload['movers'] = what_moved(snapshots.velocity(hist), snapshots.channel_daily(hist), titles)
     write_reports(payload, str(REPORTS))
     print('✅ Wrote insights.md and actions.csv in', REPORTS)
+    print('rule timings:', ', '.join(f'{k} {v * 1000:.1f}ms' for k, v in payload.get('rule_timings', {}).items()))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,157 @@
+
+import os
+import re
+import sys
+import json
+import sqlite3
+import hashlib
+import pathlib
+import pandas as pd
+from dotenv import load_dotenv
+try:
+    from caption_segments import load_segments, STATE as SEGMENT_STATE
+except ImportError:  # imported as analysis.search_index (dashboard)
+    from analysis.caption_segments import load_segments, STATE as SEGMENT_STATE
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+DB_PATH = PROC / 'search.sqlite'
+
+# Documents live in a plain table; an external-content FTS5 table indexes their
+# text, kept in sync by triggers so a video's rows can be replaced by rowid.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS docs(
+    id INTEGER PRIMARY KEY, videoId TEXT NOT NULL, kind TEXT NOT NULL,
+    start_s REAL, text TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS docs_video ON docs(videoId, kind);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    text, content='docs', content_rowid='id', tokenize='unicode61 remove_diacritics 2');
+CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+    INSERT INTO docs_fts(rowid, text) VALUES (new.id, new.text); END;
+CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, text) VALUES ('delete', old.id, old.text); END;
+CREATE TABLE IF NOT EXISTS sources(key TEXT PRIMARY KEY, sig TEXT NOT NULL);
+'''
+
+def connect(path=DB_PATH, readonly=False):
+    if readonly:
+        # as_uri() percent-encodes ?, # and % in the path
+        return sqlite3.connect(pathlib.Path(path).resolve().as_uri() + '?mode=ro', uri=True)
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    return con
+
+def _sig(*parts):
+    return hashlib.sha256('\x1f'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+def caption_sigs(seg_index):
+    """videoId → signature of its primary caption track (first track in captions_index order)."""
+    state = json.loads(SEGMENT_STATE.read_text()) if SEGMENT_STATE.exists() else {}
+    sigs = {}
+    for key, sha in state.items():
+        vid = key.split('|', 1)[0]
+        sigs.setdefault(vid, _sig(key, sha))
+    return {v: s for v, s in sigs.items() if v in seg_index}
+
+def _replace(con, key, sig, vid, kinds, rows):
+    con.execute(f"DELETE FROM docs WHERE videoId = ? AND kind IN ({','.join('?' * len(kinds))})", (vid, *kinds))
+    con.executemany('INSERT INTO docs(videoId, kind, start_s, text) VALUES (?, ?, ?, ?)', rows)
+    con.execute('INSERT OR REPLACE INTO sources(key, sig) VALUES (?, ?)', (key, sig))
+
+def build(path=DB_PATH):
+    """Bring the index up to date; only videos whose captions or metadata changed are rewritten."""
+    con = connect(path)
+    known = dict(con.execute('SELECT key, sig FROM sources'))
+    want, stats = {}, {'captions': 0, 'meta': 0, 'removed': 0}
+
+    vids_p = PROC / 'videos.parquet'
+    meta = pd.read_parquet(vids_p, columns=['videoId', 'title', 'description']) if vids_p.exists() else pd.DataFrame()
+    with con:
+        for vid, title, desc in zip(meta.get('videoId', []), meta.get('title', []), meta.get('description', [])):
+            title, desc = title or '', desc or ''
+            key, sig = f'meta:{vid}', _sig(title, desc)
+            want[key] = sig
+            if known.get(key) != sig:
+                rows = [(vid, k, None, t) for k, t in (('title', title), ('description', desc)) if t.strip()]
+                _replace(con, key, sig, vid, ('title', 'description'), rows)
+                stats['meta'] += 1
+
+    seg_vids = set(load_segments(['videoId'])['videoId'])
+    sigs = caption_sigs(seg_vids)
+    for vid in seg_vids - set(sigs):
+        sigs[vid] = ''  # no segment state on disk: always rebuild
+    want.update({f'cap:{v}': s for v, s in sigs.items()})
+    stale = [v for v, s in sigs.items() if not s or known.get(f'cap:{v}') != s]
+    for i in range(0, len(stale), 200):
+        part = stale[i:i+200]
+        seg = load_segments(['videoId', 'start_s', 'text'], filters=[('videoId', 'in', part)])
+        with con:
+            groups = dict(tuple(seg.groupby('videoId', sort=False)))
+            for vid in part:
+                # a video with no caption rows left still gets its old rows cleared
+                # and its signature recorded, so it isn't picked up again next run
+                g = groups.get(vid)
+                rows = [] if g is None else [(vid, 'caption', float(s), t) for s, t in zip(g['start_s'], g['text'])]
+                _replace(con, f'cap:{vid}', sigs[vid], vid, ('caption',), rows)
+        stats['captions'] += len(part)
+
+    with con:
+        for key in set(known) - set(want):
+            kind, vid = key.split(':', 1)
+            kinds = ('caption',) if kind == 'cap' else ('title', 'description')
+            con.execute(f"DELETE FROM docs WHERE videoId = ? AND kind IN ({','.join('?' * len(kinds))})", (vid, *kinds))
+            con.execute('DELETE FROM sources WHERE key = ?', (key,))
+            stats['removed'] += 1
+    if any(stats.values()):
+        con.execute("INSERT INTO docs_fts(docs_fts) VALUES ('optimize')")
+        con.commit()
+    stats['docs'] = con.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
+    con.close()
+    return stats
+
+_TERM = re.compile(r'"([^"]+)"|(\S+)')
+
+def to_match(query):
+    """Free text → FTS5 MATCH: "quoted phrases" stay phrases, other words are ANDed;
+    a trailing * keeps prefix matching. Everything else is quoted so punctuation is literal."""
+    terms = []
+    for phrase, word in _TERM.findall(query):
+        if phrase:
+            terms.append('"' + phrase.replace('"', '') + '"')
+        else:
+            prefix = word.endswith('*') and len(word) > 1
+            w = word.rstrip('*').replace('"', '')
+            if w:
+                terms.append('"' + w + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+def search(query, limit=20, kinds=None, path=DB_PATH):
+    """BM25-ranked hits as a DataFrame (videoId, kind, start_s, snippet, score); lower score is better."""
+    match = to_match(query)
+    cols = ['videoId', 'kind', 'start_s', 'snippet', 'score']
+    if not match or not pathlib.Path(path).exists():
+        return pd.DataFrame(columns=cols)
+    sql = ("SELECT d.videoId, d.kind, d.start_s, snippet(docs_fts, 0, '[', ']', '…', 12), bm25(docs_fts) "
+           "FROM docs_fts JOIN docs d ON d.id = docs_fts.rowid WHERE docs_fts MATCH ?")
+    args = [match]
+    if kinds:
+        sql += f" AND d.kind IN ({','.join('?' * len(kinds))})"
+        args.extend(kinds)
+    sql += ' ORDER BY bm25(docs_fts) LIMIT ?'
+    args.append(int(limit))
+    con = connect(path, readonly=True)
+    try:
+        rows = con.execute(sql, args).fetchall()
+    finally:
+        con.close()
+    return pd.DataFrame(rows, columns=cols)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        hits = search(' '.join(sys.argv[1:]))
+        for vid, kind, start, snip, _ in hits.itertuples(index=False):
+            at = f'?t={int(start)}' if start is not None and start == start else ''
+            print(f'https://youtu.be/{vid}{at}  [{kind}]  {snip}')
+    else:
+        print('Index updated →', DB_PATH, build())
@@ -1,10 +1,18 @@
 
 import os
+import sys
+import json
+import hashlib
 import pathlib
-import urllib.request
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import cv2
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from PIL import Image
 import pytesseract
@@ -15,16 +23,75 @@ PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
 RAW = ROOT / os.getenv('RAW_DIR', 'data/raw')
 REPORTS = ROOT / os.getenv('REPORTS_DIR', 'reports')
 (REPORTS).mkdir(parents=True, exist_ok=True)
+sys.path.insert(0, str(ROOT / 'scripts'))
+import warehouse  # noqa: E402
+THUMB_DIR = RAW / 'thumb_dl'
+DL_CONCURRENCY = int(os.getenv('THUMB_CONCURRENCY', '16'))
+# bump when features() changes so cached rows are recomputed
+FEATURE_VERSION = 1
+FEATURE_CACHE = PROC / 'thumbnail_feature_cache.parquet'
+FEATURE_COLS = ['sharpness', 'brightness', 'contrast', 'text_density']
+OUT_SCHEMA = pa.schema([(c, pa.float64()) for c in FEATURE_COLS] +
+                       [('videoId', pa.string()), ('sha256', pa.string())])
 
-def download(url, path):
+def make_session(pool=DL_CONCURRENCY):
+    s = requests.Session()
+    s.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=pool))
+    s.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=pool))
+    return s
+
+def _write_atomic(path, data):
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def download(url, path, validators=None, session=None, timeout=15):
+    """Conditional GET. Returns (status, validators) with status in
+    'new' | 'updated' | 'unchanged' | 'error'; the file is replaced atomically."""
+    session = session or make_session(1)
+    v = validators if validators and validators.get('url') == url and path.exists() else {}
+    headers = {}
+    if v.get('etag'):
+        headers['If-None-Match'] = v['etag']
+    if v.get('last_modified'):
+        headers['If-Modified-Since'] = v['last_modified']
     try:
-        with urllib.request.urlopen(url, timeout=15) as r:
-            data = r.read()
-        with open(path, 'wb') as f:
-            f.write(data)
-        return True
+        r = session.get(url, headers=headers, timeout=timeout)
+        if r.status_code == 304:
+            return 'unchanged', v
+        r.raise_for_status()
+        existed = path.exists()
+        _write_atomic(path, r.content)
+        return ('updated' if existed else 'new'), {
+            'url': url, 'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')}
     except Exception:
-        return False
+        return 'error', v
+
+def download_all(rows, dest=THUMB_DIR, session=None, concurrency=DL_CONCURRENCY):
+    """Fetch (videoId, url) pairs concurrently over one pooled session.
+
+    Validators (ETag/Last-Modified) persist in dest/_validators.json so a thumbnail
+    swap is picked up while unchanged images cost a 304. Returns {videoId: status}.
+    """
+    dest = pathlib.Path(dest)
+    dest.mkdir(parents=True, exist_ok=True)
+    vpath = dest / '_validators.json'
+    validators = json.loads(vpath.read_text()) if vpath.exists() else {}
+    session = session or make_session(concurrency)
+
+    def one(item):
+        vid, url = item
+        return vid, download(url, dest / f'{vid}.jpg', validators.get(vid), session)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for vid, (status, v) in pool.map(one, [(vid, url) for vid, url in rows if url]):
+            results[vid] = status
+            if v:
+                validators[vid] = v
+    _write_atomic(vpath, json.dumps(validators).encode())
+    return results
 
 def features(img):
     g = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
@@ -42,26 +109,95 @@ def features(img):
         text_density = np.nan
     return {'sharpness': lap, 'brightness': mean, 'contrast': contrast, 'text_density': text_density}
 
+def _init_worker():
+    cv2.setNumThreads(1)  # one image per process; avoid oversubscribing cores
+
+def _features_for(item):
+    sha, path = item
+    img = cv2.imread(str(path))
+    if img is None:
+        return sha, None
+    return sha, features(img)
+
+def file_sha(path):
+    return hashlib.sha256(pathlib.Path(path).read_bytes()).hexdigest()
+
+def ocr_available():
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def load_feature_cache(ocr=True):
+    """sha256 → features for the current FEATURE_VERSION.
+
+    Rows cached without OCR (text_density NaN) only count as hits while OCR is
+    still unavailable; once tesseract works they are recomputed.
+    """
+    if not FEATURE_CACHE.exists():
+        return {}
+    c = pd.read_parquet(FEATURE_CACHE)
+    c = c[c['version'] == FEATURE_VERSION]
+    if ocr:
+        c = c[c['text_density'].notna()]
+    return {r['sha256']: {k: r[k] for k in FEATURE_COLS} for r in c.to_dict('records')}
+
+def score_thumbnails(items, out_path, workers=None, chunk=256):
+    """Features for (videoId, path) pairs, streamed to `out_path` in row groups.
+
+    Images are keyed on content hash + FEATURE_VERSION; only uncached ones go to the
+    process pool. Returns (images computed, videos served from cache).
+    """
+    cache = load_feature_cache(ocr_available())
+    todo, by_sha, rows = {}, {}, []
+    writer = pq.ParquetWriter(str(out_path) + '.tmp', OUT_SCHEMA)
+    new_cache = []
+
+    def flush(force=False):
+        if rows and (force or len(rows) >= chunk):
+            writer.write_table(pa.Table.from_pylist(rows, schema=OUT_SCHEMA))
+            rows.clear()
+
+    n_cached = 0
+    for vid, path in items:
+        sha = file_sha(path)
+        by_sha.setdefault(sha, []).append(vid)
+        if sha in cache:
+            n_cached += 1
+            rows.append({**cache[sha], 'videoId': vid, 'sha256': sha})
+            flush()
+        else:
+            todo[sha] = path
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            for sha, feats in pool.map(_features_for, todo.items(), chunksize=4):
+                if feats is None:
+                    continue
+                new_cache.append({**feats, 'sha256': sha, 'version': FEATURE_VERSION})
+                for vid in by_sha[sha]:
+                    rows.append({**feats, 'videoId': vid, 'sha256': sha})
+                flush()
+        flush(force=True)
+    finally:
+        writer.close()
+    os.replace(str(out_path) + '.tmp', out_path)
+    if new_cache:
+        fresh = pd.DataFrame(new_cache)
+        old = pd.read_parquet(FEATURE_CACHE) if FEATURE_CACHE.exists() else None
+        if old is not None:
+            fresh = pd.concat([old[~old['sha256'].isin(fresh['sha256'])], fresh], ignore_index=True)
+        fresh.to_parquet(FEATURE_CACHE, index=False)
+    return len(new_cache), n_cached
+
 if __name__ == '__main__':
     thumbs = pd.read_parquet(PROC / 'thumbnails.parquet')
-    out_rows = []
-    (RAW/'thumb_dl').mkdir(parents=True, exist_ok=True)
-    for _, r in thumbs.iterrows():
-        url = r['thumbnail']
-        vid = r['videoId']
-        if not url:
-            continue
-        path = RAW/'thumb_dl'/f'{vid}.jpg'
-        if not path.exists():
-            ok = download(url, path)
-            if not ok:
-                continue
-        img = cv2.imread(str(path))
-        if img is None:
-            continue
-        out = features(img)
-        out['videoId'] = vid
-        out_rows.append(out)
-    df = pd.DataFrame(out_rows)
-    df.to_parquet(PROC / 'thumbnail_features.parquet', index=False)
+    status = download_all(zip(thumbs['videoId'], thumbs['thumbnail']))
+    counts = pd.Series(list(status.values()), dtype=object).value_counts().to_dict()
+    print('thumbnails:', counts)
+    items = [(vid, THUMB_DIR/f'{vid}.jpg') for vid in thumbs['videoId'] if (THUMB_DIR/f'{vid}.jpg').exists()]
+    workers = int(os.getenv('THUMB_WORKERS', '0')) or None
+    computed, cached = score_thumbnails(items, PROC / 'thumbnail_features.parquet', workers)
+    res = warehouse.upsert('thumbnail_features', PROC / 'thumbnail_features.parquet', prune=True)
+    print(f'features: {computed} computed, {cached} cached ({res["written"]} warehouse rows changed)')
     print('Saved →', PROC / 'thumbnail_features.parquet')
@@ -1,4 +1,4 @@
-import os, json, time, pathlib
+import os, sys, json, time, pathlib
 import pandas as pd
 from dotenv import load_dotenv
 
@@ -7,6 +7,18 @@ load_dotenv(ROOT / '.env')
 PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
 REPORTS = ROOT / os.getenv('REPORTS_DIR', 'reports')
 REPORTS.mkdir(parents=True, exist_ok=True)
+sys.path.insert(0, str(ROOT / 'scripts'))
+import warehouse
+
+def load(table, parquet, columns=None):
+    """Read from the warehouse (column pushdown); fall back to the Parquet export."""
+    try:
+        if warehouse.count(table):
+            return warehouse.read(table, columns)
+    except Exception as e:
+        print(f"warehouse read failed for {table} ({e}); using {parquet}")
+    p = PROC / parquet
+    return pd.read_parquet(p, columns=columns) if p.exists() else None
 
 def write_provenance(state, source, hint=None):
     prov = {"synthetic": False if state=="real" else None, "source": source, "ts": int(time.time())}
@@ -14,22 +26,19 @@ def write_provenance(state, source, hint=None):
     with open(ROOT/"data_provenance.json","w") as f: json.dump(prov, f, indent=2)
 
 def main():
-    vids = pd.read_parquet(PROC/"videos.parquet")
+    vids = load("videos", "videos.parquet")
+    if vids is None:
+        raise SystemExit("videos.parquet missing – run scripts/fetch_videos.py first.")
     # Try Analytics per-video
-    ana_path = PROC/"analytics_365d.parquet"
-    analytics = None
-    if ana_path.exists():
-        analytics = pd.read_parquet(ana_path)
+    analytics = load("analytics", "analytics_365d.parquet")
+    if analytics is not None:
         if "video" in analytics.columns and "videoId" not in analytics.columns:
             analytics = analytics.rename(columns={"video":"videoId"})
         if "videoId" not in analytics.columns or analytics["videoId"].nunique()==0:
             analytics = None
 
     # Fallback: Data API stats
-    dataapi_stats = None
-    stats_path = PROC/"dataapi_video_stats.parquet"
-    if stats_path.exists():
-        dataapi_stats = pd.read_parquet(stats_path)
+    dataapi_stats = load("video_stats", "dataapi_video_stats.parquet")
 
     # Select best available
     if analytics is not None:
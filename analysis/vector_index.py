@@ -0,0 +1,234 @@
+
+import os
+import json
+import hashlib
+import pathlib
+import argparse
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+INDEX_DIR = PROC / 'vector_index'
+SEARCH_CHUNK = int(os.getenv('VECTOR_SEARCH_CHUNK', '65536'))
+METRIC_COLS = ['title', 'publishedAt', 'views', 'viewCount', 'impressions', 'clickThroughRate',
+               'averageViewDuration', 'averageViewPercentage', 'subscribersGained', 'title_caption_sim']
+
+def _topk(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part])]
+
+class VectorIndex:
+    """Per-video unit vectors on disk, searched by inner product.
+
+    `<name>.f32` is a float32 (n, dim) matrix opened as a memmap; `<name>.ids.parquet`
+    maps videoId → row plus a signature of the inputs, so upserts only rewrite rows
+    whose vector changed and append new videos. Exact search is a chunked mat-vec
+    over the memmap. With build_ivf(), approximate search scans only the rows in
+    the `nprobe` lists whose k-means centroids are closest to the query.
+    """
+    def __init__(self, name='videos', root=INDEX_DIR):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.vec_path = self.root / f'{name}.f32'
+        self.ids_path = self.root / f'{name}.ids.parquet'
+        self.meta_path = self.root / f'{name}.meta.json'
+        self.ivf_path = self.root / f'{name}.ivf.npz'
+        self.meta = json.loads(self.meta_path.read_text()) if self.meta_path.exists() else {}
+        ids = pd.read_parquet(self.ids_path) if self.ids_path.exists() and self.meta else None
+        self.ids = list(ids['videoId']) if ids is not None else []
+        self.sigs = dict(zip(ids['videoId'], ids['sig'])) if ids is not None else {}
+        self.row = {v: i for i, v in enumerate(self.ids)}
+        self._ivf = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.meta.get('dim')
+
+    def vectors(self, mode='r'):
+        if not self.ids:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vec_path, dtype=np.float32, mode=mode, shape=(len(self.ids), self.dim))
+
+    def reset(self, model, dim):
+        for p in (self.vec_path, self.ids_path, self.ivf_path):
+            p.unlink(missing_ok=True)
+        self.meta = {'model': model, 'dim': int(dim)}
+        self.meta_path.write_text(json.dumps(self.meta))
+        self.ids, self.sigs, self.row, self._ivf = [], {}, {}, None
+
+    def upsert(self, ids, vecs, sigs, model):
+        """Write vectors for ids whose signature changed; returns (updated, added)."""
+        vecs = np.ascontiguousarray(vecs, dtype=np.float32)
+        if self.meta.get('model') != model or self.dim != vecs.shape[1]:
+            self.reset(model, vecs.shape[1])
+        changed = [i for i, (v, s) in enumerate(zip(ids, sigs)) if self.sigs.get(v) != s]
+        upd = [i for i in changed if ids[i] in self.row]
+        new = [i for i in changed if ids[i] not in self.row]
+        if upd:
+            mm = self.vectors('r+')
+            mm[[self.row[ids[i]] for i in upd]] = vecs[upd]
+            mm.flush()
+            del mm
+        if new:
+            with open(self.vec_path, 'ab') as f:
+                f.write(vecs[new].tobytes())
+            for i in new:
+                self.row[ids[i]] = len(self.ids)
+                self.ids.append(ids[i])
+        for i in changed:
+            self.sigs[ids[i]] = sigs[i]
+        if changed:
+            pd.DataFrame({'videoId': self.ids, 'sig': [self.sigs[v] for v in self.ids]}).to_parquet(self.ids_path, index=False)
+            self._assign_ivf([self.row[ids[i]] for i in changed])
+        return len(upd), len(new)
+
+    def build_ivf(self, n_lists=None):
+        """Cluster the stored vectors into inverted lists for approximate search."""
+        from sklearn.cluster import MiniBatchKMeans
+        V = self.vectors()
+        n_lists = n_lists or max(1, int(np.sqrt(len(V))))
+        km = MiniBatchKMeans(n_clusters=n_lists, batch_size=4096, n_init=3, random_state=0)
+        for i in range(0, len(V), SEARCH_CHUNK):
+            km.partial_fit(np.asarray(V[i:i+SEARCH_CHUNK]))
+        C = km.cluster_centers_.astype(np.float32)
+        C /= np.linalg.norm(C, axis=1, keepdims=True) + 1e-12
+        lists = np.concatenate([np.argmax(np.asarray(V[i:i+SEARCH_CHUNK]) @ C.T, axis=1)
+                                for i in range(0, len(V), SEARCH_CHUNK)])
+        np.savez(self.ivf_path, centroids=C, lists=lists.astype(np.int32))
+        self._ivf = None
+
+    def _load_ivf(self):
+        if self._ivf is None and self.ivf_path.exists():
+            z = np.load(self.ivf_path)
+            self._ivf = {'centroids': z['centroids'], 'lists': z['lists']}
+        return self._ivf
+
+    def _assign_ivf(self, rows):
+        # keep existing inverted lists usable: new/changed rows join their nearest list
+        ivf = self._load_ivf()
+        if ivf is None:
+            return
+        lists = np.resize(ivf['lists'], len(self.ids))
+        V = self.vectors()
+        lists[rows] = np.argmax(np.asarray(V[rows]) @ ivf['centroids'].T, axis=1)
+        ivf['lists'] = lists.astype(np.int32)
+        np.savez(self.ivf_path, centroids=ivf['centroids'], lists=ivf['lists'])
+
+    def search(self, query, k=10, approx=False, nprobe=8, exclude=()):
+        """Top-k (videoId, score) for a unit query vector, best first."""
+        if not self.ids:
+            return []
+        q = np.asarray(query, dtype=np.float32).ravel()
+        V = self.vectors()
+        skip = {self.row[v] for v in exclude if v in self.row}
+        ivf = self._load_ivf() if approx else None
+        if ivf is not None:
+            probe = _topk(ivf['centroids'] @ q, nprobe)
+            cand = np.flatnonzero(np.isin(ivf['lists'], probe))
+            scores = np.asarray(V[cand]) @ q
+        else:
+            cand = None
+            scores = np.concatenate([np.asarray(V[i:i+SEARCH_CHUNK]) @ q for i in range(0, len(V), SEARCH_CHUNK)])
+        top = _topk(scores, k + len(skip))
+        rows = top if cand is None else cand[top]
+        hits = [(self.ids[r], float(s)) for r, s in zip(rows, scores[top]) if r not in skip]
+        return hits[:k]
+
+    def like(self, video_id, k=10, approx=False, nprobe=8):
+        """Top-k neighbours of an indexed video; ValueError if it isn't indexed."""
+        if video_id not in self.row:
+            raise ValueError(f'{video_id!r} is not in the vector index (unknown video or no title); '
+                             'run analysis/vector_index.py to refresh it')
+        q = np.asarray(self.vectors()[self.row[video_id]])
+        return self.search(q, k, approx, nprobe, exclude=(video_id,))
+
+def video_vectors(videos, titles, store, win=None):
+    """One unit vector per video: title vector plus the mean of its transcript-window vectors.
+
+    Window vectors are read back from the embedding store by text_hash, so nothing
+    is re-encoded. Returns (ids, vectors, signatures) for videos with a title.
+    """
+    have = [(v, t) for v, t in zip(videos, titles) if t]
+    if not have:
+        return [], np.zeros((0, store.dim or 0), dtype=np.float32), []
+    ids = [v for v, _ in have]
+    T = store.encode([t for _, t in have], save=False)
+    V = T.copy()
+    sig_parts = {v: [t] for v, t in have}
+    if win is not None and not win.empty:
+        win = win[win['videoId'].isin(list(sig_parts)) & win['text_hash'].map(store.index.__contains__)]
+        if not win.empty:
+            pos = {v: i for i, v in enumerate(ids)}
+            at = win['videoId'].map(pos).to_numpy()
+            W = np.asarray(store.vectors()[[store.index[h] for h in win['text_hash']]])
+            sums = np.zeros_like(T)
+            np.add.at(sums, at, W)
+            counts = np.bincount(at, minlength=len(ids))[:, None]
+            has = counts[:, 0] > 0
+            V[has] = T[has] + sums[has] / counts[has]
+            for v, h in zip(win['videoId'], win['text_hash']):
+                sig_parts[v].append(h)
+    V /= np.linalg.norm(V, axis=1, keepdims=True) + 1e-12
+    sigs = [hashlib.sha256('\x1f'.join(sig_parts[v]).encode('utf-8')).hexdigest() for v in ids]
+    return ids, V, sigs
+
+def refresh(videos, titles, store, win=None, index=None):
+    index = index or VectorIndex()
+    ids, V, sigs = video_vectors(videos, titles, store, win)
+    if not ids:
+        return index, (0, 0)
+    return index, index.upsert(ids, V, sigs, store.model_name)
+
+def neighbours(video_id, k=10, approx=False, nprobe=8, index=None, master=None):
+    """Most similar videos to `video_id` with their metrics from master_join.parquet."""
+    index = index or VectorIndex()
+    hits = pd.DataFrame(index.like(video_id, k, approx, nprobe), columns=['videoId', 'similarity'])
+    if master is None:
+        p = PROC / 'master_join.parquet'
+        if p.exists():
+            import pyarrow.parquet as pq
+            have = set(pq.read_schema(p).names)
+            master = pd.read_parquet(p, columns=['videoId'] + [c for c in METRIC_COLS if c in have])
+    if master is not None:
+        cols = ['videoId'] + [c for c in METRIC_COLS if c in master.columns]
+        hits = hits.merge(master[cols], on='videoId', how='left')
+    return hits
+
+def main():
+    from embeddings import EmbeddingStore
+    ap = argparse.ArgumentParser(description='Similar-video index over cached embeddings.')
+    ap.add_argument('--like', help='print the nearest neighbours of this videoId')
+    ap.add_argument('-k', type=int, default=10)
+    ap.add_argument('--approx', action='store_true', help='search the IVF lists instead of every vector')
+    ap.add_argument('--build-ivf', type=int, nargs='?', const=0, default=None, metavar='N_LISTS',
+                    help='(re)cluster vectors into inverted lists (default sqrt(n))')
+    args = ap.parse_args()
+    index = VectorIndex()
+    if args.like:
+        try:
+            hits = neighbours(args.like, args.k, args.approx, index=index)
+        except ValueError as e:
+            raise SystemExit(f'error: {e}')
+        print(hits.to_string(index=False))
+        return
+    master = pd.read_parquet(PROC / 'master_join.parquet', columns=['videoId', 'title'])
+    win_p = PROC / 'title_windows.parquet'
+    win = pd.read_parquet(win_p, columns=['videoId', 'text_hash']) if win_p.exists() else None
+    store = EmbeddingStore()
+    _, (upd, new) = refresh(master['videoId'].tolist(), master['title'].fillna('').tolist(), store, win, index)
+    store.save()
+    if args.build_ivf is not None:
+        index.build_ivf(args.build_ivf or None)
+    print(f'Vector index: {len(index)} videos ({new} added, {upd} updated) →', index.vec_path)
+
+if __name__ == '__main__':
+    main()
@@ -1,59 +1,59 @@
-import os
 import pandas as pd
 import streamlit as st
-import matplotlib.pyplot as plt
-from analysis.insight_engine import generate_insights_and_actions
+import dashboard_data as dd
+import dashboard_tables as tables
+from analysis.search_index import search as search_index
 
 st.set_page_config(page_title="YouTube Audit Dashboard", layout="wide")
-PD, RP = "data/processed", "reports"
 
-def lp(p):
-    try:
-        return pd.read_parquet(p) if os.path.exists(p) else pd.DataFrame()
-    except Exception:
-        return pd.DataFrame()
+# Each panel asks the cached data layer for just the columns it draws
+METRIC_COLS = ["viewCount", "likeCount", "commentCount"]
+LIST_COLS = ["title", "publishedAt"] + METRIC_COLS
+ALL_COLS = ["title", "videoId", "views", "clickThroughRate", "averageViewDuration", "impressions", "subscribersGained", "likes", "comments"]
 
-videos = lp(f"{PD}/videos.parquet")
-analytics = lp(f"{PD}/analytics_365d.parquet")
-thumbs = lp(f"{PD}/thumbnail_features.parquet")
+prov = dd.provenance()
+thumbs = dd.load("thumbnail_features.parquet", ["videoId", "sharpness", "brightness", "contrast", "text_density"])
+master = dd.load("master_join.parquet", ["videoId"])
+df = dd.frame(LIST_COLS)
 
 st.title("📊 YouTube Deep-Dive Dashboard")
 
+if df.empty:
+    st.warning("Missing video data. Please run the fetch scripts first.")
+    st.stop()
+
 # === Insights & Actions ===
 try:
-    payload = generate_insights_and_actions(master, prov if 'prov' in globals() else {})
-    st.header('🔎 Insights')
-    if payload.get('narrative_gpt'):
-        st.write(payload['narrative_gpt'])
-    if payload.get('insights_heuristic'):
-        st.subheader('Heuristic Highlights')
-        for i in payload['insights_heuristic']:
-            st.markdown(f'- {i}')
-    st.header('✅ Action Items')
-    actions = payload.get('actions_heuristic', [])
-    if actions:
-        import pandas as pd
-        st.dataframe(pd.DataFrame(actions))
+    payload = dd.insights()
+    if payload is None:
+        st.info('Insights need master_join.parquet — run `python pipeline.py` first.')
     else:
-        st.info('No actions generated yet. Add more data or enable Analytics per-video for deeper signals.')
+        st.header('🔎 Insights')
+        if payload.get('narrative_gpt'):
+            st.write(payload['narrative_gpt'])
+        if payload.get('insights_heuristic'):
+            st.subheader('Heuristic Highlights')
+            for i in payload['insights_heuristic']:
+                st.markdown(f'- {i}')
+        if payload.get('critiques'):
+            with st.expander(f"✍️ Per-video critiques ({len(payload['critiques'])})"):
+                for c in payload['critiques']:
+                    st.markdown(f"**{'Title rewrite' if c['kind'] == 'title_rewrite' else 'Hook critique'} — {c.get('title')}**")
+                    st.write(c['critique'])
+        st.header('✅ Action Items')
+        actions = payload.get('actions_heuristic', [])
+        if actions:
+            st.dataframe(pd.DataFrame(actions))
+        else:
+            st.info('No actions generated yet. Add more data or enable Analytics per-video for deeper signals.')
 except Exception as _e:
     st.warning('Insights engine unavailable — check data or LLM settings.')
 
 # HONEST MODE banner
-import json, time
-prov = {"synthetic": None, "source":"unknown","ts":None}
-try:
-    honest_banner
-except Exception as _e:
-    pass
-try:
-    prov = json.load(open("data_provenance.json"))
-except Exception:
-    pass
 def honest_banner(df_master):
     missing = []
-    for path in ["data/processed/analytics_365d.parquet","reports/correlations.csv"]:
-        if not os.path.exists(path): missing.append(path)
+    for path in [dd.PROC / "analytics_365d.parquet", dd.REPORTS / "correlations.csv"]:
+        if not path.exists(): missing.append(str(path.relative_to(dd.ROOT)))
     if prov.get("synthetic") is True or missing or df_master.empty:
         st.warning("HONEST MODE: Real analytics are missing or incomplete. No synthetic data is displayed.")
         if missing: st.info("Missing artifacts: " + ", ".join(missing))
@@ -61,30 +61,7 @@ def honest_banner(df_master):
 
 st.markdown("---")
 
-# Try to load master_join first, fallback to manual merge
-master = lp(f"{PD}/master_join.parquet")
-if not master.empty:
-    df = master.copy()
-    if not thumbs.empty:
-        df = df.merge(thumbs, on="videoId", how="left")
-else:
-    # Create master dataframe by merging videos and analytics
-    if not videos.empty:
-        df = videos.copy()
-        # Only merge analytics if it has videoId column (per-video data)
-        if not analytics.empty and "videoId" in analytics.columns:
-            df = df.merge(analytics, on="videoId", how="left")
-        elif not analytics.empty:
-            # Analytics is channel-level totals, add as summary info
-            st.info("📊 Channel Analytics: " + str(analytics.iloc[0].to_dict()) if not analytics.empty else "")
-        if not thumbs.empty:
-            df = df.merge(thumbs, on="videoId", how="left")
-    else:
-        st.warning("Missing video data. Please run the fetch scripts first.")
-        st.stop()
-
-# HONEST MODE banner
-(honest_banner(master) if 'master' in globals() or 'master' in locals() else None)
+honest_banner(master)
 
 # Data Status
 st.info("📊 **Data Status**: This dashboard shows real video metadata but analytics data is limited due to API quota restrictions.")
@@ -117,53 +94,43 @@ st.markdown("---")
 
 # Video List
 st.subheader("📺 Your YouTube Videos")
-display_cols = ["title", "publishedAt"]
-if "viewCount" in df.columns:
-    display_cols.append("viewCount")
-if "likeCount" in df.columns:
-    display_cols.append("likeCount")
-if "commentCount" in df.columns:
-    display_cols.append("commentCount")
+tables.paged_table("videos", LIST_COLS, key="video_list", sort="publishedAt", search_col="title", dates=("publishedAt",))
 
-video_display = df[display_cols].copy()
-if "publishedAt" in video_display.columns:
-    video_display["publishedAt"] = pd.to_datetime(video_display["publishedAt"]).dt.strftime("%Y-%m-%d")
-    video_display = video_display.sort_values("publishedAt", ascending=False)
+st.markdown("---")
 
-st.dataframe(video_display, use_container_width=True)
+# Transcript / title search
+st.subheader("🔍 Search what you said")
+query = st.text_input("Search captions, titles and descriptions", placeholder='e.g. "quick brown" fox*')
+if query:
+    hits = search_index(query, limit=50)
+    if hits.empty:
+        st.info("No matches (run `python analysis/search_index.py` to build the index).")
+    else:
+        titles = df.set_index("videoId")["title"] if "title" in df.columns else pd.Series(dtype=object)
+        hits["title"] = hits["videoId"].map(titles)
+        hits["link"] = "https://youtu.be/" + hits["videoId"] + hits["start_s"].map(
+            lambda s: f"?t={int(s)}" if pd.notna(s) else "")
+        st.dataframe(hits[["title", "kind", "start_s", "snippet", "link"]], use_container_width=True,
+                     column_config={"link": st.column_config.LinkColumn("link")})
 
 st.markdown("---")
 
-# Charts
+# Charts (rendered from precomputed aggregates; PNGs cached per data fingerprint)
 col1, col2 = st.columns(2)
 
 with col1:
     st.subheader("📊 Video Performance (if available)")
-    if "viewCount" in df.columns:
-        views_data = df["viewCount"].dropna()
-        if len(views_data) > 0:
-            fig, ax = plt.subplots(figsize=(8, 6))
-            ax.hist(views_data, bins=min(10, len(views_data)), alpha=0.7, edgecolor='black')
-            ax.set_xlabel("Views")
-            ax.set_ylabel("Frequency")
-            ax.set_title("Video Views Distribution")
-            ax.grid(True, alpha=0.2)
-            st.pyplot(fig)
-        else:
-            st.info("No view data available")
+    png = dd.chart_png("views_hist")
+    if png:
+        st.image(png, use_column_width=True)
     else:
         st.info("View data not available due to API quota limits")
 
 with col2:
     st.subheader("📈 Engagement Metrics (if available)")
-    if "likeCount" in df.columns and "commentCount" in df.columns:
-        fig, ax = plt.subplots(figsize=(8, 6))
-        ax.scatter(df["likeCount"], df["commentCount"], alpha=0.6, s=50)
-        ax.set_xlabel("Likes")
-        ax.set_ylabel("Comments")
-        ax.set_title("Likes vs Comments")
-        ax.grid(True, alpha=0.2)
-        st.pyplot(fig)
+    png = dd.chart_png("likes_vs_comments")
+    if png:
+        st.image(png, use_column_width=True)
     else:
         st.info("Engagement data not available due to API quota limits")
 
@@ -172,41 +139,20 @@ st.markdown("---")
 # Thumbnail Analysis
 if not thumbs.empty:
     st.subheader("🖼️ Thumbnail Analysis")
-    thumb_cols = ["videoId", "sharpness", "brightness", "contrast", "text_density"]
-    available_thumb_cols = [c for c in thumb_cols if c in thumbs.columns]
-    
-    if len(available_thumb_cols) > 1:
+    if len(thumbs.columns) > 1:
         col1, col2 = st.columns(2)
         
         with col1:
-            if "sharpness" in thumbs.columns and not thumbs["sharpness"].isna().all():
-                sharpness_data = thumbs["sharpness"].dropna()
-                if len(sharpness_data) > 0:
-                    fig, ax = plt.subplots(figsize=(8, 6))
-                    ax.hist(sharpness_data, bins=min(10, len(sharpness_data)), alpha=0.7, edgecolor='black')
-                    ax.set_xlabel("Sharpness")
-                    ax.set_ylabel("Frequency")
-                    ax.set_title("Thumbnail Sharpness Distribution")
-                    ax.grid(True, alpha=0.2)
-                    st.pyplot(fig)
-                else:
-                    st.info("No valid sharpness data available")
+            png = dd.chart_png("sharpness_hist")
+            if png:
+                st.image(png, use_column_width=True)
             else:
                 st.info("Sharpness data not available")
         
         with col2:
-            if "text_density" in thumbs.columns and not thumbs["text_density"].isna().all():
-                text_density_data = thumbs["text_density"].dropna()
-                if len(text_density_data) > 0:
-                    fig, ax = plt.subplots(figsize=(8, 6))
-                    ax.hist(text_density_data, bins=min(10, len(text_density_data)), alpha=0.7, edgecolor='black')
-                    ax.set_xlabel("Text Density")
-                    ax.set_ylabel("Frequency")
-                    ax.set_title("Thumbnail Text Density Distribution")
-                    ax.grid(True, alpha=0.2)
-                    st.pyplot(fig)
-                else:
-                    st.info("No valid text density data available")
+            png = dd.chart_png("text_density_hist")
+            if png:
+                st.image(png, use_column_width=True)
             else:
                 st.info("Text density data not available")
 
@@ -214,20 +160,34 @@ st.markdown("---")
 
 # All Videos Table
 st.subheader("📋 All Videos")
-all_cols = ["title", "videoId", "views", "clickThroughRate", "averageViewDuration", "impressions", "subscribersGained", "likes", "comments"]
-available_all_cols = [c for c in all_cols if c in df.columns]
-if "views" in df.columns:
-    all_videos = df[available_all_cols].sort_values("views", ascending=False)
-    st.dataframe(all_videos, use_container_width=True)
+if "views" in tables.schema("videos"):
+    tables.paged_table("videos", ALL_COLS, key="all_videos", sort="views", search_col="title")
 else:
     st.info("Video data not available")
 
 st.markdown("---")
 
+# Comments drill-down
+st.subheader("💬 Comments")
+if tables.schema("comments"):
+    shown = tables.paged_table("comment_counts", ["title", "videoId", "comments", "replies", "likes", "latest"],
+                               key="comment_counts", sort="comments", search_col="title")
+    # choices come from the page shown above: filter, sort or page it to reach any video
+    labels = {r.videoId: f"{r.title or r.videoId}" for r in shown.itertuples()} if "videoId" in shown else {}
+    vid = st.selectbox("Read comments for (a video on the page above)", list(labels),
+                       format_func=labels.get, key="comments_video")
+    if vid:
+        tables.paged_table("comments", ["publishedAt", "type", "likeCount", "text"], key="comments",
+                       sort="publishedAt", search_col="text", filters={"videoId": vid}, dates=("publishedAt",))
+else:
+    st.info("Comments not available (run `python scripts/fetch_comments.py`)")
+
+st.markdown("---")
+
 # Correlation Analysis
 st.subheader("🔍 Correlation Analysis")
-if os.path.exists(f"{RP}/correlations.csv"):
-    corr_df = pd.read_csv(f"{RP}/correlations.csv", index_col=0)
+corr_df = dd.correlations()
+if not corr_df.empty:
     st.dataframe(corr_df, use_container_width=True)
 else:
     st.info("Correlation analysis not available")
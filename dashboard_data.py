@@ -0,0 +1,163 @@
+
+import os
+import json
+import hashlib
+import pathlib
+import pandas as pd
+import pyarrow.parquet as pq
+import streamlit as st
+from dotenv import load_dotenv
+from analysis.insight_engine import generate_insights_and_actions
+from analysis import chart_aggregates
+
+ROOT = pathlib.Path(__file__).resolve().parent
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+REPORTS = ROOT / os.getenv('REPORTS_DIR', 'reports')
+PROVENANCE = ROOT / 'data_provenance.json'
+CHART_AGGREGATES = PROC / 'chart_aggregates.json'
+
+# Files whose content defines the dashboard's data version
+SOURCES = [PROC / 'master_join.parquet', PROC / 'videos.parquet', PROC / 'analytics_365d.parquet',
+           PROC / 'thumbnail_features.parquet', REPORTS / 'correlations.csv', PROVENANCE]
+
+# Streamlit reruns the whole script on every widget interaction. Everything below is
+# memoised on a content digest, and the digest itself is only recomputed when a
+# file's (mtime, size) changes, so a rerun with unchanged data costs a few stat() calls.
+
+def _stat(path):
+    try:
+        s = os.stat(path)
+        return s.st_mtime_ns, s.st_size
+    except OSError:
+        return None
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _digest(path, mtime_ns, size):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def fingerprint(path):
+    """Content digest of a file (None if missing); re-hashed only when mtime/size change."""
+    s = _stat(path)
+    return _digest(str(path), *s) if s else None
+
+def data_version():
+    """One digest over every dashboard source: the cache key for derived results."""
+    parts = [f'{p.name}:{fingerprint(p)}' for p in SOURCES]
+    return hashlib.blake2b('|'.join(parts).encode(), digest_size=16).hexdigest()
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _read_parquet(path, digest, columns):
+    try:
+        if columns is not None:
+            have = set(pq.read_schema(path).names)
+            columns = [c for c in columns if c in have]
+        return pd.read_parquet(path, columns=columns)
+    except Exception:
+        return pd.DataFrame()
+
+def load(name, columns=None):
+    """A processed Parquet file, reading only `columns` (those it has); empty if missing."""
+    path = PROC / name
+    digest = fingerprint(path)
+    if digest is None:
+        return pd.DataFrame()
+    return _read_parquet(str(path), digest, tuple(columns) if columns else None)
+
+def has(name):
+    return _stat(PROC / name) is not None
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _frame(version, columns):
+    # shared across reruns and sessions without a copy: callers must not mutate it
+    want = None if columns is None else sorted(set(columns) | {'videoId'})
+    df = load('master_join.parquet', want)
+    extras = ['thumbnail_features.parquet']
+    if df.empty:
+        df = load('videos.parquet', want)
+        extras.insert(0, 'analytics_365d.parquet')
+    if df.empty or 'videoId' not in df.columns:
+        return pd.DataFrame()
+    for name in extras:
+        other = load(name, want)
+        if other.empty or 'videoId' not in other.columns:
+            continue
+        other = other[['videoId'] + [c for c in other.columns if c not in df.columns]]
+        if other.shape[1] > 1:
+            df = df.merge(other, on='videoId', how='left')
+    return df
+
+def frame(columns=None):
+    """Per-video table (master_join, else videos + analytics) plus thumbnail features.
+
+    Only `columns` (plus videoId) are read from each source. The result is cached
+    per data version and shared read-only — copy before modifying.
+    """
+    return _frame(data_version(), tuple(sorted(columns)) if columns else None)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _json(path, digest):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def provenance():
+    digest = fingerprint(PROVENANCE)
+    base = {'synthetic': None, 'source': 'unknown', 'ts': None}
+    try:
+        return {**base, **_json(str(PROVENANCE), digest)} if digest else base
+    except Exception:
+        return base
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _csv(path, digest):
+    return pd.read_csv(path, index_col=0)
+
+def correlations():
+    path = REPORTS / 'correlations.csv'
+    digest = fingerprint(path)
+    return _csv(str(path), digest) if digest else pd.DataFrame()
+
+@st.cache_data(show_spinner='Generating insights…', max_entries=4)
+def _insights(version):
+    master = load('master_join.parquet')
+    if master.empty:
+        return None
+    return generate_insights_and_actions(master, provenance())
+
+def insights():
+    """Insights payload (rules, LLM narrative, critiques) computed once per data version."""
+    return _insights(data_version())
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _build_charts(fp):
+    # same loader as the pipeline stage, so both paths chart identical data
+    return chart_aggregates.build(chart_aggregates.load_frames(PROC), fp)
+
+def charts():
+    """Chart aggregates written by the pipeline when they match the current files, else built here once."""
+    digests = {k: fingerprint(PROC / v) for k, v in chart_aggregates.SOURCES.items()}
+    fp = chart_aggregates.fingerprint(digests)
+    digest = fingerprint(CHART_AGGREGATES)
+    if digest:
+        try:
+            agg = _json(str(CHART_AGGREGATES), digest)
+            if agg.get('fingerprint') == fp:
+                return agg
+        except Exception:
+            pass
+    return _build_charts(fp)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _png(fp, name):
+    return chart_aggregates.render(charts()['charts'][name])
+
+def chart_png(name):
+    """Rendered PNG for one chart (None if it has no data), cached on the aggregates' fingerprint."""
+    agg = charts()
+    if name not in agg['charts']:
+        return None
+    return _png(agg['fingerprint'], name)
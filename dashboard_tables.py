@@ -0,0 +1,125 @@
+
+import math
+import duckdb
+import pandas as pd
+import streamlit as st
+import dashboard_data as dd
+
+# Large tables are never materialised in pandas: sort, filter, count and aggregate
+# run in an embedded DuckDB over the Parquet files, and only the visible page is
+# fetched. Filters on videoId prune row groups because the comments export is
+# ordered by videoId.
+
+def _q(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def _pq(path):
+    return "read_parquet('" + str(path).replace("'", "''") + "')"
+
+def _views():
+    """view name -> (SQL, files it reads); only views whose files exist."""
+    master, videos = dd.PROC / 'master_join.parquet', dd.PROC / 'videos.parquet'
+    analytics, comments = dd.PROC / 'analytics_365d.parquet', dd.PROC / 'comments.parquet'
+    out = {}
+    if master.exists():
+        out['videos'] = (f'SELECT * FROM {_pq(master)}', (master,))
+    elif videos.exists() and analytics.exists():
+        out['videos'] = (f'SELECT * FROM {_pq(videos)} LEFT JOIN {_pq(analytics)} USING (videoId)', (videos, analytics))
+    elif videos.exists():
+        out['videos'] = (f'SELECT * FROM {_pq(videos)}', (videos,))
+    if comments.exists():
+        out['comments'] = (f'SELECT * FROM {_pq(comments)}', (comments,))
+        titles = f'(SELECT videoId, title FROM {_pq(videos)})' if videos.exists() else '(SELECT NULL::VARCHAR AS videoId, NULL::VARCHAR AS title)'
+        out['comment_counts'] = (
+            f"SELECT c.videoId, t.title, COUNT(*) AS comments, "
+            f"COUNT(*) FILTER (WHERE c.type = 'reply') AS replies, SUM(c.likeCount) AS likes, "
+            f"MAX(c.publishedAt) AS latest FROM {_pq(comments)} c LEFT JOIN {titles} t USING (videoId) "
+            f"GROUP BY c.videoId, t.title",
+            (comments, videos) if videos.exists() else (comments,))
+    return out
+
+@st.cache_resource(show_spinner=False)
+def _con():
+    # one in-memory database per process; each query runs on its own cursor
+    return duckdb.connect()
+
+def _version(files):
+    return tuple(dd.fingerprint(p) for p in files)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _schema(version, sql):
+    return [r[0] for r in _con().cursor().execute(f'DESCRIBE {sql}').fetchall()]
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def _count(version, sql, where, params):
+    return _con().cursor().execute(f'SELECT COUNT(*) FROM ({sql}) v{where}', list(params)).fetchone()[0]
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _page(version, sql, cols, where, params, order, limit, offset):
+    q = f'SELECT {cols} FROM ({sql}) v{where}{order} LIMIT {int(limit)} OFFSET {int(offset)}'
+    return _con().cursor().execute(q, list(params)).fetch_arrow_table().to_pandas()
+
+def schema(view):
+    views = _views()
+    if view not in views:
+        return []
+    sql, files = views[view]
+    return _schema(_version(files), sql)
+
+def _where(have, filters=None, contains=None):
+    clauses, params = [], []
+    for col, value in (filters or {}).items():
+        if col in have:
+            clauses.append(f'{_q(col)} = ?')
+            params.append(value)
+    if contains and contains[0] in have and contains[1]:
+        # typed text is literal: % and _ must not act as wildcards
+        text = contains[1].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append(f"{_q(contains[0])} ILIKE ? ESCAPE '\\'")
+        params.append(f'%{text}%')
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), tuple(params)
+
+def query(view, columns=None, filters=None, contains=None, sort=None, desc=False, limit=50, offset=0):
+    """One page of a view plus the filtered row count: (DataFrame, total).
+
+    `filters` is {column: value} equality, `contains` a (column, text) substring
+    match. Unknown columns are ignored; results are cached per file fingerprint.
+    """
+    views = _views()
+    if view not in views:
+        return pd.DataFrame(columns=columns or []), 0
+    sql, files = views[view]
+    version = _version(files)
+    have = _schema(version, sql)
+    cols = [c for c in (columns or have) if c in have]
+    where, params = _where(have, filters, contains)
+    order = f' ORDER BY {_q(sort)} {"DESC" if desc else "ASC"} NULLS LAST' if sort in have else ''
+    total = _count(version, sql, where, params)
+    page = _page(version, sql, ', '.join(_q(c) for c in cols), where, params, order, limit, offset)
+    return page, total
+
+def paged_table(view, columns, key, sort=None, desc=True, search_col=None, filters=None,
+                dates=(), page_sizes=(25, 50, 100, 250), **dataframe_kw):
+    """Sort/filter/page controls over a view; renders and returns the visible page."""
+    have = schema(view)
+    cols = [c for c in columns if c in have]
+    if not cols:
+        st.info(f"No {view.replace('_', ' ')} data available")
+        return pd.DataFrame()
+    c1, c2, c3, c4 = st.columns([3, 2, 1, 1])
+    text = c1.text_input('Filter', key=f'{key}_filter', placeholder=f'{search_col} contains…') if search_col in have else ''
+    sort = c2.selectbox('Sort by', cols, index=cols.index(sort) if sort in cols else 0, key=f'{key}_sort')
+    desc = c3.checkbox('Descending', value=desc, key=f'{key}_desc')
+    size = c4.selectbox('Rows', page_sizes, key=f'{key}_size')
+    contains = (search_col, text) if text else None
+    _, total = query(view, cols, filters, contains, sort, desc, limit=0)
+    pages = max(1, math.ceil(total / size))
+    page_no = st.number_input(f'Page (of {pages:,})', min_value=1, max_value=pages, value=1, key=f'{key}_page')
+    offset = (int(page_no) - 1) * size
+    page, total = query(view, cols, filters, contains, sort, desc, limit=size, offset=offset)
+    for c in dates:
+        if c in page.columns:
+            page[c] = pd.to_datetime(page[c], errors='coerce', utc=True).dt.strftime('%Y-%m-%d')
+    st.dataframe(page, use_container_width=True, hide_index=True, **dataframe_kw)
+    st.caption(f'Rows {offset + 1 if total else 0:,}–{offset + len(page):,} of {total:,}')
+    return page
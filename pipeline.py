@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import time
+import ast
+import hashlib
+import pathlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+
+ROOT = pathlib.Path(__file__).resolve().parent
+load_dotenv(ROOT / '.env')
+PD = os.getenv('PROCESSED_DIR', 'data/processed')
+RP = os.getenv('REPORTS_DIR', 'reports')
+STATE = ROOT / PD / 'pipeline_state.json'
+TIMINGS = ROOT / RP / 'pipeline_timings.json'
+
+def P(name): return f'{PD}/{name}'
+def R(name): return f'{RP}/{name}'
+
+# Each stage declares what it reads and writes; dependencies follow from that.
+# `external` stages talk to the APIs, so their inputs can't tell us whether the
+# world changed: they always run and are keyed on the content of what they wrote.
+# A stage's key also covers its script and the repo modules it imports; `code`
+# can list further files (e.g. data the script reads as configuration).
+STAGES = [
+    dict(name='fetch_videos', cmd=['scripts/fetch_videos.py'], external=True,
+         inputs=[], outputs=[P('videos.parquet'), P('thumbnails.parquet')]),
+    dict(name='fetch_analytics', cmd=['scripts/fetch_analytics.py', '--shard', 'day'], external=True,
+         inputs=[P('videos.parquet')], outputs=[P('analytics_365d.parquet'), P('analytics_daily.parquet')]),
+    dict(name='fetch_video_stats', cmd=['scripts/fetch_video_stats.py'], external=True,
+         inputs=[P('videos.parquet')], outputs=[P('dataapi_video_stats.parquet'), P('snapshots/video_stats')]),
+    dict(name='fetch_comments', cmd=['scripts/fetch_comments.py'], external=True, optional=True,
+         inputs=[P('videos.parquet')], outputs=[P('comments.parquet')]),
+    dict(name='fetch_captions', cmd=['scripts/fetch_captions.py'], external=True, optional=True,
+         inputs=[P('videos.parquet')], outputs=[P('captions_index.parquet')]),
+    dict(name='fetch_retention', cmd=['scripts/fetch_retention.py'], external=True, optional=True,
+         inputs=[P('videos.parquet')], outputs=[P('retention.parquet')]),
+    dict(name='thumbnail_scores', cmd=['analysis/thumbnail_scores.py'],
+         inputs=[P('thumbnails.parquet')], outputs=[P('thumbnail_features.parquet')], external=True),
+    dict(name='unify_metrics', cmd=['analysis/unify_metrics.py'],
+         inputs=[P('videos.parquet'), P('analytics_365d.parquet'), P('dataapi_video_stats.parquet')],
+         outputs=[P('master_join.parquet')]),
+    dict(name='caption_segments', cmd=['analysis/caption_segments.py'],
+         inputs=[P('captions_index.parquet')], outputs=[P('caption_segments.parquet')]),
+    dict(name='cross_analyze', cmd=['analysis/cross_analyze.py'],
+         inputs=[P('master_join.parquet'), P('caption_segments.parquet'), P('comments.parquet')],
+         outputs=[P('master_join.parquet'), P('title_windows.parquet'), R('correlations.csv')]),
+    dict(name='chart_aggregates', cmd=['analysis/chart_aggregates.py'],
+         inputs=[P('master_join.parquet'), P('videos.parquet'), P('analytics_365d.parquet'),
+                 P('thumbnail_features.parquet')], outputs=[P('chart_aggregates.json')]),
+    dict(name='retention_beats', cmd=['analysis/retention_beats.py'], optional=True,
+         inputs=[P('retention.parquet'), P('caption_segments.parquet'), P('master_join.parquet')],
+         outputs=[P('retention_beats.parquet'), R('retention_dropoffs.csv')]),
+    dict(name='search_index', cmd=['analysis/search_index.py'],
+         inputs=[P('caption_segments.parquet'), P('videos.parquet')], outputs=[P('search.sqlite')]),
+    dict(name='comment_topics', cmd=['analysis/comment_topics.py'], optional=True,
+         inputs=[P('comments.parquet')],
+         outputs=[P('comment_topics.parquet'), R('comment_topic_examples.csv')]),
+    dict(name='weekly_report', cmd=['analysis/run_weekly_report.py'], optional=True,
+         inputs=[P('master_join.parquet'), P('dataapi_video_stats.parquet'), P('snapshots/video_stats'),
+                 P('caption_segments.parquet')], outputs=[R('insights.md'), R('actions.csv')]),
+]
+
+def _producers():
+    # in declaration order, so a stage that rewrites its own input (cross_analyze)
+    # depends on the earlier writer rather than on itself
+    prod = {}
+    for st in STAGES:
+        for o in st['outputs']:
+            prod.setdefault(o, []).append(st['name'])
+    return prod
+
+def dependencies():
+    prod = _producers()
+    order = [st['name'] for st in STAGES]
+    deps = {}
+    for st in STAGES:
+        me = order.index(st['name'])
+        deps[st['name']] = sorted({p for i in st['inputs'] for p in prod.get(i, [])
+                                   if order.index(p) < me}, key=order.index)
+    return deps
+
+def fingerprint(rel, cache):
+    """Content hash + schema of a file, memoised on (size, mtime) in the state file.
+
+    A directory (a partitioned dataset such as the stats snapshots) hashes the
+    fingerprints of every file under it, so adding, replacing or compacting a
+    partition changes it.
+    """
+    p = ROOT / rel
+    if not p.exists():
+        return None
+    if p.is_dir():
+        prefix = rel.rstrip('/') + '/'
+        files = sorted(prefix + f.relative_to(p).as_posix() for f in p.rglob('*')
+                       if f.is_file() and not f.name.startswith('.'))
+        for gone in [k for k in cache if k.startswith(prefix) and k not in files]:
+            del cache[gone]  # partitions removed by compaction
+        parts = [f'{f}={fingerprint(f, cache)}' for f in files]
+        return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+    stt = p.stat()
+    stamp = f'{stt.st_size}:{stt.st_mtime_ns}'
+    hit = cache.get(rel)
+    if hit and hit['stamp'] == stamp:
+        return hit['fp']
+    h = hashlib.sha256()
+    with open(p, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    schema = ''
+    if p.suffix == '.parquet':
+        try:
+            import pyarrow.parquet as pq
+            schema = str(pq.read_schema(p))
+        except Exception:
+            pass
+    fp = hashlib.sha256(f'{h.hexdigest()}|{schema}'.encode()).hexdigest()
+    cache[rel] = {'stamp': stamp, 'fp': fp}
+    return fp
+
+# where a stage script's bare imports resolve: its own directory, then the
+# directories the analysis modules put on sys.path
+CODE_DIRS = [ROOT / 'scripts', ROOT / 'analysis', ROOT]
+
+def code_files(script, _seen=None):
+    """The stage script plus every repo module it imports, transitively (relative paths).
+
+    Third-party imports don't resolve to a file under the repo and are ignored.
+    """
+    seen = _seen if _seen is not None else {}
+    path = ROOT / script
+    if script in seen or not path.exists():
+        return sorted(seen)
+    seen[script] = True
+    try:
+        tree = ast.parse(path.read_text(encoding='utf-8'))
+    except (SyntaxError, UnicodeDecodeError):
+        return sorted(seen)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(a.name for a in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module)
+            names.update(f'{node.module}.{a.name}' for a in node.names)
+    for name in names:
+        rel = name.replace('.', '/')
+        for d in [path.parent] + CODE_DIRS:
+            for cand in (d / f'{rel}.py', d / rel / '__init__.py'):
+                if cand.exists():
+                    code_files(str(cand.relative_to(ROOT)), seen)
+                    break
+            else:
+                continue
+            break
+    return sorted(seen)
+
+def stage_key(st, deps, state):
+    """Inputs (minus the stage's own outputs), code and upstream output hashes, hashed together.
+
+    Upstream stages contribute the fingerprint of what they wrote when they last ran,
+    which covers inputs the stage later rewrites itself (cross_analyze → master_join).
+    """
+    files = state.setdefault('files', {})
+    parts = [' '.join(st['cmd'])]
+    # the script and the repo modules it imports: editing a helper invalidates the stage
+    parts += [f'{c}={fingerprint(c, files)}' for c in code_files(st['cmd'][0]) + st.get('code', [])]
+    parts += [f'{i}={fingerprint(i, files)}' for i in st['inputs'] if i not in st['outputs']]
+    parts += [f"{d}={state['stages'].get(d, {}).get('out')}" for d in deps]
+    return hashlib.sha256('\n'.join(map(str, parts)).encode()).hexdigest()
+
+def output_key(st, state):
+    files = state.setdefault('files', {})
+    parts = [f'{o}={fingerprint(o, files)}' for o in st['outputs']]
+    return hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+def run_stage(st):
+    t0 = time.time()
+    proc = subprocess.run([sys.executable] + st['cmd'], cwd=ROOT)
+    return proc.returncode, time.time() - t0
+
+def load_state():
+    if STATE.exists():
+        with open(STATE) as f:
+            return json.load(f)
+    return {'stages': {}, 'files': {}}
+
+def save_state(state):
+    STATE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, STATE)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Run the audit pipeline, rebuilding only stale stages.')
+    ap.add_argument('--force', action='store_true', help='rerun every stage')
+    ap.add_argument('--no-fetch', action='store_true', help='skip API stages and rebuild from existing data')
+    ap.add_argument('--only', nargs='*', help='run just these stages (and nothing downstream)')
+    ap.add_argument('--workers', type=int, default=int(os.getenv('PIPELINE_WORKERS', '4')))
+    ap.add_argument('--dry-run', action='store_true', help='print the plan without running anything')
+    args = ap.parse_args(argv)
+
+    deps = dependencies()
+    by_name = {st['name']: st for st in STAGES}
+    state = load_state()
+    state.setdefault('stages', {})
+    timings, failed = [], set()
+    pending = [st['name'] for st in STAGES if not args.only or st['name'] in args.only]
+    running = {}
+
+    def settle(name, status, seconds=0.0):
+        timings.append({'stage': name, 'status': status, 'seconds': round(seconds, 3)})
+        print(f'[pipeline] {name:<18} {status:<8} {seconds:7.1f}s', flush=True)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        while pending or running:
+            for name in list(pending):
+                st = by_name[name]
+                waiting = [d for d in deps[name] if d in pending or d in {n for n, _ in running.values()}]
+                if waiting:
+                    continue
+                pending.remove(name)
+                if any(d in failed for d in deps[name]):
+                    failed.add(name)
+                    settle(name, 'blocked')
+                    continue
+                if st.get('external') and args.no_fetch:
+                    settle(name, 'skipped')
+                    continue
+                key = None if st.get('external') else stage_key(st, deps[name], state)
+                fresh = key and key == state['stages'].get(name, {}).get('key') and \
+                    all((ROOT / o).exists() for o in st['outputs'])
+                if fresh and not args.force:
+                    settle(name, 'cached')
+                    continue
+                if args.dry_run:
+                    settle(name, 'would-run')
+                    continue
+                running[pool.submit(run_stage, st)] = (name, key)
+            if not running:
+                continue
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name, key = running.pop(fut)
+                st = by_name[name]
+                code, secs = fut.result()
+                if code != 0 and not st.get('optional'):
+                    failed.add(name)
+                    settle(name, 'failed', secs)
+                    continue
+                out = output_key(st, state)
+                # a failed optional stage leaves its previous outputs for downstream
+                # stages but records no key, so the next run retries it
+                state['stages'][name] = {'key': (key or out) if code == 0 else None, 'out': out, 'seconds': round(secs, 3),
+                                         'ts': int(time.time()), 'returncode': code}
+                settle(name, 'ok' if code == 0 else 'failed*', secs)
+                save_state(state)
+
+    if not args.dry_run:
+        save_state(state)
+        TIMINGS.parent.mkdir(parents=True, exist_ok=True)
+        with open(TIMINGS, 'w') as f:
+            json.dump({'ts': int(time.time()), 'stages': timings}, f, indent=2)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
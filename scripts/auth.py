@@ -1,11 +1,18 @@
 
+import os
+import time
 import pathlib
+import hashlib
 import json
+import threading
+import httplib2
+import google_auth_httplib2
 from google.oauth2 import service_account
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
+from googleapiclient.discovery_cache.base import Cache
 
 SCOPES = [
     'https://www.googleapis.com/auth/youtube.readonly',
@@ -15,6 +22,14 @@ SCOPES = [
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 CLIENT_SECRET = ROOT / 'client_secret.json'
+DISCOVERY_CACHE = ROOT / '.cache' / 'discovery'
+DISCOVERY_TTL = int(os.getenv('DISCOVERY_TTL', str(24 * 3600)))
+HTTP_TIMEOUT = int(os.getenv('HTTP_TIMEOUT', '60'))
+
+_creds_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_creds = {}
+_local = threading.local()
 
 def get_creds(token_name='token_default.json'):
     # Try service account first
@@ -28,7 +43,7 @@ def get_creds(token_name='token_default.json'):
                     )
         except Exception:
             pass
-    
+
     # Fallback to OAuth2 flow
     token_path = ROOT / token_name
     creds = None
@@ -44,10 +59,73 @@ def get_creds(token_name='token_default.json'):
             f.write(creds.to_json())
     return creds
 
+class DiscoveryFileCache(Cache):
+    """On-disk discovery document cache with a TTL (plugs into build(cache=...))."""
+    def __init__(self, root=DISCOVERY_CACHE, ttl=DISCOVERY_TTL):
+        self.root = pathlib.Path(root)
+        self.ttl = ttl
+
+    def _path(self, url):
+        return self.root / (hashlib.sha256(url.encode()).hexdigest()[:32] + '.json')
+
+    def get(self, url):
+        p = self._path(url)
+        try:
+            if time.time() - p.stat().st_mtime > self.ttl:
+                return None
+            return p.read_text(encoding='utf-8')
+        except OSError:
+            return None
+
+    def set(self, url, content):
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            p = self._path(url)
+            tmp = p.with_suffix(f'.tmp{os.getpid()}.{threading.get_ident()}')
+            tmp.write_text(content, encoding='utf-8')
+            os.replace(tmp, p)
+        except OSError:
+            pass  # caching is best-effort
+
+def _guard_refresh(creds):
+    # one thread refreshes; the others see the new token and skip their own refresh
+    if getattr(creds, '_refresh_guarded', False):
+        return creds
+    orig = creds.refresh
+    def refresh(request):
+        stale = creds.token
+        with _refresh_lock:
+            if creds.token != stale and creds.valid:
+                return
+            orig(request)
+    creds.refresh = refresh
+    creds._refresh_guarded = True
+    return creds
+
+def shared_creds(token_name='token_default.json'):
+    """Process-wide credentials, loaded once and refreshed behind a lock."""
+    with _creds_lock:
+        if token_name not in _creds:
+            _creds[token_name] = _guard_refresh(get_creds(token_name))
+        return _creds[token_name]
+
+def service(api, version, creds=None):
+    """Per-thread cached client with its own keep-alive HTTP connection.
+
+    googleapiclient/httplib2 objects are not thread-safe, so each thread gets its
+    own; discovery documents come from the on-disk cache instead of the network.
+    """
+    creds = _guard_refresh(creds) if creds else shared_creds()
+    key = (api, version, id(creds))
+    clients = _local.__dict__.setdefault('clients', {})
+    if key not in clients:
+        http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        clients[key] = build(api, version, http=http, cache=DiscoveryFileCache(),
+                             static_discovery=False)
+    return clients[key]
+
 def yt_service(creds=None):
-    creds = creds or get_creds()
-    return build('youtube', 'v3', credentials=creds, static_discovery=False)
+    return service('youtube', 'v3', creds)
 
 def yta_service(creds=None):
-    creds = creds or get_creds()
-    return build('youtubeAnalytics', 'v2', credentials=creds, static_discovery=False)
+    return service('youtubeAnalytics', 'v2', creds)
@@ -1,52 +1,222 @@
 
 import os
+import json
+import hashlib
 import pathlib
+import argparse
 import datetime as dt
 import pandas as pd
 from dotenv import load_dotenv
 from auth import yta_service
+from fetch_engine import FetchEngine, execute
+from quota_ledger import QuotaLedger
+import warehouse
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 load_dotenv(ROOT / '.env')
 PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
 CHANNEL_ID = os.getenv('YOUTUBE_CHANNEL_ID')
 
-# Per-video report: detailed metrics with video dimension (last 365d)
-def run_report(yta, start_date, end_date):  # strict hybrid
-    try:
-        # Per-video metrics with video dimension (using only supported metrics)
-        metrics = 'views,estimatedMinutesWatched,averageViewDuration'
-        dims = 'video'
-        resp = yta.reports().query(
+METRICS = 'views,estimatedMinutesWatched,averageViewDuration'
+PAGE_SIZE = 200  # video-dimension reports are capped at 200 rows per page
+
+def query_all(yta, start_date, end_date, metrics=METRICS, dims='video', sort='-views', engine=None, **extra):
+    """Run one report, following startIndex pages until a short page comes back."""
+    colnames, rows = None, []
+    start_index = 1
+    while True:
+        req = yta.reports().query(
             ids='channel==MINE',
             startDate=start_date, endDate=end_date,
             metrics=metrics,
             dimensions=dims,
-            maxResults=1000,
-            startIndex=1
-        ).execute()
-        cols = resp.get('columnHeaders', [])
-        colnames = [c['name'] for c in cols]
-        rows = resp.get('rows', [])
-        import pandas as pd
-        out = pd.DataFrame(rows, columns=colnames)
-        if out.empty:
-            raise RuntimeError("Analytics API returned no rows (per-video). Check owner OAuth/scopes/quota.")
-        return out
-    except Exception as e:
-        print(f"Analytics API error: {e}")
-        return None
+            sort=sort,
+            maxResults=PAGE_SIZE,
+            startIndex=start_index,
+            **extra
+        )
+        resp = execute(req, 'reports.query', engine)
+        colnames = colnames or [c['name'] for c in resp.get('columnHeaders', [])]
+        page = resp.get('rows', [])
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            break
+        start_index += PAGE_SIZE
+    return pd.DataFrame(rows, columns=colnames)
+
+CACHE = PROC / 'analytics_cache'
+
+# Query groups the API accepts as single reports. Metrics that cannot share a
+# report (impressions/CTR, traffic sources) get their own group; `per_video`
+# groups are fanned out one query per video and pivoted to columns.
+QUERY_GROUPS = {
+    'core': dict(metrics='views,estimatedMinutesWatched,averageViewDuration,averageViewPercentage,'
+                         'subscribersGained,likes,comments,shares',
+                 dims='video', sort='-views'),
+    'impressions': dict(metrics='videoThumbnailImpressions,videoThumbnailImpressionsClickRate',
+                        dims='video', sort='-videoThumbnailImpressions', optional=True,
+                        rename={'videoThumbnailImpressions': 'impressions',
+                                'videoThumbnailImpressionsClickRate': 'clickThroughRate'}),
+    'traffic': dict(metrics='views', dims='insightTrafficSourceType', sort='-views',
+                    optional=True, per_video=True, pivot='insightTrafficSourceType', prefix='traffic_'),
+}
+
+def cache_path(name, start_date, end_date):
+    spec = json.dumps(QUERY_GROUPS[name], sort_keys=True)
+    key = hashlib.sha256(f'{spec}|{start_date}|{end_date}'.encode()).hexdigest()[:12]
+    return CACHE / f'{name}_{start_date}_{end_date}_{key}.parquet'
+
+def save_cached(name, df, start_date, end_date):
+    """Cache one group's result and drop that group's files for older ranges or specs.
+
+    The end date moves every day, so without the pruning analytics_cache/ (and the
+    CI cache of data/) would gain one file per group per run.
+    """
+    path = cache_path(name, start_date, end_date)
+    tmp = path.with_name(f'.{path.name}.tmp')
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    for old in CACHE.glob(f'{name}_*.parquet'):
+        if old != path:
+            old.unlink(missing_ok=True)
+
+def plan(groups, video_ids, cached=()):
+    """Flatten query groups into independent tasks: (group, None) or (group, videoId)."""
+    tasks = []
+    for g in groups:
+        if g in cached:
+            continue
+        if QUERY_GROUPS[g].get('per_video'):
+            tasks.extend((g, v) for v in video_ids)
+        else:
+            tasks.append((g, None))
+    return tasks
+
+def run_task(yta, task, start_date, end_date, engine=None):
+    g, vid = task
+    spec = QUERY_GROUPS[g]
+    extra = {'filters': f'video=={vid}'} if vid else {}
+    df = query_all(yta, start_date, end_date, metrics=spec['metrics'], dims=spec['dims'],
+                   sort=spec['sort'], engine=engine, **extra)
+    if vid:
+        df.insert(0, 'videoId', vid)
+    return df.rename(columns={'video': 'videoId', **spec.get('rename', {})})
+
+def shape(g, frames):
+    """One group's task results → a table with one row per videoId."""
+    spec = QUERY_GROUPS[g]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['videoId'])
+    if spec.get('pivot') and not df.empty:
+        metric = spec['metrics'].split(',')[0]
+        df = df.pivot_table(index='videoId', columns=spec['pivot'], values=metric, aggfunc='sum', fill_value=0)
+        df.columns = [spec['prefix'] + str(c).lower() for c in df.columns]
+        df = df.reset_index()
+    return df
+
+def run_planned(start_date, end_date, video_ids, groups=tuple(QUERY_GROUPS), workers=None, refresh=False):
+    """Fetch every query group concurrently and join them column-wise on videoId.
+
+    Each group's result is cached per (query spec, date range) under analytics_cache/,
+    so reruns within the same range only query what is missing. Optional groups
+    (impressions/CTR, traffic) may fail — e.g. metrics unavailable to the channel —
+    and their columns are simply left out.
+    """
+    CACHE.mkdir(parents=True, exist_ok=True)
+    tables = {}
+    for g in groups:
+        p = cache_path(g, start_date, end_date)
+        if p.exists() and not refresh:
+            tables[g] = pd.read_parquet(p)
+    tasks = plan(groups, video_ids, cached=tables)
+    if tasks:
+        ledger = QuotaLedger('fetch_analytics')
+        engine = FetchEngine(yta_service, workers=workers, ledger=ledger)
+        results = engine.map(lambda t: run_task(engine.client(), t, start_date, end_date, engine),
+                             tasks, desc='analytics/groups')
+        ledger.flush()
+        for g in dict.fromkeys(t[0] for t in tasks):
+            mine = [t for t in tasks if t[0] == g]
+            got = [results[t] for t in mine if t in results]
+            if len(got) < len(mine):
+                msg = f'{g}: {len(mine) - len(got)} of {len(mine)} queries failed'
+                if not QUERY_GROUPS[g].get('optional'):
+                    raise RuntimeError(msg)
+                print('warning:', msg, '(partial result, not cached)')
+            tables[g] = shape(g, got)
+            if len(got) == len(mine):
+                save_cached(g, tables[g], start_date, end_date)
+
+    if 'core' in groups and tables.get('core', pd.DataFrame()).empty:
+        raise RuntimeError("Analytics API returned no rows (per-video). Check owner OAuth/scopes/quota.")
+    out = None
+    for g in groups:
+        t = tables.get(g)
+        if t is None or t.empty:
+            continue
+        out = t if out is None else out.merge(t, on='videoId', how='outer')
+    return out if out is not None else pd.DataFrame(columns=['videoId'])
+
+def date_shards(start, end, shard='day'):
+    """Split [start, end] into consecutive day or week (7-day) ranges."""
+    step = dt.timedelta(days=1 if shard == 'day' else 7)
+    d = start
+    while d <= end:
+        yield d, min(d + step - dt.timedelta(days=1), end)
+        d += step
+
+def run_sharded(start, end, shard='day', workers=None):
+    """Per-video metrics for each shard, fetched in parallel → long (videoId, day, metrics...) table.
+
+    `day` is the first date of the shard; with weekly shards metrics are 7-day totals.
+    """
+    ledger = QuotaLedger('fetch_analytics')
+    engine = FetchEngine(yta_service, workers=workers, ledger=ledger)
+    shards = list(date_shards(start, end, shard))
+
+    def one(rng):
+        a, b = rng
+        df = query_all(engine.client(), a.isoformat(), b.isoformat(), engine=engine)
+        return df.assign(day=a.isoformat())
+
+    frames = [f for f in engine.map(one, shards, desc=f'analytics/{shard}').values() if not f.empty]
+    ledger.flush()
+    if len(frames) < len(shards):
+        print(f'warning: {len(shards) - len(frames)} of {len(shards)} shards empty or failed')
+    if not frames:
+        return pd.DataFrame()
+    out = pd.concat(frames, ignore_index=True).rename(columns={'video': 'videoId'})
+    out['day'] = pd.to_datetime(out['day'])
+    cols = ['videoId', 'day'] + [c for c in out.columns if c not in ('videoId', 'day')]
+    return out[cols].sort_values(['videoId', 'day']).reset_index(drop=True)
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description='Fetch per-video YouTube Analytics.')
+    ap.add_argument('--days', type=int, default=365, help='size of the date range ending today')
+    ap.add_argument('--shard', choices=['day', 'week'], default=None,
+                    help='also write a long per-video time series (analytics_daily.parquet)')
+    ap.add_argument('--series-days', type=int, default=90, help='length of the sharded time series')
+    ap.add_argument('--workers', type=int, default=None, help='concurrent report queries')
+    ap.add_argument('--groups', nargs='+', choices=list(QUERY_GROUPS), default=list(QUERY_GROUPS),
+                    help='query groups joined into analytics_365d.parquet')
+    ap.add_argument('--refresh', action='store_true', help='ignore analytics_cache/ and re-query')
+    args = ap.parse_args()
     try:
-        yta = yta_service()
         end = dt.date.today()
-        start = end - dt.timedelta(days=365)
-        df = run_report(yta, start.isoformat(), end.isoformat())
-        if df is not None and not df.empty:
-            df.rename(columns={'video':'videoId'}, inplace=True)
-            df.to_parquet(PROC / 'analytics_365d.parquet', index=False)
-            print("Saved analytics ->", PROC / 'analytics_365d.parquet')
+        start = end - dt.timedelta(days=args.days)
+        if args.shard:
+            # Analytics data lags; stop the series at yesterday
+            ts = run_sharded(end - dt.timedelta(days=args.series_days), end - dt.timedelta(days=1),
+                             args.shard, args.workers)
+            if not ts.empty:
+                ts.to_parquet(PROC / 'analytics_daily.parquet', index=False)
+                print("Saved analytics time series ->", PROC / 'analytics_daily.parquet', "rows:", len(ts))
+        vids = pd.read_parquet(PROC / 'videos.parquet', columns=['videoId'])['videoId'].tolist()
+        df = run_planned(start.isoformat(), end.isoformat(), vids, groups=args.groups,
+                         workers=args.workers, refresh=args.refresh)
+        if not df.empty:
+            res = warehouse.sync('analytics', df, prune=True)
+            print("Saved analytics ->", PROC / 'analytics_365d.parquet',
+                  f"({len(df.columns) - 1} metric columns, {res['written']} rows changed)")
         else:
             print("No analytics data available. API quota exceeded or authentication failed.")
             raise RuntimeError("Analytics API returned no data. Check quota and authentication.")
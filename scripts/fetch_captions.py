@@ -1,42 +1,127 @@
 
 import os
+import hashlib
 import pathlib
+import argparse
+import datetime as dt
 import pandas as pd
 from dotenv import load_dotenv
 from auth import yt_service
+from quota_ledger import QuotaLedger
+import warehouse
+from fetch_engine import (FetchEngine, QuotaBudgetExceeded, BATCH_LIMIT, batch_execute, execute,
+                          estimate, print_estimate)
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 load_dotenv(ROOT / '.env')
 RAW = ROOT / os.getenv('RAW_DIR', 'data/raw')
 PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+# content-addressed store: objects/<sha[:2]>/<sha>.srt, shared by identical tracks
+OBJECTS = RAW / 'captions' / 'objects'
+INDEX_COLS = ['videoId', 'captionId', 'lang', 'lastUpdated', 'sha256', 'size', 'fetchedAt', 'file', 'changed']
 
-def list_and_download_captions(yt, vid):
-    resp = yt.captions().list(part='snippet', videoId=vid).execute()
+def store_object(data):
+    sha = hashlib.sha256(data).hexdigest()
+    path = OBJECTS / sha[:2] / f'{sha}.srt'
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f'.tmp{os.getpid()}')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return sha, path
+
+def load_cache():
+    """Previous index rows keyed by captionId (only rows with a stored object)."""
+    idx_path = PROC / 'captions_index.parquet'
+    if not idx_path.exists():
+        return {}
+    prev = pd.read_parquet(idx_path)
+    if 'sha256' not in prev.columns:
+        return {}
+    prev = prev.dropna(subset=['sha256', 'file'])
+    return {r['captionId']: r for r in prev.to_dict('records')}
+
+def list_captions(yt, vids, engine=None):
+    """captions().list for many videos packed into HTTP batches → {videoId: items}."""
+    calls = [(v, yt.captions().list(part='snippet', videoId=v)) for v in vids]
+    ok, failed = batch_execute(yt, calls, 'captions.list', engine)
+    for v, e in failed.items():
+        print('caption list error', v, e)
+    return {v: resp.get('items', []) for v, resp in ok.items()}
+
+def list_and_download_captions(yt, vid, engine=None, items=None, cache=None):
+    """Download tracks whose (captionId, lastUpdated) is not already cached."""
+    if items is None:
+        items = execute(yt.captions().list(part='snippet', videoId=vid), 'captions.list', engine).get('items', [])
+    cache = cache or {}
     rows = []
-    for it in resp.get('items', []):
+    for it in items:
         cap_id = it['id']
         lang = it['snippet'].get('language')
-        name = f"{vid}_{lang or 'und'}.srt"
+        updated = it['snippet'].get('lastUpdated')
+        prev = cache.get(cap_id)
+        if prev is not None and prev.get('lastUpdated') == updated and os.path.exists(prev['file']):
+            rows.append({**prev, 'videoId': vid, 'lang': lang, 'changed': False})
+            continue
+        row = {'videoId': vid, 'captionId': cap_id, 'lang': lang, 'lastUpdated': updated,
+               'sha256': None, 'size': None, 'fetchedAt': None, 'file': None, 'changed': False}
         try:
-            data = yt.captions().download(id=cap_id, tfmt='srt').execute()
-            (RAW / 'captions').mkdir(parents=True, exist_ok=True)
-            with open(RAW / 'captions' / name, 'wb') as f:
-                f.write(data)
-            rows.append({'videoId': vid, 'captionId': cap_id, 'lang': lang, 'file': str(RAW / 'captions' / name)})
+            data = execute(yt.captions().download(id=cap_id, tfmt='srt'), 'captions.download', engine)
+            sha, path = store_object(data)
+            row.update(sha256=sha, size=len(data), file=str(path),
+                       fetchedAt=dt.datetime.now(dt.timezone.utc).isoformat(timespec='seconds'),
+                       changed=prev is None or prev.get('sha256') != sha)
+        except QuotaBudgetExceeded:
+            raise
         except Exception:
-            rows.append({'videoId': vid, 'captionId': cap_id, 'lang': lang, 'file': None})
-    return pd.DataFrame(rows)
+            pass
+        rows.append(row)
+    return pd.DataFrame(rows, columns=INDEX_COLS)
+
+def quota_plan(cache):
+    # one list per video; downloads only for tracks not in the cache (upper bound:
+    # a cached track costs nothing unless its lastUpdated moved)
+    tracks = {}
+    idx_path = PROC / 'captions_index.parquet'
+    if idx_path.exists():
+        tracks = pd.read_parquet(idx_path, columns=['videoId']).groupby('videoId').size().to_dict()
+    cached = pd.Series([r['videoId'] for r in cache.values()], dtype=object).value_counts().to_dict()
+    return lambda vid: {'captions.list': 1, 'captions.download': max(tracks.get(vid, 1) - cached.get(vid, 0), 0)}
 
 if __name__ == "__main__":
-    yt = yt_service()
+    ap = argparse.ArgumentParser(description='List and download caption tracks.')
+    ap.add_argument('--workers', type=int, default=None, help='concurrent videos (default FETCH_WORKERS or 8)')
+    ap.add_argument('--dry-run', action='store_true', help='print the quota a full pass would cost and exit')
+    args = ap.parse_args()
+
     vids = pd.read_parquet(PROC / 'videos.parquet')['videoId'].tolist()
-    frames = []
-    for v in vids:
-        try:
-            frames.append(list_and_download_captions(yt, v))
-        except Exception as e:
-            print('caption error', v, e)
+    cache = load_cache()
+    if args.dry_run:
+        print_estimate(estimate(vids, quota_plan(cache)), f'captions for {len(vids)} videos')
+        print('  left today:', QuotaLedger('fetch_captions').remaining())
+        raise SystemExit(0)
+
+    ledger = QuotaLedger('fetch_captions')
+    engine = FetchEngine(yt_service, workers=args.workers, ledger=ledger)
+    chunks = [tuple(vids[i:i+BATCH_LIMIT]) for i in range(0, len(vids), BATCH_LIMIT)]
+    listed = {}
+    for part in engine.map(lambda c: list_captions(engine.client(), c, engine), chunks, desc='captions.list').values():
+        listed.update(part)
+    results = engine.map(lambda v: list_and_download_captions(engine.client(), v, engine, listed[v], cache),
+                         [v for v in vids if listed.get(v)], desc='captions')
+    frames = list(results.values())
+    # videos whose list/download failed this run keep their previous rows
+    done = set(results) | {v for v, items in listed.items() if not items}
+    carried = [r for r in cache.values() if r['videoId'] not in done]
+    if carried:
+        frames.append(pd.DataFrame(carried).assign(changed=False).reindex(columns=INDEX_COLS))
     if frames:
         out = pd.concat(frames, ignore_index=True)
-        out.to_parquet(PROC / 'captions_index.parquet', index=False)
-        print('Saved captions index →', PROC / 'captions_index.parquet')
+        # API order within a video, so the export keeps each video's primary track first
+        out['track'] = out.groupby('videoId').cumcount()
+        warehouse.sync('captions', out, prune=True)
+        print('Saved captions index →', PROC / 'captions_index.parquet',
+              f"({int(out['changed'].sum())} changed of {len(out)} tracks)")
+    ledger.flush()
+    print('quota spent:', engine.bucket.spent, '| left today:', ledger.remaining())
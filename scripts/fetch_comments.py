@@ -1,59 +1,170 @@
 
 import os
+import json
+import math
 import pathlib
+import argparse
 import pandas as pd
+import pyarrow.parquet as pq
 from dotenv import load_dotenv
-from tqdm import tqdm
 from auth import yt_service
+from quota_ledger import QuotaLedger
+import warehouse
+from fetch_engine import FetchEngine, execute, estimate, print_estimate
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 load_dotenv(ROOT / '.env')
 PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+# per-video high-water marks: newest thread publishedAt + known thread signatures
+STATE = PROC / 'comments_watermarks.json'
 
-def fetch_comments_for_video(yt, vid):
+COLUMNS = ['videoId', 'threadId', 'commentId', 'type', 'text', 'likeCount',
+           'publishedAt', 'updatedAt', 'totalReplyCount']
+
+def _thread_sig(updated_at, reply_count):
+    # changes when the top comment is edited or the thread gains/loses replies
+    return f"{updated_at or ''}|{int(reply_count or 0)}"
+
+def _thread_rows(vid, it):
+    tid = it['id']
+    top_c = it['snippet']['topLevelComment']
+    top = top_c['snippet']
+    rows = [{
+        'videoId': vid,
+        'threadId': tid,
+        'commentId': top_c.get('id', tid),
+        'type': 'top',
+        'text': top.get('textDisplay',''),
+        'likeCount': top.get('likeCount',0),
+        'publishedAt': top.get('publishedAt'),
+        'updatedAt': top.get('updatedAt'),
+        'totalReplyCount': it['snippet'].get('totalReplyCount', 0)
+    }]
+    for r in it.get('replies', {}).get('comments', []):
+        rs = r['snippet']
+        rows.append({
+            'videoId': vid,
+            'threadId': tid,
+            'commentId': r.get('id'),
+            'type': 'reply',
+            'text': rs.get('textDisplay',''),
+            'likeCount': rs.get('likeCount',0),
+            'publishedAt': rs.get('publishedAt'),
+            'updatedAt': rs.get('updatedAt'),
+            'totalReplyCount': None
+        })
+    return rows
+
+def fetch_comments_for_video(yt, vid, watermark=None, engine=None):
+    """Walk comment threads newest-first.
+
+    With a watermark, paging stops after the first page that reaches threads
+    published at or before the stored high-water mark; threads on that page are
+    only kept when they are unknown or their signature changed (edit/new reply).
+    """
+    since = (watermark or {}).get('publishedAt')
+    known = (watermark or {}).get('threads', {})
     allrows = []
     pageToken=None
     while True:
-        resp = yt.commentThreads().list(
+        req = yt.commentThreads().list(
             part='snippet,replies',
             videoId=vid,
             maxResults=100,
+            order='time',
             pageToken=pageToken,
             textFormat='plainText'
-        ).execute()
+        )
+        resp = execute(req, 'commentThreads.list', engine)
+        reached = False
         for it in resp.get('items', []):
-            top = it['snippet']['topLevelComment']['snippet']
-            allrows.append({
-                'videoId': vid,
-                'type': 'top',
-                'text': top.get('textDisplay',''),
-                'likeCount': top.get('likeCount',0),
-                'publishedAt': top.get('publishedAt')
-            })
-            for r in it.get('replies', {}).get('comments', []):
-                rs = r['snippet']
-                allrows.append({
-                    'videoId': vid,
-                    'type': 'reply',
-                    'text': rs.get('textDisplay',''),
-                    'likeCount': rs.get('likeCount',0),
-                    'publishedAt': rs.get('publishedAt')
-                })
+            sn = it['snippet']
+            top = sn['topLevelComment']['snippet']
+            if since and (top.get('publishedAt') or '') <= since:
+                reached = True
+                if known.get(it['id']) == _thread_sig(top.get('updatedAt'), sn.get('totalReplyCount')):
+                    continue
+            allrows.extend(_thread_rows(vid, it))
         pageToken = resp.get('nextPageToken')
-        if not pageToken:
+        if reached or not pageToken:
             break
-    return pd.DataFrame(allrows)
+    return pd.DataFrame(allrows, columns=COLUMNS)
+
+def update_watermark(watermark, fresh):
+    wm = dict(watermark or {})
+    threads = dict(wm.get('threads', {}))
+    top = fresh[fresh['type'] == 'top']
+    for tid, upd, n in zip(top['threadId'], top['updatedAt'], top['totalReplyCount']):
+        threads[tid] = _thread_sig(upd, n)
+    latest = max([wm.get('publishedAt') or ''] + top['publishedAt'].dropna().tolist())
+    return {'publishedAt': latest or None, 'threads': threads}
+
+def quota_plan(state):
+    # a known video usually stops on its first page; otherwise one call per 100 threads
+    counts = {}
+    stats_path = PROC / 'dataapi_video_stats.parquet'
+    if stats_path.exists():
+        st = pd.read_parquet(stats_path, columns=['videoId', 'commentCount'])
+        counts = dict(zip(st['videoId'], st['commentCount'].fillna(0)))
+    def plan(vid):
+        if state.get(vid):
+            return {'commentThreads.list': 1}
+        return {'commentThreads.list': max(1, math.ceil(counts.get(vid, 0) / 100))}
+    return plan
+
+def load_state():
+    if STATE.exists():
+        with open(STATE, 'r') as f:
+            return json.load(f)
+    return {}
+
+def save_state(state):
+    tmp = STATE.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, STATE)
 
 if __name__ == "__main__":
-    yt = yt_service()
+    ap = argparse.ArgumentParser(description='Fetch comment threads (incremental by default).')
+    ap.add_argument('--full-resync', action='store_true', help='ignore watermarks and refetch every thread')
+    ap.add_argument('--workers', type=int, default=None, help='concurrent videos (default FETCH_WORKERS or 8)')
+    ap.add_argument('--dry-run', action='store_true', help='print the quota a full pass would cost and exit')
+    args = ap.parse_args()
+
     vids = pd.read_parquet(PROC / 'videos.parquet')['videoId'].tolist()
+    out_path = PROC / 'comments.parquet'
+    full = args.full_resync
+    if out_path.exists() and 'threadId' not in pq.read_schema(out_path).names:
+        print('comments.parquet predates incremental sync → full resync')
+        full = True
+    state = {} if full else load_state()
+
+    if args.dry_run:
+        print_estimate(estimate(vids, quota_plan(state)), f'comments for {len(vids)} videos')
+        print('  left today:', QuotaLedger('fetch_comments').remaining())
+        raise SystemExit(0)
+
+    ledger = QuotaLedger('fetch_comments')
+    engine = FetchEngine(yt_service, workers=args.workers, ledger=ledger)
+    results = engine.map(lambda v: fetch_comments_for_video(engine.client(), v, state.get(v), engine),
+                         vids, desc='comments')
     frames = []
-    for v in tqdm(vids, desc='comments'):
-        try:
-            frames.append(fetch_comments_for_video(yt, v))
-        except Exception as e:
-            print('error', v, e)
+    for v, fresh in results.items():
+        state[v] = update_watermark(state.get(v), fresh)
+        frames.append(fresh)
     if frames:
-        out = pd.concat(frames, ignore_index=True)
-        out.to_parquet(PROC / 'comments.parquet', index=False)
-        print('Saved comments →', PROC / 'comments.parquet')
+        fresh = pd.concat(frames, ignore_index=True)
+        # replace whole threads so edited comments and new replies land exactly once.
+        # A full resync replaces the table only when every video was fetched; videos
+        # that failed (errors, quota) keep their stored comments.
+        complete = len(results) == len(vids)
+        if complete or not full:
+            res = warehouse.sync('comments', fresh, prune=full, replace_groups=None if full else 'threadId')
+        else:
+            print(f'warning: {len(vids) - len(results)} of {len(vids)} videos failed; replacing only fetched videos')
+            res = warehouse.sync('comments', fresh, replace_groups='videoId')
+        save_state(state)
+        print('Saved comments →', out_path, f"({res['written']} new/changed rows, {res['deleted']} removed,",
+              f"{warehouse.count('comments')} total)")
+    ledger.flush()
+    print('quota spent:', engine.bucket.spent, '| left today:', ledger.remaining())
@@ -0,0 +1,243 @@
+
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+
+# Data API v3 quota units per call (https://developers.google.com/youtube/v3/determine_quota_cost)
+QUOTA_COST = {
+    'channels.list': 1,
+    'playlistItems.list': 1,
+    'videos.list': 1,
+    'commentThreads.list': 1,
+    'captions.list': 50,
+    'captions.download': 200,
+    'reports.query': 1,  # Analytics API has its own quota; tracked for visibility
+}
+RATE_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+RETRY_REASONS = RATE_REASONS | {'quotaExceeded'}
+BATCH_LIMIT = 50  # calls per HTTP batch request
+
+class QuotaBudgetExceeded(RuntimeError):
+    pass
+
+def error_reason(exc):
+    """Return the API error reason (e.g. 'quotaExceeded') of an HttpError, else None."""
+    details = getattr(exc, 'error_details', None) or []
+    for d in details if isinstance(details, list) else []:
+        if isinstance(d, dict) and d.get('reason'):
+            return d['reason']
+    content = getattr(exc, 'content', b'') or b''
+    for reason in RETRY_REASONS:
+        if reason.encode() in content:
+            return reason
+    status = getattr(getattr(exc, 'resp', None), 'status', None)
+    if status == 429:
+        return 'rateLimitExceeded'
+    return None
+
+class TokenBucket:
+    """Thread-safe token bucket measured in quota units.
+
+    `rate` units refill per second up to `capacity`; `budget` (optional) is a hard
+    ceiling on total units this process may spend.
+    """
+    def __init__(self, rate=50.0, capacity=500, budget=None, ledger=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.budget = budget
+        self.ledger = ledger
+        self.tokens = float(capacity)
+        self.spent = {}
+        self._last = time.monotonic()
+        self._cond = threading.Condition()
+
+    def total(self):
+        with self._cond:
+            return sum(self.spent.values())
+
+    def acquire(self, kind, n=1):
+        units = QUOTA_COST.get(kind, 1) * n
+        with self._cond:
+            if self.budget is not None and sum(self.spent.values()) + units > self.budget:
+                raise QuotaBudgetExceeded(f'{kind} needs {units} units; budget {self.budget} exhausted')
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+                self._last = now
+                # a call costing more than the bucket holds waits for a full bucket
+                need = min(units, self.capacity)
+                if self.tokens >= need:
+                    self.tokens -= need
+                    self.spent[kind] = self.spent.get(kind, 0) + units
+                    if self.ledger:
+                        self.ledger.record(kind, units)
+                    return units
+                self._cond.wait((need - self.tokens) / self.rate)
+
+class AdaptiveLimiter:
+    """AIMD pacing between calls, accounted per API call.
+
+    `delay` is the spacing per call: an HTTP batch of n calls books n slots, so
+    the pace is the same whether calls go one by one or 50 to a round trip.
+    The delay shrinks multiplicatively while calls succeed and doubles on rate
+    errors; backoff sleeps use full jitter so parallel clients don't retry in step.
+    """
+    def __init__(self, delay=0.6, min_delay=0.05, max_delay=60.0, decrease=0.8):
+        self.delay = delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.decrease = decrease
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self, n=1):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.delay * n
+        if start > now:
+            time.sleep(start - now)
+
+    def success(self):
+        with self._lock:
+            self.delay = max(self.min_delay, self.delay * self.decrease)
+
+    def throttled(self, attempt, n=1):
+        """Double the delay and sleep a jittered backoff sized for the `n` calls about to be retried."""
+        with self._lock:
+            self.delay = min(self.max_delay, max(self.delay, self.min_delay) * 2)
+            cap = min(self.max_delay, self.delay * n * (2 ** attempt))
+        time.sleep(random.uniform(0, cap))
+
+class FetchEngine:
+    """Bounded worker pool sharing one quota bucket.
+
+    `service_factory` is called once per worker thread, since googleapiclient
+    service objects are not thread-safe (auth.yt_service/yta_service already
+    cache one client per thread).
+    """
+    def __init__(self, service_factory, workers=None, bucket=None, max_retries=5, base_delay=1.0, ledger=None):
+        self.service_factory = service_factory
+        self.workers = workers or int(os.getenv('FETCH_WORKERS', '8'))
+        self.bucket = bucket or TokenBucket(
+            rate=float(os.getenv('QUOTA_RATE', '50')),
+            capacity=float(os.getenv('QUOTA_BURST', '500')),
+            budget=int(os.getenv('QUOTA_BUDGET')) if os.getenv('QUOTA_BUDGET') else None,
+            ledger=ledger,
+        )
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._local = threading.local()
+
+    def client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.service_factory()
+        return self._local.client
+
+    def execute(self, request, kind):
+        """Charge `kind` against the bucket and execute, retrying rate/quota 403s with backoff."""
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire(kind)
+            try:
+                return request.execute()
+            except Exception as e:
+                if error_reason(e) not in RETRY_REASONS or attempt == self.max_retries:
+                    raise
+                time.sleep(self.base_delay * (2 ** attempt) + random.uniform(0, self.base_delay))
+
+    def map(self, fn, items, desc=None):
+        """Run fn(item) concurrently; returns {item: result}. Failed items are reported and omitted."""
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futs = {pool.submit(fn, it): it for it in items}
+            for fut in tqdm(as_completed(futs), total=len(futs), desc=desc):
+                it = futs[fut]
+                try:
+                    results[it] = fut.result()
+                except QuotaBudgetExceeded as e:
+                    print('quota budget exhausted', it, e)
+                except Exception as e:
+                    print('error', it, e)
+        return results
+
+def execute(request, kind, engine=None):
+    return engine.execute(request, kind) if engine else request.execute()
+
+def batch_execute(yt, calls, kind, engine=None, size=BATCH_LIMIT, max_retries=5, base_delay=1.0,
+                  limiter=None, ledger=None, retry_reasons=RETRY_REASONS):
+    """Send independent requests packed into HTTP batches of `size` calls.
+
+    `calls` is a list of (key, request). Returns ({key: response}, {key: exception}).
+    Per-item errors are collected in the batch callback so one bad video does not
+    fail the others; items rejected for `retry_reasons` are re-batched with backoff
+    (paced by `limiter` when given, per call rather than per round trip). A batch
+    refused as a whole for one of those reasons is retried the same way. Spend is
+    charged to the engine's bucket, or recorded directly in `ledger` when running
+    without an engine.
+    """
+    ok, failed = {}, {}
+    pending = list(calls)
+    for attempt in range(max_retries + 1):
+        retry = []
+        for i in range(0, len(pending), size):
+            chunk = pending[i:i+size]
+            by_id = {str(n): item for n, item in enumerate(chunk)}
+
+            def callback(request_id, response, exception, by_id=by_id):
+                key, req = by_id[request_id]
+                if exception is None:
+                    ok[key] = response
+                    failed.pop(key, None)
+                elif error_reason(exception) in retry_reasons and attempt < max_retries:
+                    retry.append((key, req))
+                else:
+                    failed[key] = exception
+
+            batch = yt.new_batch_http_request(callback=callback)
+            for request_id, (_, req) in by_id.items():
+                batch.add(req, request_id=request_id)
+            if engine:
+                engine.bucket.acquire(kind, len(chunk))
+            elif ledger:
+                ledger.record(kind, QUOTA_COST.get(kind, 1) * len(chunk))
+            if limiter:
+                limiter.wait(len(chunk))
+            n_retry = len(retry)
+            try:
+                batch.execute()
+            except Exception as e:
+                # the round trip itself was refused: every call in it shares the error
+                if error_reason(e) not in retry_reasons:
+                    raise
+                if attempt < max_retries:
+                    retry.extend(chunk)
+                else:
+                    failed.update((key, e) for key, _ in chunk)
+            if limiter and len(retry) == n_retry:
+                limiter.success()
+        if not retry:
+            break
+        pending = retry
+        if limiter:
+            limiter.throttled(attempt, len(retry))
+        else:
+            time.sleep(base_delay * (2 ** attempt) + random.uniform(0, base_delay))
+    return ok, failed
+
+def estimate(items, plan):
+    """Sum quota units for a full pass. `plan(item)` returns {kind: calls}."""
+    per_kind = {}
+    for it in items:
+        for kind, calls in plan(it).items():
+            per_kind[kind] = per_kind.get(kind, 0) + QUOTA_COST.get(kind, 1) * calls
+    return per_kind
+
+def print_estimate(per_kind, label):
+    total = sum(per_kind.values())
+    print(f'[dry-run] {label}: {total} quota units')
+    for kind, units in sorted(per_kind.items()):
+        print(f'  {kind:<22} {units}')
+    return total
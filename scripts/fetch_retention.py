@@ -0,0 +1,60 @@
+
+import os
+import pathlib
+import argparse
+import datetime as dt
+import pandas as pd
+from dotenv import load_dotenv
+from auth import yta_service
+from fetch_engine import FetchEngine, execute, estimate, print_estimate
+from quota_ledger import QuotaLedger
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+
+METRICS = 'audienceWatchRatio,relativeRetentionPerformance'
+COLUMNS = ['videoId', 'elapsedVideoTimeRatio', 'audienceWatchRatio', 'relativeRetentionPerformance']
+
+def fetch_retention(yta, vid, start_date, end_date, engine=None):
+    """Audience retention curve for one video (~100 points over elapsedVideoTimeRatio 0.01..1)."""
+    req = yta.reports().query(
+        ids='channel==MINE',
+        startDate=start_date, endDate=end_date,
+        metrics=METRICS,
+        dimensions='elapsedVideoTimeRatio',
+        filters=f'video=={vid}',
+        sort='elapsedVideoTimeRatio'
+    )
+    resp = execute(req, 'reports.query', engine)
+    cols = [c['name'] for c in resp.get('columnHeaders', [])]
+    out = pd.DataFrame(resp.get('rows', []), columns=cols)
+    out.insert(0, 'videoId', vid)
+    return out.reindex(columns=COLUMNS)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description='Fetch per-video audience retention curves.')
+    ap.add_argument('--days', type=int, default=365, help='size of the date range ending today')
+    ap.add_argument('--workers', type=int, default=None, help='concurrent videos (default FETCH_WORKERS or 8)')
+    ap.add_argument('--dry-run', action='store_true', help='print the number of report queries and exit')
+    args = ap.parse_args()
+
+    vids = pd.read_parquet(PROC / 'videos.parquet')['videoId'].tolist()
+    if args.dry_run:
+        print_estimate(estimate(vids, lambda v: {'reports.query': 1}), f'retention for {len(vids)} videos')
+        raise SystemExit(0)
+
+    end = dt.date.today()
+    start = end - dt.timedelta(days=args.days)
+    ledger = QuotaLedger('fetch_retention')
+    engine = FetchEngine(yta_service, workers=args.workers, ledger=ledger)
+    results = engine.map(lambda v: fetch_retention(engine.client(), v, start.isoformat(), end.isoformat(), engine),
+                         vids, desc='retention')
+    ledger.flush()
+    frames = [f for f in results.values() if not f.empty]
+    if frames:
+        out = pd.concat(frames, ignore_index=True)
+        out.to_parquet(PROC / 'retention.parquet', index=False)
+        print('Saved retention →', PROC / 'retention.parquet', f'({len(frames)} videos)')
+    else:
+        print('No retention data returned (owner OAuth + yt-analytics scope required).')
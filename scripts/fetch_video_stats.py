@@ -1,35 +1,75 @@
-import os, time, pathlib
+import os, math, pathlib
 import pandas as pd
 from dotenv import load_dotenv
 from auth import yt_service
+from fetch_engine import AdaptiveLimiter, RATE_REASONS, batch_execute, error_reason
+from quota_ledger import QuotaLedger
+import warehouse
+import snapshots
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 load_dotenv(ROOT / '.env')
 PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
 
 BATCH=50
-SLEEP=0.6  # gentle backoff
+HTTP_BATCH=50  # videos.list calls per HTTP batch request
+SLEEP=0.6 / HTTP_BATCH  # starting delay per videos.list call (0.6s per full HTTP batch); adapts to throttling
+
+def _stat_row(it):
+    st = it.get("statistics", {})
+    return {
+        "videoId": it["id"],
+        "viewCount": int(st.get("viewCount", 0)) if st.get("viewCount") else None,
+        "likeCount": int(st.get("likeCount", 0)) if st.get("likeCount") else None,
+        "commentCount": int(st.get("commentCount", 0)) if st.get("commentCount") else None,
+    }
 
 def main():
     yt = yt_service()
+    ledger = QuotaLedger("fetch_video_stats")
+    limiter = AdaptiveLimiter(delay=SLEEP, min_delay=SLEEP / 10)
     vids = pd.read_parquet(PROC / 'videos.parquet')
     ids = vids['videoId'].dropna().unique().tolist()
+
+    need = math.ceil(len(ids) / BATCH)
+    left = ledger.remaining()
+    print(f"quota: need {need} units, {left} left today")
+    if left < need:
+        # spend what's left on the first videos rather than failing outright
+        ids = ids[:max(left, 0) * BATCH]
+        print(f"warning: daily budget short, fetching {len(ids)} videos")
+
     rows = []
-    for i in range(0, len(ids), BATCH):
-        sub = ids[i:i+BATCH]
-        resp = yt.videos().list(part="statistics", id=",".join(sub)).execute()
-        for it in resp.get("items", []):
-            st = it.get("statistics", {})
-            rows.append({
-                "videoId": it["id"],
-                "viewCount": int(st.get("viewCount", 0)) if st.get("viewCount") else None,
-                "likeCount": int(st.get("likeCount", 0)) if st.get("likeCount") else None,
-                "commentCount": int(st.get("commentCount", 0)) if st.get("commentCount") else None,
-            })
-        time.sleep(SLEEP)
-    out = pd.DataFrame(rows)
-    out.to_parquet(PROC / "dataapi_video_stats.parquet", index=False)
-    print("Saved ->", PROC / "dataapi_video_stats.parquet", "rows:", len(out))
+    try:
+        # HTTP_BATCH videos.list calls (BATCH ids each) share one HTTP round trip
+        for j in range(0, len(ids), BATCH * HTTP_BATCH):
+            calls = [(i, yt.videos().list(part="statistics", id=",".join(ids[i:i+BATCH])))
+                     for i in range(j, min(j + BATCH * HTTP_BATCH, len(ids)), BATCH)]
+            ok, failed = batch_execute(yt, calls, "videos.list", limiter=limiter, ledger=ledger,
+                                       retry_reasons=RATE_REASONS)
+            for i in sorted(ok):
+                rows.extend(_stat_row(it) for it in ok[i].get("items", []))
+            for i, e in failed.items():
+                print(f"stats error (ids {i}-{i+BATCH-1})", e)
+            if any(error_reason(e) == "quotaExceeded" for e in failed.values()):
+                print("daily quota exhausted — keeping partial results")
+                break
+    except Exception as e:
+        if error_reason(e) != "quotaExceeded":
+            raise
+        print("daily quota exhausted — keeping partial results")
+    finally:
+        ledger.flush()
+
+    out = pd.DataFrame(rows, columns=["videoId", "viewCount", "likeCount", "commentCount"])
+    # keyed upsert: videos we could not refresh keep their last known stats
+    res = warehouse.sync("video_stats", out)
+    if not out.empty:
+        # append-only daily history for velocity metrics; finished months are compacted
+        snapshots.write_snapshot(out)
+        snapshots.compact()
+    print("Saved ->", PROC / "dataapi_video_stats.parquet", "fetched:", len(out), "changed:", res["written"],
+          "| delay now", round(limiter.delay * 1000, 1), "ms/call")
 
 if __name__ == "__main__":
     main()
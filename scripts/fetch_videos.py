@@ -1,15 +1,28 @@
 
 import os
+import re
 import pathlib
 import pandas as pd
 from dotenv import load_dotenv
 from auth import yt_service
+from fetch_engine import batch_execute
+from quota_ledger import QuotaLedger
+import warehouse
 
 ROOT = pathlib.Path(__file__).resolve().parents[1]
 load_dotenv(ROOT / '.env')
 RAW = ROOT / os.getenv('RAW_DIR', 'data/raw')
 PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
 CHANNEL_ID = os.getenv('YOUTUBE_CHANNEL_ID')
+ISO_DURATION = re.compile(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?')
+
+def iso_seconds(value):
+    # contentDetails.duration, e.g. PT1H2M3S; live/upcoming videos report P0D
+    m = ISO_DURATION.fullmatch(value or '')
+    if not m:
+        return None
+    d, h, mi, s = (int(x or 0) for x in m.groups())
+    return d * 86400 + h * 3600 + mi * 60 + s
 
 def get_uploads_playlist_id(yt):
     resp = yt.channels().list(part='contentDetails', id=CHANNEL_ID).execute()
@@ -37,29 +50,40 @@ def fetch_all_videos(yt, uploads_playlist_id):
             break
     return pd.DataFrame(vids)
 
-def fetch_thumbnails(yt, video_ids):
+def fetch_thumbnails(yt, video_ids, ledger=None):
     # Download default thumbnail for quick features
     (ROOT / 'data/raw/thumbnails').mkdir(parents=True, exist_ok=True)
-    resp = yt.videos().list(part='snippet', id=','.join(video_ids[:50])).execute()  # batch 50 at a time in caller
+    # 50 ids per videos.list call, many calls per HTTP batch
+    # contentDetails rides along at no extra quota for durationSec
+    calls = [(i, yt.videos().list(part='snippet,contentDetails', id=','.join(video_ids[i:i+50])))
+             for i in range(0, len(video_ids), 50)]
+    ok, failed = batch_execute(yt, calls, 'videos.list', ledger=ledger)
+    for i, e in failed.items():
+        print(f'thumbnail lookup error (ids {i}-{i+49})', e)
     rows = []
-    for it in resp.get('items', []):
-        sn = it['snippet']
-        thumbs = sn.get('thumbnails', {})
-        pick = thumbs.get('maxres') or thumbs.get('standard') or thumbs.get('high') or thumbs.get('medium') or thumbs.get('default')
-        url = pick['url'] if pick else None
-        rows.append({'videoId': it['id'], 'thumbnail': url})
+    for i in sorted(ok):
+        for it in ok[i].get('items', []):
+            sn = it['snippet']
+            thumbs = sn.get('thumbnails', {})
+            pick = thumbs.get('maxres') or thumbs.get('standard') or thumbs.get('high') or thumbs.get('medium') or thumbs.get('default')
+            url = pick['url'] if pick else None
+            rows.append({'videoId': it['id'], 'thumbnail': url,
+                         'durationSec': iso_seconds(it.get('contentDetails', {}).get('duration'))})
     return pd.DataFrame(rows)
 
 if __name__ == "__main__":
     yt = yt_service()
     uploads = get_uploads_playlist_id(yt)
     df = fetch_all_videos(yt, uploads)
-    df.to_parquet(PROC / 'videos.parquet', index=False)
     # thumbnails urls (download later in analysis step if needed)
-    thumb_rows = []
-    for i in range(0, len(df), 50):
-        thumb_rows.append(fetch_thumbnails(yt, df['videoId'].iloc[i:i+50].tolist()))
-    if thumb_rows:
-        thumbs = pd.concat(thumb_rows, ignore_index=True)
-        thumbs.to_parquet(PROC / 'thumbnails.parquet', index=False)
-    print(f"Saved {len(df)} videos -> {PROC/'videos.parquet'} and thumbnails map.")
+    ledger = QuotaLedger('fetch_videos')
+    ledger.record('channels.list', 1)
+    ledger.record('playlistItems.list', max(1, (len(df) + 49) // 50))
+    thumbs = fetch_thumbnails(yt, df['videoId'].tolist(), ledger)
+    ledger.flush()
+    if not thumbs.empty:
+        df = df.merge(thumbs[['videoId', 'durationSec']], on='videoId', how='left')
+        thumbs[['videoId', 'thumbnail']].to_parquet(PROC / 'thumbnails.parquet', index=False)
+    res = warehouse.sync('videos', df, prune=True)
+    print(f"Saved {len(df)} videos -> {PROC/'videos.parquet'} and thumbnails map.",
+          f"({res['written']} changed, {res['deleted']} removed)")
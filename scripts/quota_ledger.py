@@ -0,0 +1,82 @@
+
+import os
+import json
+import pathlib
+import threading
+import datetime as dt
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, single-writer use only
+    fcntl = None
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+LEDGER = PROC / 'quota_ledger.json'
+DAILY_QUOTA = int(os.getenv('YT_DAILY_QUOTA', '10000'))
+
+def quota_day(now=None):
+    # Data API quota resets at midnight Pacific time
+    now = now or dt.datetime.now(dt.timezone.utc)
+    return now.astimezone(ZoneInfo('America/Los_Angeles')).date().isoformat()
+
+class QuotaLedger:
+    """Persistent {day: {script: {endpoint: units}}} ledger of Data API spend.
+
+    Units are accumulated in memory and merged into the JSON file by `flush()`,
+    under a file lock so parallel pipeline stages don't lose each other's counts.
+    """
+    def __init__(self, script, path=LEDGER):
+        self.script = script
+        self.path = pathlib.Path(path)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, units):
+        day = quota_day()
+        with self._lock:
+            per_ep = self._pending.setdefault(day, {})
+            per_ep[endpoint] = per_ep.get(endpoint, 0) + units
+
+    def _read(self):
+        if not self.path.exists():
+            return {}
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_suffix('.lock'), 'w') as lockf:
+            if fcntl:
+                fcntl.flock(lockf, fcntl.LOCK_EX)
+            data = self._read()
+            for day, per_ep in pending.items():
+                mine = data.setdefault(day, {}).setdefault(self.script, {})
+                for ep, units in per_ep.items():
+                    mine[ep] = mine.get(ep, 0) + units
+            tmp = self.path.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+
+    def spent(self, day=None):
+        """Data API units spent on `day` across all scripts, including unflushed calls.
+
+        Analytics `reports.*` calls draw on a separate quota and are not counted.
+        """
+        day = day or quota_day()
+        with self._lock:
+            pending = dict(self._pending.get(day, {}))
+        total = sum(u for ep, u in pending.items() if not ep.startswith('reports.'))
+        for per_ep in self._read().get(day, {}).values():
+            total += sum(u for ep, u in per_ep.items() if not ep.startswith('reports.'))
+        return total
+
+    def remaining(self, day=None):
+        return DAILY_QUOTA - self.spent(day)
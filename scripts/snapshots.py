@@ -0,0 +1,187 @@
+
+import os
+import re
+import shutil
+import pathlib
+import argparse
+import datetime as dt
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+SNAPSHOTS = PROC / 'snapshots'
+METRICS = ['viewCount', 'likeCount', 'commentCount']
+
+# <name>/snapshot_date=YYYY-MM-DD/part-0.parquet  one file per daily run
+# <name>/month=YYYY-MM/part-0.parquet             compacted days, with a snapshot_date column
+DAILY = re.compile(r'snapshot_date=(\d{4}-\d{2}-\d{2})$')
+MONTHLY = re.compile(r'month=(\d{4}-\d{2})$')
+
+def today():
+    return dt.datetime.now(dt.timezone.utc).date()
+
+def _write_atomic(table, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+def _normalize(table):
+    """Counts as nullable int64 everywhere: a day with hidden like/comment counts
+    (None → float64 in pandas) must not make partitions of one month disagree on type."""
+    for c in METRICS:
+        if c in table.column_names:
+            i = table.column_names.index(c)
+            table = table.set_column(i, c, pc.cast(table[c], pa.int64()))
+    return table
+
+def write_snapshot(df, day=None, name='video_stats', root=SNAPSHOTS):
+    """Store one run's observations under snapshot_date=<day>; rerunning a day replaces it."""
+    day = (day or today()).isoformat() if not isinstance(day, str) else day
+    cols = ['videoId'] + [c for c in METRICS if c in df.columns]
+    snap = df[cols].drop_duplicates('videoId', keep='last').copy()
+    for c in cols[1:]:
+        snap[c] = pd.to_numeric(snap[c], errors='coerce').astype('Int64')
+    table = pa.Table.from_pandas(snap, preserve_index=False)
+    path = pathlib.Path(root) / name / f'snapshot_date={day}' / 'part-0.parquet'
+    _write_atomic(table, path)
+    return path
+
+def compact(name='video_stats', root=SNAPSHOTS, keep_month=None):
+    """Merge daily partitions of finished months into one file per month.
+
+    The current month (or `keep_month`, 'YYYY-MM') stays daily so today's run
+    never rewrites a large file. Returns the months compacted.
+    """
+    base = pathlib.Path(root) / name
+    if not base.exists():
+        return []
+    keep_month = keep_month or today().isoformat()[:7]
+    by_month = {}
+    for d in base.iterdir():
+        m = DAILY.match(d.name)
+        if m and m.group(1)[:7] < keep_month:
+            by_month.setdefault(m.group(1)[:7], []).append((m.group(1), d))
+    for month, days in by_month.items():
+        out = base / f'month={month}' / 'part-0.parquet'
+        frames = [_normalize(pq.read_table(out))] if out.exists() else []
+        new_days = {day for day, _ in days}
+        if frames:
+            # a late daily partition for an already compacted month replaces that day
+            old = frames[0]
+            frames[0] = old.filter(pc.invert(pc.is_in(old['snapshot_date'], pa.array(sorted(new_days)))))
+        for day, d in sorted(days):
+            # partitions written before counts were normalised may hold float64
+            t = _normalize(pq.read_table(d / 'part-0.parquet'))
+            frames.append(t.append_column('snapshot_date', pa.array([day] * len(t), pa.string())))
+        merged = pa.concat_tables(frames, promote_options='default').sort_by([('snapshot_date', 'ascending'), ('videoId', 'ascending')])
+        _write_atomic(merged, out)
+        for _, d in days:
+            shutil.rmtree(d)
+    return sorted(by_month)
+
+def load_history(columns=None, since=None, until=None, video_ids=None, name='video_stats', root=SNAPSHOTS):
+    """Long (videoId, snapshot_date, metrics...) table across daily and monthly files.
+
+    Partitions outside [since, until] are skipped by path, and only `columns` are read.
+    """
+    base = pathlib.Path(root) / name
+    cols = ['videoId'] + [c for c in (columns or METRICS) if c != 'videoId']
+    since = since.isoformat() if isinstance(since, dt.date) else since
+    until = until.isoformat() if isinstance(until, dt.date) else until
+    filt = [('videoId', 'in', list(video_ids))] if video_ids is not None else None
+    frames = []
+    for d in sorted(base.iterdir()) if base.exists() else []:
+        daily, monthly = DAILY.match(d.name), MONTHLY.match(d.name)
+        if daily:
+            day = daily.group(1)
+            if (since and day < since) or (until and day > until):
+                continue
+            t = pq.read_table(d / 'part-0.parquet', filters=filt)
+            have = [c for c in cols if c in t.column_names]
+            frames.append(t.select(have).to_pandas().assign(snapshot_date=day))
+        elif monthly:
+            month = monthly.group(1)
+            if (since and month < since[:7]) or (until and month > until[:7]):
+                continue
+            t = pq.read_table(d / 'part-0.parquet', filters=filt)
+            have = [c for c in cols + ['snapshot_date'] if c in t.column_names]
+            f = t.select(have).to_pandas()
+            if since:
+                f = f[f['snapshot_date'] >= since]
+            if until:
+                f = f[f['snapshot_date'] <= until]
+            frames.append(f)
+    if not frames:
+        return pd.DataFrame(columns=['videoId', 'snapshot_date'] + cols[1:])
+    hist = pd.concat(frames, ignore_index=True)
+    hist['snapshot_date'] = pd.to_datetime(hist['snapshot_date'])
+    return hist.sort_values(['videoId', 'snapshot_date'], kind='stable').reset_index(drop=True)
+
+def daily_deltas(hist, metric='viewCount'):
+    """Per-video change between consecutive snapshots, normalised to a per-day rate.
+
+    One sort plus array diffs: rows whose predecessor belongs to another video get NaN.
+    """
+    h = hist.sort_values(['videoId', 'snapshot_date'], kind='stable')
+    vid = h['videoId'].to_numpy()
+    val = h[metric].to_numpy(dtype=float)
+    day = h['snapshot_date'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+    same = np.r_[False, vid[1:] == vid[:-1]]
+    delta = np.where(same, np.r_[np.nan, np.diff(val)], np.nan)
+    gap = np.where(same, np.r_[0, np.diff(day)], 0)
+    return pd.DataFrame({
+        'videoId': vid,
+        'snapshot_date': h['snapshot_date'].to_numpy(),
+        metric: val,
+        'delta': delta,
+        'days': gap,
+        'per_day': np.where(gap > 0, delta / np.where(gap > 0, gap, 1), np.nan),
+    })
+
+def velocity(hist, metric='viewCount', window=7, asof=None):
+    """Per-video growth over the last `window` days vs the `window` days before.
+
+    Values at asof, asof-window and asof-2*window are looked up per video with
+    merge_asof (latest snapshot on or before each date), so gaps in the daily
+    series are tolerated. change = (recent - prior) / prior.
+    """
+    cols = ['videoId', 'recent', 'prior', 'change', metric]
+    if hist.empty:
+        return pd.DataFrame(columns=cols)
+    asof = pd.Timestamp(asof) if asof is not None else hist['snapshot_date'].max()
+    h = hist[['videoId', 'snapshot_date', metric]].dropna().sort_values('snapshot_date', kind='stable')
+    vids = pd.Index(h['videoId'].unique())
+    points = {}
+    for k, at in (('v0', asof), ('v1', asof - pd.Timedelta(days=window)), ('v2', asof - pd.Timedelta(days=2 * window))):
+        q = pd.DataFrame({'videoId': vids, 'snapshot_date': at})
+        r = pd.merge_asof(q.sort_values('snapshot_date'), h, on='snapshot_date', by='videoId', direction='backward')
+        points[k] = r.set_index('videoId')[metric].reindex(vids).to_numpy(dtype=float)
+    recent = points['v0'] - points['v1']
+    prior = points['v1'] - points['v2']
+    change = np.where(prior > 0, (recent - prior) / np.where(prior > 0, prior, 1), np.nan)
+    return pd.DataFrame({'videoId': vids, 'recent': recent, 'prior': prior, 'change': change, metric: points['v0']})
+
+def channel_daily(hist, metric='viewCount'):
+    """Channel-wide gained-per-day series (sum of per-video per-day deltas), oldest first."""
+    d = daily_deltas(hist, metric).dropna(subset=['per_day'])
+    if d.empty:
+        return pd.Series(dtype=float)
+    return d.groupby('snapshot_date')['per_day'].sum().sort_index()
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='Video stats snapshot history.')
+    ap.add_argument('--compact', action='store_true', help='merge finished months into monthly files')
+    ap.add_argument('--top', type=int, default=10, help='print the biggest 7-day movers')
+    args = ap.parse_args()
+    if args.compact:
+        print('compacted months:', compact() or 'none')
+    hist = load_history(['viewCount'], since=today() - dt.timedelta(days=21))
+    v = velocity(hist).dropna(subset=['recent']).sort_values('recent', ascending=False)
+    print(v.head(args.top).to_string(index=False))
@@ -0,0 +1,199 @@
+
+import os
+import time
+import pathlib
+import duckdb
+import pandas as pd
+from dotenv import load_dotenv
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+load_dotenv(ROOT / '.env')
+PROC = ROOT / os.getenv('PROCESSED_DIR', 'data/processed')
+DB_PATH = ROOT / os.getenv('WAREHOUSE_DB', str(PROC / 'warehouse.duckdb'))
+LOCK_TIMEOUT = float(os.getenv('WAREHOUSE_LOCK_TIMEOUT', '120'))
+
+# Typed tables: key columns, declared columns (extra columns in a write are added
+# as new nullable columns), the Parquet file each exports to, and export order.
+TABLES = {
+    'videos': dict(key=['videoId'], export='videos.parquet', order='publishedAt DESC, videoId', columns={
+        'videoId': 'VARCHAR', 'publishedAt': 'TIMESTAMPTZ', 'title': 'VARCHAR', 'description': 'VARCHAR',
+        'durationSec': 'INTEGER'}),
+    'video_stats': dict(key=['videoId'], export='dataapi_video_stats.parquet', columns={
+        'videoId': 'VARCHAR', 'viewCount': 'BIGINT', 'likeCount': 'BIGINT', 'commentCount': 'BIGINT'}),
+    'analytics': dict(key=['videoId'], export='analytics_365d.parquet', columns={
+        'videoId': 'VARCHAR', 'views': 'BIGINT', 'estimatedMinutesWatched': 'DOUBLE',
+        'averageViewDuration': 'DOUBLE', 'averageViewPercentage': 'DOUBLE', 'subscribersGained': 'BIGINT',
+        'likes': 'BIGINT', 'comments': 'BIGINT', 'shares': 'BIGINT', 'impressions': 'BIGINT',
+        'clickThroughRate': 'DOUBLE'}),
+    'comments': dict(key=['commentId'], export='comments.parquet', order='videoId, threadId, publishedAt', columns={
+        'videoId': 'VARCHAR', 'threadId': 'VARCHAR', 'commentId': 'VARCHAR', 'type': 'VARCHAR', 'text': 'VARCHAR',
+        'likeCount': 'BIGINT', 'publishedAt': 'VARCHAR', 'updatedAt': 'VARCHAR', 'totalReplyCount': 'INTEGER'}),
+    'captions': dict(key=['captionId'], export='captions_index.parquet', order='videoId, track', columns={
+        'videoId': 'VARCHAR', 'captionId': 'VARCHAR', 'track': 'INTEGER', 'lang': 'VARCHAR',
+        'lastUpdated': 'VARCHAR', 'sha256': 'VARCHAR', 'size': 'BIGINT', 'fetchedAt': 'VARCHAR',
+        'file': 'VARCHAR', 'changed': 'BOOLEAN'}),
+    'thumbnail_features': dict(key=['videoId'], columns={
+        'videoId': 'VARCHAR', 'sha256': 'VARCHAR', 'sharpness': 'DOUBLE', 'brightness': 'DOUBLE',
+        'contrast': 'DOUBLE', 'text_density': 'DOUBLE'}),
+}
+
+def _q(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def connect(read_only=False, path=None, timeout=LOCK_TIMEOUT):
+    """Open the warehouse, retrying while another process holds the file lock."""
+    path = pathlib.Path(path or DB_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if read_only and not path.exists():
+        read_only = False  # nothing to read yet: create it
+    deadline, delay = time.monotonic() + timeout, 0.1
+    while True:
+        try:
+            con = duckdb.connect(str(path), read_only=read_only)
+            break
+        except duckdb.IOException as e:
+            if 'lock' not in str(e).lower() or time.monotonic() > deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+    if not read_only:
+        for name in TABLES:
+            _create(con, name)
+    return con
+
+def _create(con, name):
+    spec = TABLES[name]
+    cols = ', '.join(f'{_q(c)} {t}' for c, t in spec['columns'].items())
+    key = ', '.join(_q(c) for c in spec['key'])
+    con.execute(f'CREATE TABLE IF NOT EXISTS {_q(name)} ({cols}, PRIMARY KEY ({key}))')
+
+def _table_columns(con, name):
+    return {r[0]: r[1] for r in con.execute(f'DESCRIBE {_q(name)}').fetchall()}
+
+def _source(con, src):
+    if isinstance(src, pd.DataFrame):
+        con.register('_src', src)
+        return '_src', list(src.columns)
+    rel = f"read_parquet('{str(src)}')"
+    return rel, [r[0] for r in con.execute(f'DESCRIBE SELECT * FROM {rel}').fetchall()]
+
+def upsert(name, src, prune=False, replace_groups=None, con=None):
+    """Write rows keyed on the table's primary key, touching only rows that differ.
+
+    `src` is a DataFrame or a Parquet path. Rows identical to what is stored are
+    skipped (EXCEPT against the table), so unchanged data costs no writes.
+    `prune` deletes stored rows whose key is absent from `src` (full snapshots);
+    `replace_groups` deletes stored rows that share a group value (e.g. threadId)
+    with `src` but are no longer in it. Returns {'written': n, 'deleted': n}.
+    """
+    own = con is None
+    con = con or connect()
+    try:
+        spec = TABLES[name]
+        rel, src_cols = _source(con, src)
+        have = _table_columns(con, name)
+        for c in src_cols:
+            if c not in have:
+                # schema evolution: new metrics (e.g. traffic_* columns) become nullable columns
+                typ = con.execute(f'SELECT typeof({_q(c)}) FROM {rel} LIMIT 1').fetchone()
+                con.execute(f'ALTER TABLE {_q(name)} ADD COLUMN {_q(c)} {typ[0] if typ else "VARCHAR"}')
+                have[c] = typ[0] if typ else 'VARCHAR'
+        cols = [c for c in have if c in src_cols]
+        sel = ', '.join(f'CAST({_q(c)} AS {have[c]}) AS {_q(c)}' for c in cols)
+        col_list = ', '.join(_q(c) for c in cols)
+        key = ', '.join(_q(c) for c in spec['key'])
+        con.execute('BEGIN')
+        # one row per key (INSERT OR REPLACE rejects a key twice in the same statement)
+        con.execute(f'CREATE OR REPLACE TEMP TABLE _stage AS SELECT DISTINCT ON ({key}) {sel} FROM {rel}')
+        deleted = 0
+        if prune:
+            deleted += con.execute(f'DELETE FROM {_q(name)} WHERE ({key}) NOT IN (SELECT ({key}) FROM _stage)').fetchone()[0]
+        if replace_groups:
+            g = _q(replace_groups)
+            deleted += con.execute(
+                f'DELETE FROM {_q(name)} WHERE {g} IN (SELECT {g} FROM _stage) '
+                f'AND ({key}) NOT IN (SELECT ({key}) FROM _stage)').fetchone()[0]
+        written = con.execute(
+            f'INSERT OR REPLACE INTO {_q(name)} ({col_list}) '
+            f'SELECT {col_list} FROM _stage EXCEPT SELECT {col_list} FROM {_q(name)}').fetchone()[0]
+        con.execute('DROP TABLE _stage')
+        con.execute('COMMIT')
+        return {'written': written, 'deleted': deleted}
+    except Exception:
+        try:
+            con.execute('ROLLBACK')
+        except Exception:
+            pass
+        raise
+    finally:
+        if isinstance(src, pd.DataFrame):
+            con.unregister('_src')
+        if own:
+            con.close()
+
+def read(name, columns=None, where=None, params=None, con=None):
+    """SELECT columns FROM name WHERE where — filters and projections run inside DuckDB."""
+    own = con is None
+    con = con or connect(read_only=True)
+    try:
+        if not con.execute("SELECT 1 FROM information_schema.tables WHERE table_name = ?", [name]).fetchone():
+            return pd.DataFrame(columns=columns or list(TABLES[name]['columns']))
+        have = _table_columns(con, name)
+        cols = ', '.join(_q(c) for c in columns if c in have) if columns else '*'
+        sql = f'SELECT {cols} FROM {_q(name)}' + (f' WHERE {where}' if where else '')
+        # via Arrow so nullable integers come back as float64/NaN like pd.read_parquet
+        return con.execute(sql, params or []).fetch_arrow_table().to_pandas()
+    finally:
+        if own:
+            con.close()
+
+def count(name, con=None):
+    own = con is None
+    con = con or connect(read_only=True)
+    try:
+        return con.execute(f'SELECT COUNT(*) FROM {_q(name)}').fetchone()[0]
+    except duckdb.CatalogException:
+        return 0
+    finally:
+        if own:
+            con.close()
+
+def export(name, path=None, con=None):
+    """Write a table to its compatibility Parquet file (atomic replace)."""
+    spec = TABLES[name]
+    path = pathlib.Path(path or PROC / spec['export'])
+    own = con is None
+    con = con or connect(read_only=True)
+    try:
+        order = spec.get('order') or ', '.join(_q(c) for c in spec['key'])
+        tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        con.execute(f"COPY (SELECT * FROM {_q(name)} ORDER BY {order}) TO '{tmp}' (FORMAT parquet)")
+        os.replace(tmp, path)
+        return path
+    finally:
+        if own:
+            con.close()
+
+def sync(name, src, export_if_changed=True, **kw):
+    """upsert() then refresh the Parquet export when anything changed (or it is missing)."""
+    con = connect()
+    try:
+        spec = TABLES[name]
+        out = PROC / spec['export'] if spec.get('export') else None
+        if out is not None and out.exists() and count(name, con) == 0 and src is not None:
+            # first run against an existing Parquet-only tree: seed the table from it
+            seed = pd.read_parquet(out)
+            if set(spec['key']).issubset(seed.columns):
+                upsert(name, seed, con=con)
+        res = upsert(name, src, con=con, **kw)
+        if out is not None and (not export_if_changed or res['written'] or res['deleted'] or not out.exists()):
+            export(name, out, con=con)
+        return res
+    finally:
+        con.close()
+
+if __name__ == '__main__':
+    con = connect(read_only=True)
+    for name in TABLES:
+        print(f'{name:<20} {count(name, con):>9,} rows')
+    con.close()
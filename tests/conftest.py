@@ -0,0 +1,128 @@
+import os
+import sys
+import json
+import time
+import pathlib
+import tempfile
+import threading
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+# Modules resolve their data directories at import time: point them at a scratch
+# tree before anything is imported so tests never touch data/ or reports/.
+_SCRATCH = pathlib.Path(tempfile.mkdtemp(prefix='yt-stripper-tests-'))
+for var, sub in [('PROCESSED_DIR', 'processed'), ('RAW_DIR', 'raw'), ('REPORTS_DIR', 'reports'),
+                 ('LLM_CACHE_DIR', 'llm_cache')]:
+    os.environ[var] = str(_SCRATCH / sub)
+    (_SCRATCH / sub).mkdir(parents=True, exist_ok=True)
+
+# scripts and analysis modules import each other by bare name
+for d in ('scripts', 'analysis'):
+    sys.path.insert(0, str(ROOT / d))
+
+BOUNDARY = 'batch_test'
+
+class GoogleMock:
+    """Canned Google API responses: error bodies, HttpErrors and multipart batch replies."""
+
+    @staticmethod
+    def error(code, reason):
+        return {'error': {'code': code, 'message': reason, 'errors': [{'reason': reason, 'message': reason}]}}
+
+    @classmethod
+    def http_error(cls, code, reason):
+        import httplib2
+        from googleapiclient.errors import HttpError
+        return HttpError(httplib2.Response({'status': code}), json.dumps(cls.error(code, reason)).encode())
+
+    @staticmethod
+    def part(request_id, status, body):
+        # batch_execute numbers requests 0..n-1 within each batch
+        text = json.dumps(body)
+        reason = {200: 'OK', 403: 'Forbidden', 404: 'Not Found'}[status]
+        return (f'--{BOUNDARY}\r\nContent-Type: application/http\r\n'
+                f'Content-ID: <response-test + {request_id}>\r\n\r\n'
+                f'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n'
+                f'Content-Length: {len(text)}\r\n\r\n{text}\r\n')
+
+    @staticmethod
+    def batch(*parts):
+        return ({'status': '200', 'content-type': f'multipart/mixed; boundary={BOUNDARY}'},
+                ''.join(parts) + f'--{BOUNDARY}--')
+
+    @staticmethod
+    def youtube(responses):
+        """A Data API service whose HTTP replies are `responses`, in order; returns (service, http)."""
+        from googleapiclient.discovery import build
+        from googleapiclient.http import HttpMockSequence
+        http = HttpMockSequence(responses)
+        return build('youtube', 'v3', http=http, static_discovery=True), http
+
+@pytest.fixture
+def gapi():
+    return GoogleMock
+
+Request = namedtuple('Request', 'method path headers body')
+
+class LocalServer:
+    """ThreadingHTTPServer on 127.0.0.1 that answers with `handler(request) -> (status, headers, body)`.
+
+    Every request is recorded in `seen`; `delay` is slept per request and the
+    peak number of requests in flight is kept in `max_in_flight`.
+    """
+    def __init__(self, handler=None, delay=0.0):
+        self.handler, self.delay = handler, delay
+        self.seen, self.in_flight, self.max_in_flight = [], 0, 0
+        self._lock = threading.Lock()
+        owner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _serve(self):
+                n = int(self.headers.get('Content-Length') or 0)
+                req = Request(self.command, self.path, dict(self.headers), self.rfile.read(n))
+                with owner._lock:
+                    owner.seen.append(req)
+                    owner.in_flight += 1
+                    owner.max_in_flight = max(owner.max_in_flight, owner.in_flight)
+                try:
+                    time.sleep(owner.delay)
+                    status, headers, body = owner.handler(req)
+                finally:
+                    with owner._lock:
+                        owner.in_flight -= 1
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                if status != 304:
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if status != 304:
+                    self.wfile.write(body)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    @property
+    def calls(self):
+        return len(self.seen)
+
+    def url(self, path=''):
+        return f'http://127.0.0.1:{self.httpd.server_port}{path}'
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def local_server():
+    s = LocalServer(handler=lambda req: (404, {}, b''))
+    yield s
+    s.close()
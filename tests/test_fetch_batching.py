@@ -0,0 +1,125 @@
+import json
+
+import pytest
+from googleapiclient.errors import HttpError
+
+import fetch_engine
+from fetch_engine import AdaptiveLimiter, FetchEngine, RATE_REASONS, TokenBucket, batch_execute, error_reason
+from fetch_captions import list_captions
+
+def calls(yt, ids):
+    return [(v, yt.captions().list(part='snippet', videoId=v)) for v in ids]
+
+def test_one_http_request_per_batch(gapi):
+    yt, http = gapi.youtube([
+        gapi.batch(*(gapi.part(i, 200, {'items': [{'id': f'c{i}'}]}) for i in range(2))),
+        gapi.batch(gapi.part(0, 200, {'items': [{'id': 'c2'}]})),
+    ])
+    ok, failed = batch_execute(yt, calls(yt, ['a', 'b', 'c']), 'captions.list', size=2)
+    assert failed == {}
+    assert {k: v['items'][0]['id'] for k, v in ok.items()} == {'a': 'c0', 'b': 'c1', 'c': 'c2'}
+    assert not list(http._iterable)  # exactly two round trips for three calls
+
+def test_item_error_does_not_fail_the_batch(gapi):
+    yt, _ = gapi.youtube([gapi.batch(
+        gapi.part(0, 200, {'items': []}),
+        gapi.part(1, 404, gapi.error(404, 'videoNotFound')),
+        gapi.part(2, 200, {'items': [{'id': 'x'}]}),
+    )])
+    ok, failed = batch_execute(yt, calls(yt, ['a', 'gone', 'c']), 'captions.list')
+    assert set(ok) == {'a', 'c'}
+    assert set(failed) == {'gone'}
+    assert failed['gone'].resp.status == 404
+
+def test_rate_limited_items_are_retried(gapi):
+    yt, http = gapi.youtube([
+        gapi.batch(gapi.part(0, 200, {'items': []}), gapi.part(1, 403, gapi.error(403, 'rateLimitExceeded'))),
+        gapi.batch(gapi.part(0, 200, {'items': [{'id': 'late'}]})),
+    ])
+    ok, failed = batch_execute(yt, calls(yt, ['a', 'b']), 'captions.list', base_delay=0)
+    assert failed == {}
+    assert ok['b']['items'][0]['id'] == 'late'
+    assert not list(http._iterable)
+
+def test_non_retryable_reason_is_not_retried(gapi):
+    yt, http = gapi.youtube([gapi.batch(gapi.part(0, 403, gapi.error(403, 'forbidden')))])
+    ok, failed = batch_execute(yt, calls(yt, ['a']), 'captions.list', base_delay=0)
+    assert ok == {} and set(failed) == {'a'}
+    assert error_reason(failed['a']) == 'forbidden'
+    assert not list(http._iterable)
+
+def test_retries_give_up_after_max_retries(gapi):
+    limited = gapi.batch(gapi.part(0, 403, gapi.error(403, 'quotaExceeded')))
+    yt, http = gapi.youtube([limited, limited])
+    ok, failed = batch_execute(yt, calls(yt, ['a']), 'captions.list', max_retries=1, base_delay=0)
+    assert ok == {}
+    assert error_reason(failed['a']) == 'quotaExceeded'
+    assert not list(http._iterable)
+
+def test_batches_are_charged_to_the_engine_bucket(gapi):
+    yt, _ = gapi.youtube([gapi.batch(*(gapi.part(i, 200, {'items': []}) for i in range(3)))])
+    engine = FetchEngine(lambda: yt, workers=1, bucket=TokenBucket(rate=1e6, capacity=1e6))
+    batch_execute(yt, calls(yt, ['a', 'b', 'c']), 'captions.list', engine)
+    assert engine.bucket.spent == {'captions.list': 150}
+
+def test_list_captions_maps_videos_to_items(gapi):
+    yt, _ = gapi.youtube([gapi.batch(
+        gapi.part(0, 200, {'items': [{'id': 'en', 'snippet': {'language': 'en'}}]}),
+        gapi.part(1, 404, gapi.error(404, 'videoNotFound')),
+    )])
+    assert list_captions(yt, ['a', 'b']) == {'a': [{'id': 'en', 'snippet': {'language': 'en'}}]}
+
+def stats_calls(yt, n):
+    return [(i, yt.videos().list(part='statistics', id=f'v{i}')) for i in range(n)]
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # record the limiter's sleeps instead of taking them
+    out = []
+    monkeypatch.setattr(fetch_engine.time, 'sleep', out.append)
+    return out
+
+def test_limiter_books_one_slot_per_call(gapi, sleeps):
+    yt, _ = gapi.youtube([gapi.batch(*(gapi.part(i, 200, {'items': []}) for i in range(2))),
+                          gapi.batch(gapi.part(0, 200, {'items': []}))])
+    limiter = AdaptiveLimiter(delay=1.0, min_delay=0.01)
+    ok, _ = batch_execute(yt, stats_calls(yt, 3), 'videos.list', size=2, limiter=limiter)
+    assert len(ok) == 3
+    # the first round trip carried two calls, so the second waits two slots, not one
+    assert sleeps and sleeps[0] == pytest.approx(2.0, abs=0.1)
+    assert limiter.delay == pytest.approx(0.64)
+
+def test_rate_limited_item_backs_the_limiter_off(gapi, sleeps):
+    yt, http = gapi.youtube([
+        gapi.batch(gapi.part(0, 200, {'items': []}), gapi.part(1, 403, gapi.error(403, 'rateLimitExceeded')),
+                   gapi.part(2, 200, {'items': []})),
+        gapi.batch(gapi.part(0, 200, {'items': [{'id': 'v1'}]})),
+    ])
+    limiter = AdaptiveLimiter(delay=0.5, min_delay=0.01)
+    ok, failed = batch_execute(yt, stats_calls(yt, 3), 'videos.list', limiter=limiter, retry_reasons=RATE_REASONS)
+    assert failed == {} and ok[1]['items'][0]['id'] == 'v1'
+    assert not list(http._iterable)
+    backoff, slot = sleeps
+    assert 0 <= backoff <= 1.0  # jittered backoff sized for the one call retried
+    assert slot == pytest.approx(1.5, abs=0.1)  # the first round trip booked three slots
+    assert limiter.delay == pytest.approx(0.8)  # doubled on the 403, then eased after the retry
+
+def test_rate_limited_batch_is_retried_as_a_whole(gapi, sleeps):
+    refused = ({'status': '403'}, json.dumps(gapi.error(403, 'rateLimitExceeded')))
+    yt, http = gapi.youtube([refused, gapi.batch(*(gapi.part(i, 200, {'items': []}) for i in range(3)))])
+    limiter = AdaptiveLimiter(delay=0.5, min_delay=0.01)
+    ok, failed = batch_execute(yt, stats_calls(yt, 3), 'videos.list', limiter=limiter, retry_reasons=RATE_REASONS)
+    assert set(ok) == {0, 1, 2} and failed == {}
+    assert not list(http._iterable)
+    assert limiter.delay == pytest.approx(0.8)
+
+def test_refused_batch_gives_up_or_raises(gapi, sleeps):
+    refused = ({'status': '403'}, json.dumps(gapi.error(403, 'rateLimitExceeded')))
+    yt, _ = gapi.youtube([refused, refused])
+    ok, failed = batch_execute(yt, stats_calls(yt, 2), 'videos.list', max_retries=1,
+                               limiter=AdaptiveLimiter(delay=0.01), retry_reasons=RATE_REASONS)
+    assert ok == {} and {error_reason(e) for e in failed.values()} == {'rateLimitExceeded'}
+    forbidden = ({'status': '403'}, json.dumps(gapi.error(403, 'forbidden')))
+    yt, _ = gapi.youtube([forbidden])
+    with pytest.raises(HttpError):
+        batch_execute(yt, stats_calls(yt, 2), 'videos.list', retry_reasons=RATE_REASONS)
@@ -0,0 +1,97 @@
+import json
+import time
+import asyncio
+import socket
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from llm_client import LLMClient
+
+def chat(status=200):
+    """Ollama /api/chat stand-in: answers with the model name and the last prompt."""
+    def handle(req):
+        if req.path != '/api/chat' or status != 200:
+            return (status if status != 200 else 404), {}, b''
+        body = json.loads(req.body)
+        out = json.dumps({'model': body['model'], 'done': True, 'message': {
+            'role': 'assistant', 'content': f"[{body['model']}] {body['messages'][-1]['content']}"}}).encode()
+        return 200, {'Content-Type': 'application/json'}, out
+    return handle
+
+@pytest.fixture
+def ollama(local_server):
+    local_server.handler, local_server.delay = chat(), 0.05
+    return local_server
+
+def client(url, tmp_path, **kw):
+    return LLMClient(provider='ollama', model='tiny', base_url=url, cache_dir=tmp_path, **kw)
+
+def test_complete_and_disk_cache(ollama, tmp_path):
+    assert client(ollama.url(), tmp_path).complete('sys', 'hello') == '[tiny] hello'
+    assert ollama.calls == 1
+    # a fresh client (next run) is served from disk
+    c = client(ollama.url(), tmp_path)
+    assert c.complete('sys', 'hello') == '[tiny] hello'
+    assert ollama.calls == 1 and c.stats['cached'] == 1
+    # the key covers the model and the system prompt
+    assert LLMClient(model='other', base_url=ollama.url(), cache_dir=tmp_path).complete('sys', 'hello') == '[other] hello'
+    client(ollama.url(), tmp_path).complete('another system', 'hello')
+    assert ollama.calls == 3
+
+def test_run_many_is_ordered_and_bounded(ollama, tmp_path):
+    c = client(ollama.url(), tmp_path, concurrency=3)
+    jobs = [('sys', f'job {i}') for i in range(12)]
+    t0 = time.perf_counter()
+    out = c.run_many(jobs)
+    took = time.perf_counter() - t0
+    assert out == [f'[tiny] job {i}' for i in range(12)]
+    assert ollama.max_in_flight <= 3
+    assert took < 12 * ollama.delay  # actually concurrent
+    assert c.run_many(jobs) == out and ollama.calls == 12
+
+def test_run_many_inside_running_loop(ollama, tmp_path):
+    c = client(ollama.url(), tmp_path)
+    async def inner():
+        return c.run_many([('s', 'a'), ('s', 'b')])
+    assert asyncio.run(inner()) == ['[tiny] a', '[tiny] b']
+
+def test_http_error_returns_empty_and_is_not_cached(local_server, tmp_path):
+    local_server.handler = chat(status=500)
+    c = client(local_server.url(), tmp_path)
+    assert c.complete('sys', 'x') == ''
+    assert c.complete('sys', 'x') == ''
+    assert local_server.calls == 2 and c.stats['failed'] == 2
+    assert not list(tmp_path.rglob('*.json'))
+
+def test_dead_server_short_circuits(tmp_path):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    c = client(f'http://127.0.0.1:{port}', tmp_path, timeout=2)
+    assert c.run_many([('s', str(i)) for i in range(10)]) == [''] * 10
+    # the first connection error marks the server down; later jobs never try
+    assert c.stats['called'] < 10
+
+def test_insights_run_narrative_and_critiques_through_the_client(ollama, monkeypatch):
+    import insight_engine
+    monkeypatch.setenv('LLM_PROVIDER', 'ollama')
+    monkeypatch.setenv('OLLAMA_BASE_URL', ollama.url())
+    monkeypatch.setenv('OLLAMA_MODEL', 'tiny')
+    rng = np.random.default_rng(0)
+    n = 40
+    df = pd.DataFrame({
+        'videoId': [f'v{i}' for i in range(n)], 'title': [f'video {i}' for i in range(n)],
+        'publishedAt': pd.date_range('2025-01-01', periods=n, tz='UTC'),
+        'viewCount': rng.integers(100, 10_000, n).astype(float),
+        'clickThroughRate': rng.uniform(1, 10, n), 'averageViewDuration': rng.uniform(30, 300, n),
+        'durationSec': 600, 'description': 'x' * 80,
+    })
+    payload = insight_engine.generate_insights_and_actions(df, {}, llm=True)
+    assert payload['narrative_gpt'].startswith('[tiny]')
+    assert payload['critiques']
+    assert all(c['critique'].startswith('[tiny] Video title:') for c in payload['critiques'])
+    calls = ollama.calls
+    insight_engine.generate_insights_and_actions(df, {}, llm=True)
+    assert ollama.calls == calls  # rerun served from the cache
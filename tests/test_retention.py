@@ -0,0 +1,115 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fetch_engine import FetchEngine, TokenBucket
+from fetch_retention import COLUMNS, fetch_retention
+from retention_beats import align, interp_curves, steepest
+
+X = np.round(np.arange(1, 101) / 100, 2)
+
+def curve(vid):
+    # a different, strictly decreasing curve per video
+    k = 0.3 + 0.1 * (sum(map(ord, vid)) % 5)
+    return 1.1 - k * X ** 0.8
+
+class FakeAnalytics:
+    """youtubeAnalytics v2 stand-in: reports().query(...).execute() for retention reports."""
+    def __init__(self, gapi, missing=(), throttle_once=()):
+        self.gapi, self.missing, self.throttle = gapi, set(missing), set(throttle_once)
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def reports(self):
+        return self
+
+    def query(self, **kw):
+        with self._lock:
+            self.queries.append(kw)
+        vid = kw['filters'].split('==')[1]
+        return _Request(self, vid)
+
+class _Request:
+    def __init__(self, api, vid):
+        self.api, self.vid = api, vid
+
+    def execute(self):
+        with self.api._lock:
+            if self.vid in self.api.throttle:
+                self.api.throttle.discard(self.vid)
+                raise self.api.gapi.http_error(403, 'rateLimitExceeded')
+        if self.vid in self.api.missing:
+            return {'columnHeaders': [{'name': 'elapsedVideoTimeRatio'}, {'name': 'audienceWatchRatio'},
+                                      {'name': 'relativeRetentionPerformance'}]}
+        return {'columnHeaders': [{'name': 'elapsedVideoTimeRatio'}, {'name': 'audienceWatchRatio'},
+                                  {'name': 'relativeRetentionPerformance'}],
+                'rows': [[float(x), float(y), 0.5] for x, y in zip(X, curve(self.vid))]}
+
+@pytest.fixture
+def analytics(gapi):
+    return lambda **kw: FakeAnalytics(gapi, **kw)
+
+def test_fetch_retention_shape_and_query(analytics):
+    api = analytics()
+    df = fetch_retention(api, 'abc', '2025-01-01', '2025-12-31')
+    assert list(df.columns) == COLUMNS
+    assert len(df) == 100 and (df['videoId'] == 'abc').all()
+    q = api.queries[0]
+    assert q['dimensions'] == 'elapsedVideoTimeRatio' and q['filters'] == 'video==abc'
+    assert 'audienceWatchRatio' in q['metrics']
+
+def test_concurrent_quota_aware_fetch_with_retry(analytics):
+    api = analytics(missing={'v3'}, throttle_once={'v1', 'v5'})
+    engine = FetchEngine(lambda: api, workers=4, base_delay=0,
+                         bucket=TokenBucket(rate=1e6, capacity=1e6))
+    vids = [f'v{i}' for i in range(8)]
+    res = engine.map(lambda v: fetch_retention(engine.client(), v, 'a', 'b', engine), vids)
+    assert set(res) == set(vids)
+    assert res['v3'].empty and len(res['v1']) == 100
+    # eight queries plus one retry each for the two throttled videos, all charged
+    assert engine.bucket.spent == {'reports.query': 10}
+
+def test_interp_matches_per_video_np_interp():
+    rng = np.random.default_rng(0)
+    vids = [f'v{i}' for i in range(20)]
+    cv, cx, cy = [], [], []
+    for v in vids:
+        cv += [v] * 100
+        cx += list(X)
+        cy += list(curve(v) + rng.normal(0, 0.01, 100))
+    cv, cx, cy = np.array(cv), np.array(cx), np.array(cy)
+    perm = rng.permutation(len(cv))  # curve rows need not arrive sorted
+    qv = rng.choice(vids + ['no_curve'], 500)
+    qx = rng.uniform(-0.1, 1.1, 500)
+    got = interp_curves(cv[perm], cx[perm], cy[perm], qv, qx)
+    for v, x, g in zip(qv, qx, got):
+        if v == 'no_curve':
+            assert np.isnan(g)
+        else:
+            m = cv == v
+            assert np.isclose(g, np.interp(np.clip(x, 0, 1), cx[m], cy[m]))
+
+def test_align_and_rank_dropoffs(analytics):
+    api = analytics()
+    retention = pd.concat([fetch_retention(api, v, 'a', 'b') for v in ['a', 'b']], ignore_index=True)
+    seg = pd.DataFrame({
+        'videoId': ['a'] * 4 + ['b'] * 2 + ['c'],
+        'seg_idx': [0, 1, 2, 3, 0, 1, 0],
+        'start_s': [0.0, 25.0, 50.0, 75.0, 0.0, 30.0, 0.0],
+        'end_s': [25.0, 50.0, 75.0, 100.0, 30.0, 60.0, 10.0],
+        'text': ['hook', 'setup', 'middle', 'outro', 'intro', 'end', 'no retention'],
+    })
+    beats = align(retention, seg)
+    assert set(beats['videoId']) == {'a', 'b'}  # c has no curve
+    a = beats[beats['videoId'] == 'a'].set_index('seg_idx')
+    # duration falls back to the last caption end (100 s), so seconds map straight to ratios
+    expect = np.interp(0.25, X, curve('a')) - np.interp(0.5, X, curve('a'))
+    assert np.isclose(a.loc[1, 'retention_drop'], expect)
+    assert (beats['retention_drop'] > 0).all()
+    top = steepest(beats, seg, n=2)
+    assert len(top) == 2
+    assert top['retention_drop'].is_monotonic_decreasing
+    assert top['url'].str.match(r'https://youtu\.be/\w+\?t=\d+$').all()
+    assert top['text'].notna().all()
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from thumbnail_scores import download, download_all, make_session
+
+@pytest.fixture
+def server(local_server):
+    """Stand-in for i.ytimg.com: `files` maps path → (status, body, etag, last_modified)."""
+    local_server.files = {}
+
+    def handle(req):
+        status, body, etag, modified = local_server.files.get(req.path, (404, b'', None, None))
+        fresh = (etag and req.headers.get('If-None-Match') == etag) or \
+                (not etag and modified and req.headers.get('If-Modified-Since') == modified)
+        if status == 200 and fresh:
+            return 304, {}, b''
+        headers = {k: v for k, v in [('ETag', etag), ('Last-Modified', modified)] if v}
+        return status, headers, body
+
+    local_server.handler = handle
+    return local_server
+
+def test_conditional_get_roundtrip(server, tmp_path):
+    server.files['/a.jpg'] = (200, b'image-v1', '"v1"', None)
+    rows = [('a', server.url('/a.jpg'))]
+    assert download_all(rows, dest=tmp_path) == {'a': 'new'}
+    assert (tmp_path / 'a.jpg').read_bytes() == b'image-v1'
+
+    assert download_all(rows, dest=tmp_path) == {'a': 'unchanged'}
+    assert server.seen[-1].headers.get('If-None-Match') == '"v1"'
+
+    # thumbnail swapped on YouTube: new ETag, new bytes
+    server.files['/a.jpg'] = (200, b'image-v2', '"v2"', None)
+    assert download_all(rows, dest=tmp_path) == {'a': 'updated'}
+    assert (tmp_path / 'a.jpg').read_bytes() == b'image-v2'
+    assert json.loads((tmp_path / '_validators.json').read_text())['a']['etag'] == '"v2"'
+
+def test_last_modified_validator(server, tmp_path):
+    stamp = 'Wed, 01 Oct 2025 10:00:00 GMT'
+    server.files['/b.jpg'] = (200, b'img', None, stamp)
+    path = tmp_path / 'b.jpg'
+    status, v = download(server.url('/b.jpg'), path)
+    assert status == 'new' and v['last_modified'] == stamp
+    status, _ = download(server.url('/b.jpg'), path, v)
+    assert status == 'unchanged'
+    assert server.seen[-1].headers.get('If-Modified-Since') == stamp
+
+def test_validators_ignored_when_file_or_url_changed(server, tmp_path):
+    server.files['/c.jpg'] = (200, b'img', '"c"', None)
+    path = tmp_path / 'c.jpg'
+    # validators exist but the file is gone: must refetch unconditionally
+    status, _ = download(server.url('/c.jpg'), path, {'url': server.url('/c.jpg'), 'etag': '"c"'})
+    assert status == 'new' and 'If-None-Match' not in server.seen[-1].headers
+    status, _ = download(server.url('/c.jpg'), path, {'url': 'http://elsewhere/c.jpg', 'etag': '"c"'})
+    assert status == 'updated' and 'If-None-Match' not in server.seen[-1].headers
+
+def test_error_keeps_existing_file(server, tmp_path):
+    server.files['/d.jpg'] = (200, b'good', '"d1"', None)
+    rows = [('d', server.url('/d.jpg'))]
+    download_all(rows, dest=tmp_path)
+    server.files['/d.jpg'] = (500, b'oops', None, None)
+    assert download_all(rows, dest=tmp_path) == {'d': 'error'}
+    assert (tmp_path / 'd.jpg').read_bytes() == b'good'
+    assert json.loads((tmp_path / '_validators.json').read_text())['d']['etag'] == '"d1"'
+    assert not list(tmp_path.glob('.*.tmp'))
+
+def test_concurrent_pool(server, tmp_path):
+    for i in range(40):
+        server.files[f'/{i}.jpg'] = (200, f'img{i}'.encode(), f'"{i}"', None)
+    rows = [(f'v{i}', server.url(f'/{i}.jpg')) for i in range(40)] + [('none', None)]
+    res = download_all(rows, dest=tmp_path, session=make_session(8), concurrency=8)
+    assert res == {f'v{i}': 'new' for i in range(40)}
+    assert all((tmp_path / f'v{i}.jpg').read_bytes() == f'img{i}'.encode() for i in range(40))